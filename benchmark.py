@@ -0,0 +1,1119 @@
+"""
+Micro benchmarks for the Recipe Transformer. The benchmarks run offline against built in sample data (and a
+lexicon snapshot frozen from the fallback lexicon, unless --lexicon names another), so they measure our own code
+and not the network.
+
+	>> python benchmark.py tagging
+	>> python benchmark.py stages scaling --pages saved_pages/ --json results.json
+
+stages times every step from a saved page to a transformed, serialized recipe; scaling does the same for recipes
+of growing size to expose paths that grow faster than linearly.
+"""
+import argparse
+import atexit
+import copy
+import ctypes
+import gc
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+
+try:
+	from SocketServer import ThreadingMixIn
+except ImportError:
+	from socketserver import ThreadingMixIn
+
+import requests
+import web
+from bs4 import BeautifulSoup, SoupStrainer
+
+import main
+import fetch
+import gui
+import lexicon
+import prefork
+import serialize
+import tracing
+from tests.test_performance import HEAVY_MODULES, IMPORT_BUDGET, LocalServer, StubServer, startup_seconds
+from tests.test_scanner import GOLDEN_INGREDIENTS, find_fields, scan_fields
+
+
+# ingredient lines as they appear on AllRecipes.com -- used to build synthetic style corpora
+SAMPLE_INGREDIENTS = [
+	'1 teaspoon salt',
+	'1/2 teaspoon ground black pepper',
+	'2 tablespoons olive oil',
+	'1 onion, chopped',
+	'3 cloves garlic, minced',
+	'1 pound skinless, boneless chicken breast halves - cut into cubes',
+	'1 (14.5 ounce) can diced tomatoes',
+	'1 cup chicken broth',
+	'2 cups uncooked white rice',
+	'1 tablespoon chili powder',
+	'1 teaspoon ground cumin',
+	'1/4 cup chopped fresh cilantro',
+	'1 lime, juiced',
+	'1 (8 ounce) package shredded Mexican cheese blend',
+	'8 (6 inch) corn tortillas',
+	'1 green bell pepper, diced',
+	'1 cup sour cream',
+	'2 tablespoons butter',
+	'1 cup heavy cream',
+	'1/2 cup grated Parmesan cheese',
+	'1 pound spaghetti',
+	'1 (16 ounce) package sliced fresh mushrooms',
+	'2 tablespoons soy sauce',
+	'1 tablespoon fish sauce',
+	'1 tablespoon brown sugar',
+	'1 (14 ounce) can coconut milk',
+	'2 tablespoons red curry paste',
+	'1 pound large shrimp, peeled and deveined',
+	'1 cup fresh basil leaves',
+	'1 tablespoon minced fresh ginger root',
+	'3 eggs, beaten',
+	'1 1/2 cups all-purpose flour',
+	'1 cup milk',
+	'1 pound ground beef',
+	'1 (15 ounce) can black beans, rinsed and drained',
+	'1 cup salsa',
+	'2 carrots, peeled and sliced',
+	'1 head broccoli, cut into florets',
+	'1/4 teaspoon cayenne pepper',
+	'salt and pepper to taste'
+]
+
+
+# instruction steps as they appear on AllRecipes.com
+SAMPLE_INSTRUCTIONS = [
+	'Preheat oven to 350 degrees F (175 degrees C). Grease a 9x13-inch baking dish.',
+	'Heat olive oil in a large skillet over medium heat. Cook and stir onion and garlic until tender, about 5 minutes.',
+	'Stir chicken into the skillet and cook until no longer pink in the center, 5 to 7 minutes.',
+	'Bring a large pot of lightly salted water to a boil. Cook spaghetti in the boiling water until tender yet firm to the bite, about 12 minutes; drain.',
+	'Whisk milk, eggs, and flour together in a bowl until smooth.',
+	'Mix diced tomatoes, chicken broth, chili powder, and cumin into the onion mixture; simmer for 10 minutes.',
+	'Pour the mixture into the prepared baking dish and sprinkle with shredded Mexican cheese blend.',
+	'Bake in the preheated oven until cheese is melted and bubbly, about 20 minutes.',
+	'Stir in sour cream and cilantro; season with salt and ground black pepper to taste.',
+	'Melt butter in a saucepan over medium heat; stir in heavy cream and Parmesan cheese until smooth.',
+	'Cook shrimp in the coconut milk and red curry paste until pink, about 3 minutes.',
+	'Serve over rice with lime wedges.'
+]
+
+
+def sample_recipe(n_ingredients=12, n_steps=8, seed=0):
+	"""
+	returns a parse_url style dictionary for a synthetic recipe with n_ingredients ingredient lines and
+	n_steps instructions, drawn (with repetition once the samples run out) from the sample lines
+	"""
+	rng = random.Random(seed)
+	return {
+		'name': 'Sample Recipe',
+		'url': 'https://www.allrecipes.com/recipe/{}/sample-recipe/'.format(seed),
+		'preptime': '15',
+		'cooktime': '60',
+		'totaltime': '75',		# over an hour, so extraction has to read 1 h 15 m and PT1H15M alike
+		'ingredients': [rng.choice(SAMPLE_INGREDIENTS) for _ in range(n_ingredients)],
+		'instructions': [rng.choice(SAMPLE_INSTRUCTIONS) for _ in range(n_steps)],
+		'calories': '350',
+		'carbs': '40.2 g',
+		'fat': '12 g',
+		'protien': '20 g',
+		'cholesterol': '80 mg',
+		'sodium': '600 mg'
+	}
+
+
+def saved_page(recipe_attrs, json_ld=False, filler=1500):
+	"""
+	renders a parse_url dictionary as a saved AllRecipes.com page -- the itemprop microdata and recipe spans,
+	the same recipe as JSON-LD if json_ld is set, and filler (navigation, scripts, reviews) roughly the size of
+	a real page
+	"""
+	escape = lambda text: text.replace('&', '&amp;').replace('<', '&lt;')
+	head = ['<!DOCTYPE html><html><head><title>{}</title>'.format(escape(recipe_attrs['name']))]
+	head += ['<script>var ad_slot_{0} = {{"id": {0}, "sizes": [[300, 250], [728, 90]]}};</script>'.format(i) for i in range(filler // 4)]
+	if json_ld:
+		recipe = {
+			'@context': 'http://schema.org', '@type': 'Recipe', 'name': recipe_attrs['name'],
+			'prepTime': iso_duration(recipe_attrs['preptime']), 'cookTime': iso_duration(recipe_attrs['cooktime']),
+			'totalTime': iso_duration(recipe_attrs['totaltime']),
+			'recipeIngredient': recipe_attrs['ingredients'],
+			'recipeInstructions': [{'@type': 'HowToStep', 'text': step} for step in recipe_attrs['instructions']],
+			'nutrition': {'@type': 'NutritionInformation', 'calories': recipe_attrs['calories'] + ' calories',
+						  'carbohydrateContent': recipe_attrs['carbs'], 'fatContent': recipe_attrs['fat'],
+						  'proteinContent': recipe_attrs['protien'], 'cholesterolContent': recipe_attrs['cholesterol'],
+						  'sodiumContent': recipe_attrs['sodium']}
+		}
+		head.append('<script type="application/ld+json">{}</script>'.format(json.dumps([{'@type': 'WebSite'}, recipe])))
+	head.append('</head>')
+
+	body = ['<body><nav><ul>']
+	body += ['<li class="nav-item"><a href="/recipes/{0}/">Category {0}</a></li>'.format(i) for i in range(filler)]
+	body.append('</ul></nav><article><h1 itemprop="name">{}</h1>'.format(escape(recipe_attrs['name'])))
+	body += ['<time itemprop="{}" datetime="{}">{}</time>'.format(prop, iso_duration(recipe_attrs[field]), time_text(recipe_attrs[field]))
+			 for prop, field in [('prepTime', 'preptime'), ('cookTime', 'cooktime'), ('totalTime', 'totaltime')]]
+	body.append('<ul class="checklist">')
+	body += ['<li><label><span class="recipe-ingred_txt added">{}</span></label></li>'.format(escape(line)) for line in recipe_attrs['ingredients']]
+	body.append('</ul><ol class="recipe-directions__list">')
+	body += ['<li class="step"><span class="recipe-directions__list--item">{}</span></li>'.format(escape(line)) for line in recipe_attrs['instructions']]
+	body.append('</ol><div class="nutrition-summary-facts"><span itemprop="calories">{} calories</span>'.format(recipe_attrs['calories']))
+	body += ['<span itemprop="{}">{}</span>'.format(prop, recipe_attrs[field]) for prop, field in
+			 [('carbohydrateContent', 'carbs'), ('fatContent', 'fat'), ('proteinContent', 'protien'), ('cholesterolContent', 'cholesterol'), ('sodiumContent', 'sodium')]]
+	body.append('</div></article><section class="reviews">')
+	body += ['<div class="review" itemprop="review"><div class="review-header"><span itemprop="author">Cook {0}</span>'
+			 '<div class="rating-stars" data-ratingstars="4.{0}"><img src="/star.png"/><img src="/star.png"/></div></div>'
+			 '<p class="review-text">Made this for dinner {0} times. The family loved it, next time I will add more garlic.</p></div>'.format(i) for i in range(filler // 10)]
+	body.append('</section><footer>')
+	body += ['<div class="ad-unit"><div class="ad-inner" id="ad-{0}"><a href="/ad/{0}"><img src="/ad/{0}.png"/></a></div></div>'.format(i) for i in range(filler // 2)]
+	body.append('</footer></body></html>')
+	return ''.join(head + body)
+
+
+def iso_duration(minutes):
+	"""
+	minutes as an ISO 8601 duration, the way AllRecipes.com writes them (i.e. PT1H15M)
+	"""
+	hours, minutes = divmod(int(minutes), 60)
+	return 'PT' + ('{}H'.format(hours) if hours else '') + ('{}M'.format(minutes) if minutes or not hours else '')
+
+
+def time_text(minutes):
+	"""
+	minutes as the text of a time tag on AllRecipes.com (i.e. 1 h 15 m)
+	"""
+	hours, minutes = divmod(int(minutes), 60)
+	return ' '.join((['{} h'.format(hours)] if hours else []) + (['{} m'.format(minutes)] if minutes or not hours else []))
+
+
+def saved_pages(path):
+	"""
+	reads every saved .html page in a directory
+	"""
+	pages = []
+	for filename in sorted(os.listdir(path)):
+		if filename.lower().endswith(('.html', '.htm')):
+			with open(os.path.join(path, filename), 'rb') as f:
+				pages.append(f.read())
+	return pages
+
+
+libc = ctypes.CDLL(None)
+
+
+def memory_status(field):
+	"""
+	reads a memory field (i.e. VmRSS, VmHWM) of this process from /proc, in bytes
+	"""
+	with open('/proc/self/status') as f:
+		for line in f:
+			if line.startswith(field + ':'):
+				return int(line.split()[1]) * 1024
+
+
+def peak_memory(func):
+	"""
+	returns how far the peak memory (resident set size) of the process rises above its current size while func
+	runs, in bytes. func runs in a forked child whose free memory is released and whose peak is reset first
+	(linux and glibc only), so every measurement starts from the same state.
+	"""
+	read_end, write_end = os.pipe()
+	pid = os.fork()
+	if pid == 0:
+		os.close(read_end)
+		gc.collect()
+		libc.malloc_trim(0)		# hand the memory freed by earlier runs back, so func cannot reuse it unseen
+		with open('/proc/self/clear_refs', 'w') as f:
+			f.write('5')			# resets VmHWM to the current resident set size
+		before = memory_status('VmRSS')
+		func()
+		os.write(write_end, str(memory_status('VmHWM') - before).encode())
+		os._exit(0)
+
+	os.close(write_end)
+	growth = os.read(read_end, 64)
+	os.close(read_end)
+	os.waitpid(pid, 0)
+	return int(growth)
+
+
+def deep_size(obj, seen=None):
+	"""
+	approximate number of bytes reachable from obj (each object is only counted once)
+	"""
+	if seen is None: seen = set()
+	if id(obj) in seen: return 0
+	seen.add(id(obj))
+
+	size = sys.getsizeof(obj)
+	if isinstance(obj, dict):
+		size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+	elif isinstance(obj, (list, tuple, set, frozenset)):
+		size += sum(deep_size(item, seen) for item in obj)
+	if hasattr(obj, '__dict__'):
+		size += deep_size(obj.__dict__, seen)
+	for slot in getattr(type(obj), '__slots__', ()):
+		if hasattr(obj, slot):
+			size += deep_size(getattr(obj, slot), seen)
+	return size
+
+
+def style_corpus(n_recipes=20, seed=0):
+	"""
+	builds a deterministic corpus of n_recipes ingredient lists (8 to 14 lines each) from SAMPLE_INGREDIENTS,
+	roughly the size of the corpus to_style scrapes from one search results page
+	"""
+	rng = random.Random(seed)
+	return [rng.sample(SAMPLE_INGREDIENTS, rng.randint(8, 14)) for _ in range(n_recipes)]
+
+
+def best_of(func, repeat=3):
+	"""
+	runs func repeat times and returns the fastest wall clock time in seconds
+	"""
+	times = []
+	for _ in range(repeat):
+		ts = time.time()
+		func()
+		times.append(time.time() - ts)
+	return min(times)
+
+
+def bench_tagging(repeat=3):
+	"""
+	compares tagging a 20 recipe style corpus line by line (one pos_tag call per Ingredient) against tagging
+	every line in a single batched pos_tag_sents call, and against parse_ingredients -- which also tags a
+	repeated line only once and copies lines it parsed before from the ingredient cache -- with the cache
+	cleared before every run (cold) and kept (warm)
+	"""
+	lines = [line for recipe in style_corpus() for line in recipe]
+
+	def batched():
+		tagged = main.pos_tag_sents([main.word_tokenize(line) for line in lines])
+		return [main.Ingredient(line, description_tagged) for line, description_tagged in zip(lines, tagged)]
+
+	def cold_cache():
+		main.ingredient_cache.clear()
+		return main.parse_ingredients(lines)
+
+	times = OrderedDict([
+		('one by one', best_of(lambda: [main.Ingredient(line) for line in lines], repeat)),
+		('batched', best_of(batched, repeat)),
+		('cold cache', best_of(cold_cache, repeat)),
+		('warm cache', best_of(lambda: main.parse_ingredients(lines), repeat))
+	])
+
+	print ('tagging {} ingredient lines ({} distinct) from a 20 recipe corpus'.format(len(lines), len(set(lines))))
+	for name, seconds in times.items():
+		print ('  {:<11} {:8.3f} s  ({:.1f}x)'.format(name, seconds, times['one by one'] / seconds))
+	results = {'lines': len(lines), 'distinct': len(set(lines))}
+	results.update((name.replace(' ', '_'), seconds) for name, seconds in times.items())
+	return results
+
+
+def bench_scanner(repeat=3):
+	"""
+	compares how many (already tagged) lines of the golden corpus per second the single pass Ingredient.scan
+	and the four find_ methods it replaced can extract the fields of -- tests/test_scanner.py checks they agree
+	"""
+	lines = [line for line, _ in GOLDEN_INGREDIENTS] * 10
+	tagged = main.pos_tag_sents([main.word_tokenize(line) for line in lines])
+
+	legacy = best_of(lambda: [find_fields(t, line) for t, line in zip(tagged, lines)], repeat)
+	scanner = best_of(lambda: [scan_fields(t, line) for t, line in zip(tagged, lines)], repeat)
+
+	print ('extracting ingredient fields from {} tagged lines'.format(len(lines)))
+	print ('  find_ methods  {:10.0f} lines/s'.format(len(lines) / legacy))
+	print ('  scanner        {:10.0f} lines/s'.format(len(lines) / scanner))
+	return {'lines': len(lines), 'find_lines_per_sec': len(lines) / legacy, 'scan_lines_per_sec': len(lines) / scanner}
+
+
+def bench_snapshot(repeat=3, recipes=20):
+	"""
+	compares the memory and construction time of keeping the original recipe as a deep copy (the old
+	behaviour) against the structurally shared RecipeSnapshot
+	"""
+	attrs = [sample_recipe(seed=seed) for seed in range(recipes)]
+	main.parse_ingredients([line for recipe in attrs for line in recipe['ingredients']])		# warm the ingredient cache
+
+	def build_with_deepcopy():
+		built = []
+		for recipe_attrs in attrs:
+			recipe = main.Recipe(**copy.deepcopy(recipe_attrs))
+			del recipe.original_recipe
+			recipe.original_recipe = copy.deepcopy(recipe)
+			built.append(recipe)
+		return built
+
+	def build_with_snapshot():
+		return [main.Recipe(**copy.deepcopy(recipe_attrs)) for recipe_attrs in attrs]
+
+	deepcopied = sum(deep_size(recipe) for recipe in build_with_deepcopy()) / float(recipes)
+	shared = sum(deep_size(recipe) for recipe in build_with_snapshot()) / float(recipes)
+	deepcopy_time = best_of(build_with_deepcopy, repeat)
+	snapshot_time = best_of(build_with_snapshot, repeat)
+
+	print ('keeping the original recipe for {} recipes'.format(recipes))
+	print ('  deepcopy    {:8.0f} bytes/recipe  {:8.3f} s'.format(deepcopied, deepcopy_time))
+	print ('  snapshot    {:8.0f} bytes/recipe  {:8.3f} s'.format(shared, snapshot_time))
+	print ('  saved       {:8.0f} bytes/recipe ({:.0%})'.format(deepcopied - shared, 1 - shared / deepcopied))
+	return {'recipes': recipes, 'deepcopy_bytes': deepcopied, 'snapshot_bytes': shared,
+			'deepcopy_time': deepcopy_time, 'snapshot_time': snapshot_time}
+
+
+class Unslotted(object):
+	"""
+	an Ingredient or Instruction laid out the old way (see unslotted)
+	"""
+
+
+def unslotted(obj, copies):
+	"""
+	returns a copy of the Ingredient or Instruction laid out like they were before they had __slots__ and shared
+	strings -- its fields in a per instance __dict__ and, for an Instruction, its words as a list next to the copy
+	derive() kept of them. Strings are copied once per copies dictionary: every Instruction tokenized its text
+	on its own, while ingredients parsed from the same line shared the strings of the cached Ingredient.
+	"""
+	def fresh(value):
+		if isinstance(value, basestring):
+			if value not in copies:
+				copies[value] = value[:1] + value[1:] if len(value) > 1 else value		# single characters are shared anyway
+			return copies[value]
+		if isinstance(value, (list, tuple)):
+			return type(value)(fresh(item) for item in value)
+		return value
+
+	if isinstance(obj, main.Instruction):
+		words, tools, methods, time = obj.derive()
+		fields = {'instruction': obj.instruction, 'instruction_words': fresh(list(words)),
+				  'ingredients': fresh(obj.ingredients)}
+		fields['derived'] = (list(fields['instruction_words']), fresh(tools), fresh(methods), time)
+	else:
+		fields = dict((field, fresh(getattr(obj, field))) for field in main.Ingredient.__slots__)
+
+	# filled the way copy.copy filled the copies the caches handed out -- parsing an object afresh grew a larger dict
+	old = Unslotted()
+	old.__dict__.update(fields)
+	return old
+
+
+def bench_memory(repeat=3, recipes=200):
+	"""
+	compares the bytes per Ingredient and per Instruction of a corpus of parsed recipes laid out the old way (see
+	unslotted) against the __slots__ classes with interned words, names and type codes. Strings shared between
+	objects are counted once.
+	"""
+	built = [main.Recipe(**sample_recipe(seed=seed)) for seed in range(recipes)]
+	ingredients = [ingredient for recipe in built for ingredient in recipe.ingredients]
+	instructions = [instruction for recipe in built for instruction in recipe.instructions]
+
+	def bytes_per_object(objects):
+		seen = set()
+		return sum(deep_size(obj, seen) for obj in objects) / float(len(objects))
+
+	line_copies = {}
+	old_ingredients = [unslotted(ingredient, line_copies.setdefault(repr(main.Ingredient.to_dict(ingredient)), {})) for ingredient in ingredients]
+	old_instructions = [unslotted(instruction, {}) for instruction in instructions]
+	results = OrderedDict([('recipes', recipes), ('ingredients', len(ingredients)), ('instructions', len(instructions))])
+	for name, old, new in [('ingredient', old_ingredients, ingredients), ('instruction', old_instructions, instructions)]:
+		results[name] = {'dict_bytes': bytes_per_object(old), 'slots_bytes': bytes_per_object(new)}
+
+	print ('{} recipes ({} ingredients, {} instructions)'.format(recipes, len(ingredients), len(instructions)))
+	for name in ['ingredient', 'instruction']:
+		before, after = results[name]['dict_bytes'], results[name]['slots_bytes']
+		print ('  {:<12} {:8.0f} -> {:6.0f} bytes each ({:.0%} saved)'.format(name, before, after, 1 - after / before))
+	return results
+
+
+class AppServer(LocalServer, ThreadingMixIn, WSGIServer):
+	"""
+	Local threaded WSGI server for the web app
+	"""
+	def __init__(self, app):
+		WSGIServer.__init__(self, ('127.0.0.1', 0), QuietHandler)
+		self.set_app(app.wsgifunc())
+
+
+class QuietHandler(WSGIRequestHandler):
+	def log_message(self, *args):
+		pass
+
+
+def percentile(values, p):
+	"""
+	returns the p-th percentile (0 to 100) of values, by the nearest rank
+	"""
+	values = sorted(values)
+	return values[max(0, min(len(values) - 1, int(round(p / 100.0 * len(values) + 0.5)) - 1))]
+
+
+def bench_service(repeat=3, requests_total=100, concurrency=4):
+	"""
+	load tests the web app with concurrent form submissions for a recipe served by a local stub server, and
+	reports the p50 and p99 latency of a warm app (the lexicon and tagger loaded once, at startup) against
+	a cold one that loads them on every request (the old behaviour of main_gui)
+	"""
+	with StubServer(body=saved_page(sample_recipe(), json_ld=True), latency=0) as stub:
+		form = {'url': stub.url('/recipe/1/sample-recipe/'), 'transformation': 'to_vegan', 'parameter (optional)': ''}
+		app = gui.RecipeApp(gui.urls, vars(gui))
+		shared_fetcher, fetch.fetcher = fetch.fetcher, fetch.Fetcher()		# uncached, closed afterwards
+		warm_main_gui = gui.main_gui
+
+		def cold_main_gui(*args):
+			main.build_dynamic_lists(snapshot_path)
+			main.tagger = None
+			return warm_main_gui(*args)
+
+		with AppServer(app) as server:
+			main.ready.clear()		# use_lexicon warmed up already -- time doing it again
+			start = time.time()
+			app.start_warm_up(snapshot_path, reload=True)
+			while requests.get(server.url('/ready')).status_code != 200:
+				time.sleep(0.01)
+			ready = time.time() - start
+
+			def submit(n):
+				ts = time.time()
+				response = requests.post(server.url('/'), data=form)
+				if response.status_code != 200:
+					raise AssertionError('request failed with {}: {}'.format(response.status_code, response.text[:200]))
+				return time.time() - ts
+
+			pool = ThreadPool(concurrency)
+			latencies = {}
+			try:
+				for name, main_gui in [('cold', cold_main_gui), ('warm', warm_main_gui)]:
+					gui.main_gui = main_gui
+					latencies[name] = pool.map(submit, range(requests_total))
+			finally:
+				gui.main_gui = warm_main_gui
+				pool.close()
+				pool.join()
+				fetch.fetcher.close()
+				fetch.fetcher = shared_fetcher
+
+	print ('{} form submissions, {} at a time (ready after {:.2f} s)'.format(requests_total, concurrency, ready))
+	results = {'ready': ready}
+	for name in ['cold', 'warm']:
+		p50, p99 = percentile(latencies[name], 50), percentile(latencies[name], 99)
+		print ('  {}  p50 {:8.1f} ms  p99 {:8.1f} ms'.format(name, p50 * 1000, p99 * 1000))
+		results[name] = {'p50': p50, 'p99': p99}
+	return results
+
+
+def serve_in_child(serve):
+	"""
+	runs serve() in a forked child process, with its output silenced, and returns the pid of the child
+	"""
+	pid = os.fork()
+	if pid: return pid
+	code = 0
+	try:
+		devnull = os.open(os.devnull, os.O_WRONLY)
+		os.dup2(devnull, 1)
+		os.dup2(devnull, 2)
+		fetch.fetcher.after_fork()
+		serve()
+	except BaseException:
+		code = 1
+	finally:
+		os._exit(code)
+
+
+def wait_until_ready(url, timeout=30):
+	deadline = time.time() + timeout
+	while time.time() < deadline:
+		try:
+			if requests.get(url + 'ready').status_code == 200: return
+		except requests.ConnectionError:
+			pass
+		time.sleep(0.05)
+	raise AssertionError('{} did not get ready in {} s'.format(url, timeout))
+
+
+def bench_prefork(repeat=3, requests_total=200, concurrency=8, workers=None):
+	"""
+	compares the throughput of the web app served by web.py's runsimple (one process, the old `main.py --gui`)
+	with the pre-forking server (`--workers`), under concurrent form submissions for a recipe served by a local
+	stub server. Both servers are warm before they are timed; the workers can only outrun runsimple on a
+	machine with more than one core.
+	"""
+	cores = multiprocessing.cpu_count()
+	workers = workers or cores
+	with StubServer(body=saved_page(sample_recipe(), json_ld=True), latency=0) as stub:
+		form = {'url': stub.url('/recipe/1/sample-recipe/'), 'transformation': 'to_vegan', 'parameter (optional)': ''}
+		app = gui.RecipeApp(gui.urls, vars(gui))
+		shared_fetcher, fetch.fetcher = fetch.fetcher, fetch.Fetcher()		# uncached, closed afterwards
+		main.warm_up(snapshot_path)
+
+		def runsimple():
+			probe = socket.socket()
+			probe.bind(('127.0.0.1', 0))
+			port = probe.getsockname()[1]
+			probe.close()
+			return port, serve_in_child(lambda: web.httpserver.runsimple(app.wsgifunc(), ('127.0.0.1', port)))
+
+		def preforked():
+			server = prefork.PreforkServer(app.wsgifunc(), ('127.0.0.1', 0), workers, warm_up=lambda reload=False: main.warm_up(snapshot_path, reload), handler=QuietHandler)
+			server.bind()
+			pid = serve_in_child(server.serve_forever)
+			server.listener.close()
+			return server.address[1], pid
+
+		def submit(url):
+			ts = time.time()
+			response = requests.post(url, data=form)
+			if response.status_code != 200:
+				raise AssertionError('request failed with {}: {}'.format(response.status_code, response.text[:200]))
+			return time.time() - ts
+
+		pool = ThreadPool(concurrency)
+		results = OrderedDict([('cores', cores), ('workers', workers)])
+		try:
+			for name, start in [('runsimple', runsimple), ('prefork', preforked)]:
+				port, pid = start()
+				url = 'http://127.0.0.1:{}/'.format(port)
+				try:
+					wait_until_ready(url)
+					pool.map(lambda n: submit(url), range(concurrency))
+					best = None
+					for _ in range(repeat):
+						ts = time.time()
+						latencies = pool.map(lambda n: submit(url), range(requests_total))
+						seconds = time.time() - ts
+						if best is None or seconds < best[0]: best = (seconds, latencies)
+				finally:
+					os.kill(pid, signal.SIGTERM)
+					os.waitpid(pid, 0)
+				results[name] = {'requests_per_second': requests_total / best[0], 'p50': percentile(best[1], 50), 'p99': percentile(best[1], 99)}
+		finally:
+			pool.close()
+			pool.join()
+			fetch.fetcher.close()
+			fetch.fetcher = shared_fetcher
+
+	print ('{} form submissions, {} at a time, on {} core(s)'.format(requests_total, concurrency, cores))
+	for name, label in [('runsimple', 'runsimple'), ('prefork', '{} workers'.format(workers))]:
+		result = results[name]
+		print ('  {:<12} {:8.1f} requests/s  p50 {:8.1f} ms  p99 {:8.1f} ms'.format(label, result['requests_per_second'], result['p50'] * 1000, result['p99'] * 1000))
+	print ('  speedup      {:8.2f}x'.format(results['prefork']['requests_per_second'] / results['runsimple']['requests_per_second']))
+	return results
+
+
+def bench_batch(repeat=3, recipes=4, jobs_per_recipe=5):
+	"""
+	compares running a batch of transformation jobs (several per recipe, with different tracking parameters in
+	their urls) one at a time -- fetching and parsing the recipe for every job, like separate form submissions --
+	against transform_batch, which fetches and parses every recipe once and transforms forks of it, and against
+	repeating a seeded batch, which transform_batch serves from its result cache
+	"""
+	chains = [['to_vegan'], ['to_healthy'], ['to_vegetarian', 'to_easy'], ['to_pescatarian'], ['to_easy']]
+	with StubServer(body=saved_page(sample_recipe(), json_ld=True), latency=0) as stub:
+		jobs = [{'url': stub.url('/recipe/{}/sample/?internalSource={}'.format(r, n)), 'transformations': chains[n % len(chains)]}
+				for r in range(recipes) for n in range(jobs_per_recipe)]
+		shared_fetcher, fetch.fetcher = fetch.fetcher, fetch.Fetcher()		# uncached, closed afterwards
+
+		def one_at_a_time():
+			results = []
+			for job in jobs:
+				recipe = main.Recipe(**main.extract_recipe(fetch.fetch(job['url']), job['url']))
+				results.append(main.recipe_record(recipe.transform(main.job_transformations(job))))
+			return results
+
+		try:
+			main.warm_up(snapshot_path)
+			for result in main.transform_batch(jobs):
+				if 'error' in result:
+					raise AssertionError('batch job failed: {}'.format(result['error']))
+			stub.requests = 0
+			sequential = best_of(one_at_a_time, repeat)
+			sequential_requests, stub.requests = stub.requests, 0
+			batched = best_of(lambda: main.transform_batch(jobs), repeat)
+			batched_requests = stub.requests
+
+			seeded = [dict(job, seed=n) for n, job in enumerate(jobs)]
+			main.transform_batch(seeded)
+			stub.requests = 0
+			cached = best_of(lambda: main.transform_batch(seeded), repeat)
+			cached_requests = stub.requests
+		finally:
+			fetch.fetcher.close()
+			fetch.fetcher = shared_fetcher
+
+	print ('{} transformation jobs on {} recipes'.format(len(jobs), recipes))
+	print ('  one at a time  {:8.3f} s  ({} fetches per run)'.format(sequential, sequential_requests // repeat))
+	print ('  batched        {:8.3f} s  ({} fetches per run)'.format(batched, batched_requests // repeat))
+	print ('  cached         {:8.3f} s  ({} fetches per run)'.format(cached, cached_requests // repeat))
+	print ('  speedup        {:8.1f}x batched, {:.1f}x cached'.format(sequential / batched, sequential / cached))
+	return {'jobs': len(jobs), 'sequential': sequential, 'batched': batched, 'cached': cached}
+
+
+def bench_instructions(repeat=3):
+	"""
+	checks that the lazily derived tools, methods and time of an Instruction match the find_ methods (also after
+	its words are edited), then compares constructing instructions that derive them eagerly (the old behaviour)
+	against constructing them lazily and never reading them -- i.e. the instructions to_method rebuilds and replaces
+	"""
+	lines = SAMPLE_INSTRUCTIONS * 20
+
+	def expected(instruction):
+		words = instruction.words
+		return (instruction.find_tools(words), instruction.find_methods(words), instruction.find_time(words))
+
+	def derived(instruction):
+		return (instruction.cooking_tools, instruction.cooking_methods, instruction.time)
+
+	for line in SAMPLE_INSTRUCTIONS:
+		instruction = main.Instruction(line)
+		if derived(instruction) != expected(instruction):
+			raise AssertionError('lazy attributes differ from the find_ methods on: {}'.format(line))
+		instruction.instruction_words[:] = ['Preheat', 'the', 'oven', 'and', 'bake', '2', 'hours']
+		if derived(instruction) != expected(instruction):
+			raise AssertionError('stale attributes after editing the words of: {}'.format(line))
+
+	def build_eager():
+		return [main.Instruction(line).derive() for line in lines]
+
+	def build_lazy():
+		return [main.Instruction(line) for line in lines]
+
+	eager = best_of(build_eager, repeat)
+	lazy = best_of(build_lazy, repeat)
+
+	print ('constructing {} instructions'.format(len(lines)))
+	print ('  eager  {:10.0f} instructions/s'.format(len(lines) / eager))
+	print ('  lazy   {:10.0f} instructions/s'.format(len(lines) / lazy))
+	print ('  saved  {:10.1f} us per instruction'.format((eager - lazy) / len(lines) * 1e6))
+	return {'instructions': len(lines), 'eager': eager, 'lazy': lazy}
+
+
+def bench_extraction(repeat=3, pages=None):
+	"""
+	compares extracting the recipe from saved pages by building the DOM of the whole page (the old behaviour),
+	a DOM of only the recipe tags, and the embedded JSON-LD -- after checking the fast paths give the same
+	recipe. pages is a directory of saved pages; by default pages are rendered from the sample recipes, half
+	of them with JSON-LD.
+	"""
+	if pages:
+		html = saved_pages(pages)
+	else:
+		html = [saved_page(sample_recipe(seed=seed), json_ld=seed % 2 == 0) for seed in range(10)]
+	json_ld_html = [page for page in html if main.extract_json_ld(page) is not None]
+
+	paths = [
+		('full DOM', html, lambda page: main.extract_dom(BeautifulSoup(page, 'lxml'))),
+		('recipe tags', html, lambda page: main.extract_dom(BeautifulSoup(page, 'lxml', parse_only=SoupStrainer(main.recipe_tag)))),
+		('JSON-LD', json_ld_html, main.extract_json_ld),
+		('extract_recipe', html, lambda page: main.extract_recipe(page, ''))
+	]
+
+	full_dom = paths[0][2]
+	for name, path_html, extract in paths[1:3]:
+		for page in path_html:
+			if extract(page) != full_dom(page):
+				raise AssertionError('{} extraction differs from the full DOM'.format(name))
+
+	print ('extracting recipes from {} saved pages ({:.0f} KB on average, {} with JSON-LD)'.format(
+		len(html), sum(len(page) for page in html) / 1024.0 / max(len(html), 1), len(json_ld_html)))
+	results = {}
+	for name, path_html, extract in paths:
+		if not path_html: continue
+		seconds = best_of(lambda: [extract(page) for page in path_html], repeat) / len(path_html)
+		memory = max(peak_memory(lambda: extract(page)) for page in path_html[:3])
+		print ('  {:<15} {:8.2f} ms/page  {:8.0f} KB peak'.format(name, seconds * 1000, memory / 1024.0))
+		results[name] = {'seconds_per_page': seconds, 'peak_bytes': memory}
+	return results
+
+
+class NullSink(object):
+	"""
+	file-like object that only counts what is written to it, so a serializer can be timed without the disk
+	"""
+	def __init__(self):
+		self.written = 0
+
+	def write(self, text):
+		self.written += len(text)
+
+
+def bench_serializer(repeat=3, recipes=50):
+	"""
+	checks that the streaming RecipeWriter writes the same records as Recipe.to_JSON, then compares how many
+	characters per second each writes for a batch of recipes
+	"""
+	batch = [main.Recipe(**sample_recipe(seed=seed)) for seed in range(recipes)]
+	for recipe in batch:
+		expected = json.loads(recipe.to_JSON())
+		if json.loads(serialize.dumps(recipe)) != expected or json.loads(serialize.dumps(recipe, pretty=True)) != expected:
+			raise AssertionError('RecipeWriter differs from to_JSON on {}'.format(recipe.name))
+
+	def write_to_json():
+		sink = NullSink()
+		for recipe in batch:
+			sink.write(recipe.to_JSON() + '\n')
+		return sink.written
+
+	def write_stream(pretty):
+		return serialize.write_jsonl(iter(batch), NullSink(), pretty).written
+
+	sizes = {'to_JSON': write_to_json(), 'compact': write_stream(False), 'pretty': write_stream(True)}
+	times = {
+		'to_JSON': best_of(write_to_json, repeat),
+		'compact': best_of(lambda: write_stream(False), repeat),
+		'pretty': best_of(lambda: write_stream(True), repeat)
+	}
+
+	print ('serializing {} recipes'.format(recipes))
+	for name in ['to_JSON', 'compact', 'pretty']:
+		print ('  {:<8} {:10.0f} bytes/s  {:8.0f} recipes/s  ({} bytes)'.format(name, sizes[name] / times[name], recipes / times[name], sizes[name]))
+	return dict((name, {'bytes': sizes[name], 'seconds': times[name]}) for name in sizes)
+
+
+def bench_fetch(repeat=3, pages=20, latency=0.05):
+	"""
+	compares fetching a to_style sized batch of pages from a local stub server one at a time with bare
+	requests.get calls (the old behaviour) against the pooled, concurrent fetch.Fetcher
+	"""
+	with StubServer(latency=latency) as server:
+		urls = [server.url('/recipe/{}/'.format(i)) for i in range(pages)]
+		fetcher = fetch.Fetcher()
+
+		sequential = best_of(lambda: [requests.get(url, timeout=10).content for url in urls], repeat)
+		concurrent = best_of(lambda: fetcher.get_many(urls), repeat)
+		fetcher.close()
+
+	print ('fetching {} pages from a local stub server ({:.0f} ms latency each)'.format(pages, latency * 1000))
+	print ('  sequential  {:8.3f} s'.format(sequential))
+	print ('  concurrent  {:8.3f} s  ({} per host)'.format(concurrent, fetcher.per_host))
+	print ('  speedup     {:8.1f}x'.format(sequential / concurrent))
+	return {'pages': pages, 'sequential': sequential, 'concurrent': concurrent}
+
+
+def bench_tracing(repeat=3, recipes=20):
+	"""
+	measures what the tracing instrumentation costs: a span while tracing is off, what those spans add up to
+	for building, transforming and serializing a batch of recipes, and the same batch with tracing on
+	"""
+	attrs = [sample_recipe(seed=seed) for seed in range(recipes)]
+	spans_timed = 100000
+
+	def pipeline():
+		for recipe_attrs in attrs:
+			main.Recipe(seed=0, **recipe_attrs).transform(['to_vegan', ('to_method', 'bake')]).to_JSON()
+
+	def spans():
+		for _ in range(spans_timed):
+			with tracing.span('benchmark'):
+				pass
+
+	def loop():
+		for _ in range(spans_timed):
+			pass
+
+	was_enabled = tracing.enabled
+	try:
+		tracing.enable(False)
+		off = best_of(pipeline, repeat)
+		per_span = max(best_of(spans, repeat) - best_of(loop, repeat), 0) / spans_timed
+
+		tracing.enable(True)
+		tracing.reset()
+		pipeline()
+		spans_per_run = sum(calls for calls, seconds, errors in tracing.totals.values())
+		on = best_of(pipeline, repeat)
+	finally:
+		tracing.enable(was_enabled)
+		tracing.reset()
+
+	print ('building, transforming and serializing {} recipes ({} spans)'.format(recipes, spans_per_run))
+	print ('  tracing off  {:8.3f} s  ({:.2f} us per span, {:.2%} of the run)'.format(off, per_span * 1e6, per_span * spans_per_run / off))
+	print ('  tracing on   {:8.3f} s  ({:+.1%})'.format(on, on / off - 1))
+	return {'recipes': recipes, 'spans': spans_per_run, 'off': off, 'on': on, 'seconds_per_disabled_span': per_span}
+
+
+def bench_startup(repeat=3):
+	"""
+	checks that importing main, ingest and serialize imports none of the HEAVY_MODULES and that `import main`
+	stays within the IMPORT_BUDGET, then reports what each import adds to the startup of a process -- batch jobs
+	start many short lived ones. (On python 3.7+, `python -X importtime -c "import main"` breaks it down.)
+	"""
+	here = os.path.dirname(os.path.abspath(__file__))
+	probe = 'import sys, main, ingest, serialize; print(",".join(m for m in {!r} if m in sys.modules))'.format(HEAVY_MODULES)
+	imported = subprocess.check_output([sys.executable, '-c', probe], cwd=here).decode().strip()
+	if imported:
+		raise AssertionError('importing main imports {}'.format(imported))
+
+	interpreter = startup_seconds('pass', repeat)
+	imports = [
+		('main', 'import main'),
+		('ingest', 'import ingest'),
+		('gui', 'import gui'),
+		('heavy modules', 'import {}'.format(', '.join(HEAVY_MODULES)))
+	]
+	added = OrderedDict((name, max(startup_seconds(code, repeat) - interpreter, 0)) for name, code in imports)
+
+	print ('startup of a process ({:.0f} ms for the interpreter alone)'.format(interpreter * 1000))
+	for name, seconds in added.items():
+		print ('  import {:<14} {:8.1f} ms'.format(name, seconds * 1000))
+	if added['main'] > IMPORT_BUDGET:
+		raise AssertionError('import main takes {:.0f} ms, over the {:.0f} ms budget'.format(added['main'] * 1000, IMPORT_BUDGET * 1000))
+	return {'interpreter': interpreter, 'imports': added, 'budget': IMPORT_BUDGET}
+
+
+# the parameters every transformation that takes one is timed with -- to_style uses the profile stub_style_profile
+# builds, so it needs no network
+STUB_STYLE = 'Benchmark'
+TRANSFORMATION_PARAMETERS = {
+	'to_style': [STUB_STYLE],
+	'to_method': ['bake', 'fry', 'stir-fry']
+}
+
+
+# the lexicon snapshot the benchmarks tag with (see use_lexicon)
+snapshot_path = lexicon.DEFAULT_SNAPSHOT
+
+
+def use_lexicon(path):
+	"""
+	loads the lexicon the benchmarks tag ingredients with -- the snapshot at path, or for 'fallback' a snapshot
+	frozen from the FALLBACK_LEXICON shipped with the package, so runs on different machines can be compared.
+	The frozen snapshot is removed when the process exits.
+	"""
+	global snapshot_path
+	if path == 'fallback':
+		directory = tempfile.mkdtemp(prefix='benchmark-')
+		atexit.register(shutil.rmtree, directory, True)
+		path = os.path.join(directory, 'lexicon.bin')
+		lexicon.write_snapshot(lexicon.FALLBACK_LEXICON, path)
+
+	snapshot_path = path
+	# warms up right away, so the warm_up() calls of the code being benchmarked find it done instead of loading
+	# the default snapshot
+	main.warm_up(path, reload=True)
+	return main.current_lexicon
+
+
+@contextmanager
+def offline():
+	"""
+	serves every fetch of the shared Fetcher from an empty replay cache while the block runs, so a stage that
+	would reach for the network fails with fetch.CacheMiss instead of timing it
+	"""
+	cache, directory = fetch.fetcher.cache, tempfile.mkdtemp(prefix='benchmark-')
+	fetch.fetcher.cache = fetch.ResponseCache(directory, replay=True)
+	try:
+		yield
+	finally:
+		fetch.fetcher.cache = cache
+		shutil.rmtree(directory, ignore_errors=True)
+
+
+def stub_style_profile(style=STUB_STYLE):
+	"""
+	builds the to_style profile of style from the style_corpus and keeps it in memory only
+	"""
+	corpus = [main.parse_ingredients(recipe) for recipe in style_corpus()]
+	main.style_profiles[style.lower()] = main.style_profile(style, corpus)
+
+
+def transformation_stages():
+	"""
+	returns (label, transformations) for every transformation, once per parameter it is timed with
+	"""
+	stages = []
+	for name, takes_parameter in main.TRANSFORMATIONS.items():
+		if takes_parameter:
+			stages += [('{}({})'.format(name, parameter), [(name, parameter)]) for parameter in TRANSFORMATION_PARAMETERS[name]]
+		else:
+			stages.append((name, [name]))
+	return stages
+
+
+def time_stages(pages, repeat=3):
+	"""
+	times every stage of handling the saved pages: extraction, Ingredient, Instruction and Recipe construction
+	(with a cold ingredient cache), every transformation, to_JSON and compare_to_original. Returns an
+	OrderedDict of stage --> best seconds per recipe, or {'error': ...} for a stage that fails.
+	"""
+	urls = ['https://www.allrecipes.com/recipe/{}/saved-page/'.format(n) for n in range(len(pages))]
+	attrs = [main.extract_recipe(page, url) for page, url in zip(pages, urls)]
+	lines = [line for recipe_attrs in attrs for line in recipe_attrs['ingredients']]
+	steps = [line for recipe_attrs in attrs for line in recipe_attrs['instructions']]
+
+	def cold(func):
+		def run():
+			main.ingredient_cache.clear()
+			return func()
+		return run
+
+	def instructions():
+		for line in steps:
+			instruction = main.Instruction(line)
+			instruction.derive()
+
+	recipes = [main.Recipe(seed=0, **recipe_attrs) for recipe_attrs in attrs]
+	vegan = [recipe.fork().transform(['to_vegan']) for recipe in recipes]
+	stages = [
+		('extract_recipe', lambda: [main.extract_recipe(page, url) for page, url in zip(pages, urls)]),
+		('Ingredient', cold(lambda: main.parse_ingredients(lines))),
+		('Instruction', instructions),
+		('Recipe', cold(lambda: [main.Recipe(seed=0, **recipe_attrs) for recipe_attrs in attrs]))
+	]
+	for label, transformations in transformation_stages():
+		stages.append((label, lambda transformations=transformations: [recipe.fork().transform(transformations) for recipe in recipes]))
+	stages += [
+		('to_JSON', lambda: [recipe.to_JSON() for recipe in vegan]),
+		('compare_to_original', lambda: [recipe.compare_to_original() for recipe in vegan])
+	]
+
+	timings = OrderedDict()
+	for label, func in stages:
+		try:
+			func()
+		except Exception as e:
+			timings[label] = {'error': '{}: {}'.format(type(e).__name__, e)}
+			continue
+		timings[label] = best_of(func, repeat) / len(pages)
+	return timings
+
+
+def print_stages(timings):
+	for label, seconds in timings.items():
+		if isinstance(seconds, dict):
+			print ('  {:<22} failed -- {}'.format(label, seconds['error']))
+		else:
+			print ('  {:<22} {:10.3f} ms/recipe'.format(label, seconds * 1000))
+
+
+def bench_stages(repeat=3, pages=None):
+	"""
+	times every stage from a saved page to a transformed and serialized recipe (see time_stages), offline. pages
+	is a directory of saved pages; by default pages are rendered from the sample recipes, half of them with
+	JSON-LD.
+	"""
+	if pages:
+		html = saved_pages(pages)
+	else:
+		html = [saved_page(sample_recipe(seed=seed), json_ld=seed % 2 == 0) for seed in range(10)]
+
+	def parses(page):
+		try:
+			main.extract_recipe(page, '')
+			return True
+		except Exception:
+			return False
+
+	usable = [page for page in html if parses(page)]
+	if not usable:
+		raise ValueError('none of the saved pages could be parsed')
+	with offline():
+		stub_style_profile()
+		timings = time_stages(usable, repeat)
+
+	print ('stages of {} saved pages ({} skipped, they could not be parsed)'.format(len(usable), len(html) - len(usable)))
+	print_stages(timings)
+	return {'pages': len(usable), 'skipped': len(html) - len(usable), 'seconds_per_recipe': timings}
+
+
+def bench_scaling(repeat=3, sizes=(10, 30, 100, 300, 1000)):
+	"""
+	times every stage (see time_stages) for sample recipes of growing size -- n ingredients and n steps for each
+	n in sizes -- and reports how each stage grows between the two largest sizes as an exponent: about 1 for
+	linear, 2 or more for a quadratic path
+	"""
+	sizes = sorted(sizes)
+	timings = OrderedDict()
+	with offline():
+		stub_style_profile()
+		for n in sizes:
+			page = saved_page(sample_recipe(n_ingredients=n, n_steps=n, seed=n), filler=0)
+			timings[n] = time_stages([page], repeat)
+
+	print ('stages of a recipe with n ingredients and n steps')
+	print ('  {:<22} {}  exponent'.format('', ' '.join('{:>10}'.format('n={}'.format(n)) for n in sizes)))
+	growth = OrderedDict()
+	for label in timings[sizes[0]]:
+		seconds = [timings[n][label] for n in sizes]
+		if any(isinstance(value, dict) for value in seconds):
+			print ('  {:<22} failed -- {}'.format(label, next(value for value in seconds if isinstance(value, dict))['error']))
+			continue
+		growth[label] = None
+		if len(sizes) > 1 and seconds[-2] > 0 and seconds[-1] > 0:
+			growth[label] = math.log(seconds[-1] / seconds[-2]) / math.log(float(sizes[-1]) / sizes[-2])
+		print ('  {:<22} {}  {}'.format(label, ' '.join('{:8.2f}ms'.format(value * 1000) for value in seconds),
+										'{:8.2f}'.format(growth[label]) if growth[label] is not None else '       -'))
+	return {'sizes': sizes, 'seconds': timings, 'exponent': growth}
+
+
+BENCHMARKS = {
+	'tagging': bench_tagging,
+	'fetch': bench_fetch,
+	'scanner': bench_scanner,
+	'snapshot': bench_snapshot,
+	'memory': bench_memory,
+	'instructions': bench_instructions,
+	'serializer': bench_serializer,
+	'extraction': bench_extraction,
+	'service': bench_service,
+	'prefork': bench_prefork,
+	'batch': bench_batch,
+	'stages': bench_stages,
+	'scaling': bench_scaling,
+	'tracing': bench_tracing,
+	'startup': bench_startup
+}
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='run the Recipe Transformer micro benchmarks')
+	parser.add_argument('benchmarks', nargs='*', help='benchmarks to run, any of {} (default: all)'.format(', '.join(sorted(BENCHMARKS.keys()))))
+	parser.add_argument('--repeat', type=int, default=3, help='runs per measurement, the fastest is reported')
+	parser.add_argument('--pages', default=None, help='directory of saved recipe pages for the extraction and stages benchmarks (default: rendered sample pages)')
+	parser.add_argument('--sizes', default='10,30,100,300,1000', help='recipe sizes for the scaling benchmark (default: %(default)s)')
+	parser.add_argument('--lexicon', default='fallback', help='lexicon snapshot to tag with, or fallback for the shipped fallback lexicon (default: %(default)s)')
+	parser.add_argument('--json', default=None, metavar='PATH', help='also write the results as JSON to PATH, to compare runs')
+	args = parser.parse_args()
+
+	unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+	if unknown:
+		parser.error('unknown benchmark(s): {}'.format(', '.join(unknown)))
+	try:
+		sizes = [int(size) for size in args.sizes.split(',')]
+	except ValueError:
+		parser.error('--sizes must be a comma separated list of integers')
+
+	started = time.strftime('%Y-%m-%dT%H:%M:%S')
+	frozen = use_lexicon(args.lexicon)
+	results = OrderedDict()
+	for name in args.benchmarks or sorted(BENCHMARKS.keys()):
+		options = {'repeat': args.repeat}
+		if name in ('extraction', 'stages'):
+			options['pages'] = args.pages
+		elif name == 'scaling':
+			options['sizes'] = sizes
+		results[name] = BENCHMARKS[name](**options)
+
+	if args.json:
+		report = OrderedDict([
+			('started', started),
+			('python', platform.python_version()),
+			('lexicon', {'snapshot': args.lexicon, 'version': frozen.version}),
+			('repeat', args.repeat),
+			('results', results)
+		])
+		with open(args.json, 'w') as f:
+			json.dump(report, f, indent=1)
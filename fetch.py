@@ -0,0 +1,374 @@
+"""
+HTTP fetching shared by parse_url, the lexicon scraper and Recipe.to_style
+
+All requests go through one requests.Session so connections to a host are kept alive and reused instead of
+doing a new TCP (and TLS) handshake per page. get_many() fetches a list of urls concurrently on a bounded
+thread pool, with a per host limit so we never open more than a few connections to the same site at once.
+
+Pages are kept in an on-disk ResponseCache (data/http_cache), keyed by their canonical url, so fetching the same
+recipe, search results or lexicon page again within the TTL costs no network at all, and a stale page is only
+downloaded again if the server says it changed. In replay mode pages are served only from the cache, so a run
+is deterministic and needs no network:
+
+	fetch.use_cache(replay=True)
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+try:
+	from urlparse import urlparse, urlunparse, parse_qsl
+	from urllib import urlencode
+except ImportError:
+	from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+
+import tracing
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'http_cache')
+
+# query parameters that only track how a page was reached -- they never change the page
+TRACKING_PARAMS = ('internalSource', 'referringId', 'referringContentType', 'clickId')
+
+
+class CacheMiss(LookupError):
+	"""
+	raised in replay mode for a url that is not in the cache
+	"""
+
+
+def canonical_url(url):
+	"""
+	returns the url that identifies the same page as url -- the scheme and host lower cased, the fragment and
+	tracking parameters (TRACKING_PARAMS and utm_*) dropped and the remaining query parameters sorted
+	"""
+	parts = urlparse(url)
+	query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+			 if key not in TRACKING_PARAMS and not key.startswith('utm_')]
+	return urlunparse((parts.scheme.lower(), parts.netloc.lower(), parts.path or '/', parts.params, urlencode(sorted(query)), ''))
+
+
+class ResponseCache(object):
+	"""
+	On-disk cache of page bodies. Each page is one file named by the sha1 of its canonical url, holding a line of
+	JSON metadata (url, time stored, ETag and Last-Modified) followed by the body.
+
+		* path --> directory of the cache files
+		* ttl --> seconds a stored page is served without asking the server
+		* max_bytes --> total size of the cache files; the least recently used pages are evicted beyond it
+		* replay --> serve only from the cache (stale or not) and raise CacheMiss instead of fetching
+	"""
+	def __init__(self, path=DEFAULT_CACHE_DIR, ttl=24 * 60 * 60, max_bytes=256 * 1024 * 1024, replay=False):
+		self.path = path
+		self.ttl = ttl
+		self.max_bytes = max_bytes
+		self.replay = replay
+		self.size = None		# total bytes in the cache, counted on the first store
+		self.lock = threading.Lock()
+		self.hits = self.revalidated = self.misses = 0
+
+
+	def entry_path(self, url):
+		return os.path.join(self.path, hashlib.sha1(canonical_url(url).encode('utf-8')).hexdigest() + '.cache')
+
+
+	def load(self, path):
+		"""
+		returns (metadata, body) of the cache file, or None if there is none
+		"""
+		try:
+			with open(path, 'rb') as f:
+				return json.loads(f.readline().decode('utf-8')), f.read()
+		except (IOError, OSError, ValueError):
+			return None
+
+
+	def store(self, path, metadata, body):
+		"""
+		writes the cache file next to its target and renames it into place, so readers never see half of it,
+		then evicts pages if the cache grew past max_bytes
+		"""
+		if not os.path.isdir(self.path):
+			os.makedirs(self.path)
+
+		try: old_size = os.path.getsize(path)
+		except OSError: old_size = 0
+
+		tmp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.current_thread().ident)
+		with open(tmp_path, 'wb') as f:
+			f.write(json.dumps(metadata).encode('utf-8') + b'\n')
+			f.write(body)
+		os.rename(tmp_path, path)
+
+		with self.lock:
+			if self.size is None:
+				self.size = sum(size for mtime, size, entry in self.entries())
+			else:
+				self.size += os.path.getsize(path) - old_size
+			if self.size > self.max_bytes:
+				self.evict()
+
+
+	def entries(self):
+		"""
+		returns (last used, size, path) of every cache file
+		"""
+		entries = []
+		for filename in os.listdir(self.path):
+			if not filename.endswith('.cache'): continue
+			path = os.path.join(self.path, filename)
+			try:
+				stat = os.stat(path)
+			except OSError:
+				continue
+			entries.append((stat.st_mtime, stat.st_size, path))
+		return entries
+
+
+	def evict(self):
+		"""
+		deletes the least recently used pages until the cache is at most 90% of max_bytes (so a full cache
+		is not scanned on every store)
+		"""
+		entries = sorted(self.entries())
+		self.size = sum(size for mtime, size, path in entries)
+		for mtime, size, path in entries:
+			if self.size <= self.max_bytes * 0.9: break
+			try:
+				os.remove(path)
+			except OSError:
+				continue
+			self.size -= size
+
+
+	def get(self, url, download):
+		"""
+		returns the body of url from the cache. download(url, headers) is called to fetch (or conditionally
+		revalidate) pages that are missing or older than the ttl, and must return a requests.Response. If the
+		server cannot be reached, a stale page is returned instead.
+		"""
+		path = self.entry_path(url)
+		cached = self.load(path)
+
+		if self.replay:
+			if cached is None:
+				raise CacheMiss('{} is not in the cache at {}'.format(url, self.path))
+			self.hits += 1
+			return cached[1]
+
+		if cached is not None and time.time() - cached[0]['stored'] < self.ttl:
+			self.hits += 1
+			touch(path)
+			return cached[1]
+
+		headers = {}
+		if cached is not None:
+			if cached[0].get('etag'): headers['If-None-Match'] = cached[0]['etag']
+			if cached[0].get('last_modified'): headers['If-Modified-Since'] = cached[0]['last_modified']
+
+		import requests
+		try:
+			response = download(url, headers)
+		except requests.RequestException:
+			if cached is None: raise
+			self.hits += 1			# the server is unreachable -- a stale page is better than none
+			return cached[1]
+
+		if cached is not None and response.status_code == 304:
+			self.revalidated += 1
+			metadata, body = cached
+			metadata['stored'] = time.time()
+			self.store(path, metadata, body)
+			return body
+
+		self.misses += 1
+		if response.status_code == 200:
+			metadata = {
+				'url': url,
+				'stored': time.time(),
+				'etag': response.headers.get('ETag'),
+				'last_modified': response.headers.get('Last-Modified')
+			}
+			self.store(path, metadata, response.content)
+		return response.content
+
+
+	def clear(self):
+		if os.path.isdir(self.path):
+			for mtime, size, path in self.entries():
+				os.remove(path)
+		self.size = 0
+
+
+	def stats(self):
+		return {'hits': self.hits, 'revalidated': self.revalidated, 'misses': self.misses, 'bytes': self.size}
+
+
+def touch(path):
+	"""
+	marks a cache file as just used, for the least recently used eviction
+	"""
+	try:
+		os.utime(path, None)
+	except OSError:
+		pass
+
+
+class Fetcher(object):
+	"""
+	Pooled, keep-alive HTTP client.
+
+		* max_workers --> most requests get_many has in flight at once
+		* per_host --> most requests in flight to a single host at once (across all threads)
+		* timeout --> seconds before a request is abandoned
+		* cache --> ResponseCache the pages are kept in, or None to always download
+	"""
+	def __init__(self, max_workers=8, per_host=4, timeout=10, cache=None):
+		self.max_workers = max_workers
+		self.per_host = per_host
+		self.timeout = timeout
+		self.cache = cache
+
+		self.http = None			# the requests.Session, opened by session() when it is first needed
+		self.host_slots = {}
+		self.lock = threading.Lock()
+
+
+	def session(self):
+		"""
+		returns the keep-alive session, opening it on the first download -- requests is only imported then, so
+		processes that never download (i.e. replaying the cache) don't pay for importing it
+		"""
+		with self.lock:
+			if self.http is None:
+				import requests
+				from requests.adapters import HTTPAdapter
+				self.http = requests.Session()
+				adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=max(self.max_workers, self.per_host))
+				self.http.mount('http://', adapter)
+				self.http.mount('https://', adapter)
+			return self.http
+
+
+	def host_slot(self, url):
+		"""
+		returns the semaphore limiting concurrent requests to the url's host
+		"""
+		host = urlparse(url).netloc.lower()
+		with self.lock:
+			if host not in self.host_slots:
+				self.host_slots[host] = threading.BoundedSemaphore(self.per_host)
+			return self.host_slots[host]
+
+
+	def get(self, url):
+		"""
+		fetches url (from the cache, if there is one) and returns the body of the response
+		"""
+		with tracing.span('fetch', url=url):
+			if self.cache is not None:
+				return self.cache.get(url, self.download)
+			return self.download(url).content
+
+
+	def download(self, url, headers=None):
+		"""
+		requests url from its server and returns the response
+		"""
+		with tracing.span('download', revalidate=bool(headers)), self.host_slot(url):
+			return self.session().get(url, timeout=self.timeout, headers=headers)
+
+
+	def get_many(self, urls, max_workers=None, return_errors=False):
+		"""
+		fetches every url concurrently and returns their bodies in the same order as urls.
+		If any fetch fails, its exception is raised once the others have finished -- or, with return_errors,
+		returned in place of that url's body.
+		"""
+		urls = list(urls)
+		get = self.get_or_error if return_errors else self.get
+		workers = min(max_workers or self.max_workers, len(urls))
+		if workers <= 1:
+			return [get(url) for url in urls]
+
+		# plain threads rather than a ThreadPool -- its teardown polls every 0.1 s, which would dominate a small batch
+		results = [None] * len(urls)
+		failed = []
+		pending = iter(range(len(urls)))
+		lock = threading.Lock()
+		parent = tracing.current()		# the workers' fetch spans belong to the caller's trace
+
+		def work():
+			with tracing.adopt(parent):
+				while True:
+					with lock:
+						i = next(pending, None)
+					if i is None: return
+					try:
+						results[i] = get(urls[i])
+					except Exception as e:
+						results[i] = e
+						failed.append(i)
+
+		threads = [threading.Thread(target=work) for _ in range(workers)]
+		for thread in threads:
+			thread.daemon = True
+			thread.start()
+		for thread in threads:
+			thread.join()
+		if failed:
+			raise results[min(failed)]
+		return results
+
+
+	def get_or_error(self, url):
+		try:
+			return self.get(url)
+		except Exception as e:
+			return e
+
+
+	def close(self):
+		if self.http is not None:
+			self.http.close()
+
+
+	def after_fork(self):
+		"""
+		forgets the session and locks copied from the parent into a forked process (see prefork.py) -- the two
+		processes must not share the pooled connections, and a lock held by another thread of the parent would
+		never be released in the child
+		"""
+		self.http = None
+		self.host_slots = {}
+		self.lock = threading.Lock()
+		if self.cache is not None:
+			self.cache.lock = threading.Lock()
+
+
+# shared by every fetch in the process
+fetcher = Fetcher(cache=ResponseCache())
+
+
+def use_cache(path=DEFAULT_CACHE_DIR, ttl=24 * 60 * 60, max_bytes=256 * 1024 * 1024, replay=False, enabled=True):
+	"""
+	sets up the response cache of the shared Fetcher -- or turns it off if enabled is False
+	"""
+	fetcher.cache = ResponseCache(path, ttl, max_bytes, replay) if enabled else None
+	return fetcher.cache
+
+
+def fetch(url):
+	"""
+	fetches url with the shared Fetcher and returns the body of the response
+	"""
+	return fetcher.get(url)
+
+
+def fetch_many(urls, max_workers=None, return_errors=False):
+	"""
+	fetches every url concurrently with the shared Fetcher and returns their bodies in order
+	"""
+	return fetcher.get_many(urls, max_workers, return_errors)
@@ -0,0 +1,153 @@
+"""
+Locally hosted web GUI and JSON API of the Recipe Transformer, built on web.py
+
+	>> python main.py --gui
+
+web.py is only imported by this module, so the command line and library uses of main.py don't pay for it.
+"""
+import json
+import threading
+
+import web
+from web import form
+
+import main as transformer
+import prefork
+import tracing
+
+
+def main_gui(url, method, parameter):
+
+	# the lexicon and tagger are loaded once, not per request
+	transformer.warm_up()
+
+	URL = url
+	recipe_attrs = transformer.parse_url(URL)
+
+	recipe = transformer.Recipe(**recipe_attrs)
+	s = ""
+	s += recipe.to_JSON()
+
+	# the form's options name the parameter instead of passing it, i.e. 'to_style(parameter)'
+	method = method.replace('(parameter)', '')
+	if method in transformer.TRANSFORMATIONS and transformer.TRANSFORMATIONS[method]:
+		if not parameter:
+			return "This method requires a parameter"
+		method = (method, parameter)
+
+	try:
+		recipe.transform([method])
+	except ValueError as e:
+		return str(e)
+
+	s += recipe.to_JSON() 
+	s += recipe.compare_to_original()
+
+	return s
+
+render = web.template.render('templates/')
+
+urls = ('/', 'index', '/ready', 'readiness', '/api/transform', 'api_transform', '/metrics', 'metrics', '/traces', 'traces')
+class RecipeApp(web.application):
+    """
+    The GUI's web.py application. It warms up (see main.warm_up) on a background thread as it starts, so the server
+    is up right away, and form submissions wait until the warm up is done. /ready reports when it is. With
+    tracing on, every request is a trace (see tracing.py), served at /traces and totalled at /metrics.
+    """
+    def __init__(self, mapping=(), fvars={}, autoreload=False):
+        web.application.__init__(self, mapping, fvars, autoreload)
+        self.add_processor(trace_request)
+
+    def start_warm_up(self, *args, **kwargs):
+        """
+        runs main.warm_up(*args, **kwargs) on a background thread
+        """
+        thread = threading.Thread(target=transformer.warm_up, args=args, kwargs=kwargs, name='warm-up')
+        thread.daemon = True
+        thread.start()
+
+    def run(self, port=8080, *middleware):
+        self.start_warm_up()
+        func = self.wsgifunc(*middleware)
+        return web.httpserver.runsimple(func, ('0.0.0.0', port))
+
+def trace_request(handle):
+    """
+    web.py processor that runs every request (but those reading the traces) in a top level span
+    """
+    if not tracing.enabled or web.ctx.path in ('/metrics', '/traces'):
+        return handle()
+    with tracing.span('request', method=web.ctx.method, path=web.ctx.path):
+        return handle()
+
+myform = form.Form( 
+    form.Textbox("url", 
+        form.notnull), 
+    form.Dropdown('transformation', ['to_vegan', 'from_vegan', 'to_vegetarian', 'from_vegetarian', 'to_pescatarian', 'from_pescatarian', 'to_healthy', 'from_healthy', 'to_style(parameter)', 'to_method(parameter)']),
+	form.Textbox("parameter (optional)"))
+
+
+
+class index: 
+    def GET(self): 
+        form = myform()
+        # make sure you create a copy of the form by calling it (line above)
+        # Otherwise changes will appear globally
+        return render.formtest(form)
+
+    def POST(self): 
+        form = myform() 
+        if not form.validates(): 
+            return render.formtest(form)
+        else:
+            return main_gui(form.d.url, form['transformation'].value, form['parameter (optional)'].value)
+
+
+class api_transform:
+    """
+    POST a JSON list of jobs (or {"jobs": [...]}) -- see transform_batch -- and get back {"results": [...]}
+    """
+    def POST(self):
+        web.header('Content-Type', 'application/json')
+        try:
+            jobs = json.loads(web.data())
+            if isinstance(jobs, dict): jobs = jobs['jobs']
+            if not isinstance(jobs, list): raise ValueError('expected a list of jobs')
+        except (ValueError, KeyError, TypeError) as e:
+            web.ctx.status = '400 Bad Request'
+            return json.dumps({'error': 'could not read the jobs: {}'.format(e)})
+        return json.dumps({'results': transformer.transform_batch(jobs)})
+
+
+class readiness:
+    def GET(self):
+        web.header('Content-Type', 'application/json')
+        if not transformer.ready.is_set():
+            web.ctx.status = '503 Service Unavailable'
+            return json.dumps({'ready': False})
+        return json.dumps({'ready': True, 'warm_up_seconds': transformer.warm_up_seconds, 'lexicon': transformer.current_lexicon.version})
+
+
+class metrics:
+    def GET(self):
+        web.header('Content-Type', 'text/plain; version=0.0.4')
+        return tracing.prometheus()
+
+
+class traces:
+    def GET(self):
+        web.header('Content-Type', 'application/json')
+        return json.dumps({'enabled': tracing.enabled, 'traces': tracing.recent_traces()})
+
+
+def serve(port=8080, workers=None):
+	"""
+	runs the GUI on the port -- in this process, or if workers is given, in that many worker processes forked
+	from this one once it warmed up (see prefork.py; 0 forks one per CPU core)
+	"""
+	web.internalerror = web.debugerror
+	app = RecipeApp(urls, globals())
+	if workers is None:
+		app.run(port)
+	else:
+		prefork.PreforkServer(app.wsgifunc(), ('0.0.0.0', port), workers, warm_up=transformer.warm_up).serve_forever()
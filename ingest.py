@@ -0,0 +1,200 @@
+"""
+Offline bulk ingestion of saved AllRecipes.com recipe pages
+
+Reads every saved HTML page in a directory (searched recursively) or a tarball, parses the pages into Recipe
+objects across all cores with a process pool, and writes one JSON line per recipe in the Recipe.to_JSON schema:
+
+	>> python ingest.py saved_pages/ -o recipes.jsonl
+	>> python ingest.py saved_pages.tar.gz -o recipes.jsonl --workers 4
+
+A page that fails to parse (i.e. a missing itemprop) is reported on stderr and skipped; the other pages are
+still ingested. Progress and the throughput in recipes/sec are reported on stderr as well.
+"""
+import argparse
+import os
+import re
+import sys
+import tarfile
+import time
+from collections import deque
+from itertools import islice
+from multiprocessing import Pool, cpu_count
+
+import lexicon
+import main as transformer
+import serialize
+
+
+HTML_EXTENSIONS = ('.html', '.htm')
+
+# the url a page was saved from, if the page still has it
+canonical_pattern = re.compile(r'<link[^>]+rel=["\']canonical["\'][^>]+href=["\']([^"\']+)["\']', re.I)
+
+
+def is_html(name):
+	return name.lower().endswith(HTML_EXTENSIONS)
+
+
+def directory_pages(path):
+	"""
+	yields (name, None) for every saved page under the directory -- the workers read the files themselves
+	"""
+	for root, dirs, files in os.walk(path):
+		dirs.sort()
+		for filename in sorted(files):
+			if is_html(filename):
+				yield (os.path.join(root, filename), None)
+
+
+def tarball_pages(path):
+	"""
+	yields (name, html) for every saved page in the tarball, reading it once front to back
+	"""
+	with tarfile.open(path) as archive:
+		for member in archive:
+			if member.isfile() and is_html(member.name):
+				yield (member.name, archive.extractfile(member).read())
+
+
+def source_pages(path):
+	"""
+	yields the pages of a directory or tarball of saved pages
+	"""
+	if os.path.isdir(path):
+		return directory_pages(path)
+	if tarfile.is_tarfile(path):
+		return tarball_pages(path)
+	raise ValueError('{} is neither a directory nor a tarball'.format(path))
+
+
+def count_pages(path):
+	"""
+	returns the number of saved pages in the source, or None for a tarball -- counting would mean reading
+	(and decompressing) it twice
+	"""
+	if os.path.isdir(path):
+		return sum(1 for page in directory_pages(path))
+	return None
+
+
+def start_worker(lexicon_path):
+	"""
+	pool initializer -- loads the lexicon once per worker process
+	"""
+	transformer.build_dynamic_lists(lexicon_path)
+
+
+def parse_page(page):
+	"""
+	parses one saved page into a JSON line. Returns (name, line, error), where exactly one of line and error
+	is None, so that a bad page never takes the rest of the batch down with it.
+	"""
+	name, html = page
+	try:
+		if html is None:
+			with open(name, 'rb') as f:
+				html = f.read()
+		match = canonical_pattern.search(html)
+		url = match.group(1) if match else name
+		recipe = transformer.Recipe(**transformer.extract_recipe(html, url))
+		return (name, serialize.dumps(recipe), None)
+	except Exception as e:
+		return (name, None, '{}: {}'.format(type(e).__name__, e))
+
+
+def parse_pages(pages):
+	"""
+	parses a chunk of pages in one task of the pool -- see parse_page
+	"""
+	return [parse_page(page) for page in pages]
+
+
+def chunks(pages, size):
+	"""
+	yields the pages in lists of size pages (the last one may be shorter)
+	"""
+	chunk = []
+	for page in pages:
+		chunk.append(page)
+		if len(chunk) == size:
+			yield chunk
+			chunk = []
+	if chunk:
+		yield chunk
+
+
+def ingest(source, out, workers=None, chunksize=4, lexicon_path=lexicon.DEFAULT_SNAPSHOT, progress=sys.stderr):
+	"""
+	parses every saved page of source (a directory or tarball) on a pool of workers and writes one JSON line
+	per recipe to the file object out, in the order the pages were found. Returns the number of recipes
+	written, the (name, error) of every page that failed and the elapsed seconds.
+	"""
+	workers = workers or cpu_count()
+	total = count_pages(source)
+	window = workers * 4		# chunks handed to the pool and not written out yet
+
+	written = 0
+	done = 0
+	failures = []
+	start = time.time()
+	pool = Pool(workers, initializer=start_worker, initargs=(lexicon_path,))
+	try:
+		# the pages are read and handed to the pool from this loop, one chunk for every chunk written out, so
+		# a tarball is never pulled into memory ahead of the workers (Pool.imap reads all of its input eagerly)
+		# and nothing the pool's own threads run can block -- terminate() below stops the pool at any point
+		chunked = chunks(source_pages(source), chunksize)
+		pending = deque(pool.apply_async(parse_pages, (chunk,)) for chunk in islice(chunked, window))
+		while pending:
+			results = pending.popleft().get()
+			for chunk in islice(chunked, 1):
+				pending.append(pool.apply_async(parse_pages, (chunk,)))
+
+			for name, line, error in results:
+				done += 1
+				if error is None:
+					out.write(line + '\n')
+					written += 1
+				else:
+					failures.append((name, error))
+					if progress: progress.write('\nfailed to parse {} -- {}\n'.format(name, error))
+
+				if progress:
+					elapsed = time.time() - start
+					progress.write('\r{}/{} pages, {} failed, {:.1f} recipes/s'.format(
+						done, total if total is not None else '?', len(failures), written / elapsed if elapsed else 0.0))
+		pool.close()
+	finally:
+		pool.terminate()
+		pool.join()
+
+	elapsed = time.time() - start
+	if progress: progress.write('\n')
+	return written, failures, elapsed
+
+
+def main():
+	parser = argparse.ArgumentParser(description='parse a directory or tarball of saved AllRecipes.com pages into JSON lines')
+	parser.add_argument('source', help='directory (searched recursively) or tarball of saved .html pages')
+	parser.add_argument('-o', '--output', default='-', help='JSON lines file to write (default: stdout)')
+	parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per core)')
+	parser.add_argument('--chunksize', type=int, default=4, help='pages handed to a worker at a time')
+	parser.add_argument('--lexicon', default=lexicon.DEFAULT_SNAPSHOT, help='lexicon snapshot (default: %(default)s)')
+	parser.add_argument('--quiet', action='store_true', help='only report the totals')
+	args = parser.parse_args()
+	if not os.path.exists(args.source):
+		parser.error('{} does not exist'.format(args.source))
+
+	out = sys.stdout if args.output == '-' else open(args.output, 'w')
+	try:
+		written, failures, elapsed = ingest(args.source, out, args.workers, args.chunksize, args.lexicon,
+											progress=None if args.quiet else sys.stderr)
+	finally:
+		if out is not sys.stdout: out.close()
+
+	sys.stderr.write('ingested {} recipes in {:.2f} s ({:.1f} recipes/s), {} pages failed\n'.format(
+		written, elapsed, written / elapsed if elapsed else 0.0, len(failures)))
+	return 1 if failures and not written else 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
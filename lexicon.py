@@ -0,0 +1,383 @@
+"""
+Food lexicon used to tag the type of an Ingredient (meat, vegetable, dairy, ...)
+
+The lists of known foods are scraped from wikipedia.com and naturalhealthtechniques.com. Scraping is an
+explicit offline step:
+
+	>> python lexicon.py build
+
+writes a versioned binary snapshot (data/lexicon.bin) which every process then loads with load_lexicon().
+The snapshot is memory mapped read-only, so all worker processes share one copy of the raw lexicon pages
+and only decode the categories they actually use. The type of an ingredient is looked up in a sorted index of
+food name words stored in the snapshot itself, so tagging decodes no category at all. If no snapshot has been
+built, the small FALLBACK_LEXICON that ships with the package is used instead.
+
+Snapshot layout (all integers little endian):
+
+	magic 'RTLX' | format version (u16) | number of categories (u16) | sha1 of table + payload (40 ascii bytes)
+	one table entry per category: name (16 bytes, null padded) | offset (u32) | length (u32)
+	payload: one utf-8 block per category, entries separated by newlines, then the type index block (table
+	entry INDEX_ENTRY) -- the number of words (u32), one offset per word and one past the last (u32, relative
+	to the first record) and the records, sorted by word: the utf-8 word followed by its type rank (u8)
+"""
+import argparse
+import hashlib
+import io
+import mmap
+import os
+import re
+import struct
+import sys
+
+MAGIC = b'RTLX'
+FORMAT_VERSION = 2
+READABLE_VERSIONS = (1, 2)		# version 1 snapshots have no type index -- it is then built in memory
+
+INDEX_ENTRY = '.type_index'
+
+HEADER = struct.Struct('<4sHH40s')
+ENTRY = struct.Struct('<16sII')
+COUNT = struct.Struct('<I')
+OFFSETS = struct.Struct('<II')
+
+DEFAULT_SNAPSHOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'lexicon.bin')
+
+# ordered by the precedence used when tagging an Ingredient's type
+CATEGORIES = ('meat', 'vegetable', 'dairy', 'grain', 'sauce', 'seafood', 'herbs_spice', 'fruit')
+
+# the Ingredient type code of each category, in the same precedence order
+TYPE_CODES = ('M', 'V', 'D', 'G', 'S', 'P', 'H', 'F')
+
+
+# small hand curated lexicon used when no snapshot has been built -- keeps the program usable offline
+FALLBACK_LEXICON = {
+	'meat': [
+		'beef', 'ground beef', 'steak', 'veal', 'pork', 'bacon', 'ham', 'sausage', 'chorizo', 'pepperoni',
+		'salami', 'prosciutto', 'lamb', 'mutton', 'goat', 'venison', 'bison', 'rabbit', 'chicken', 'turkey',
+		'duck', 'goose', 'quail', 'pheasant', 'meatballs', 'hot dogs', 'anchovies', 'clams', 'cod', 'crab',
+		'halibut', 'lobster', 'mussels', 'oysters', 'salmon', 'sardines', 'scallops', 'shrimp', 'tilapia',
+		'trout', 'tuna'
+	],
+	'vegetable': [
+		'artichoke', 'asparagus', 'beet', 'bell pepper', 'broccoli', 'brussels sprouts', 'cabbage', 'carrot',
+		'cauliflower', 'celery', 'chard', 'corn', 'cucumber', 'eggplant', 'garlic', 'green beans', 'kale',
+		'leek', 'lettuce', 'mushroom', 'okra', 'onion', 'parsnip', 'peas', 'potato', 'pumpkin', 'radish',
+		'shallot', 'spinach', 'squash', 'sweet potato', 'tomato', 'turnip', 'zucchini'
+	],
+	'dairy': [
+		'butter', 'buttermilk', 'cheddar cheese', 'cottage cheese', 'cream', 'cream cheese', 'feta cheese',
+		'ghee', 'half-and-half', 'heavy cream', 'ice cream', 'milk', 'mozzarella cheese', 'parmesan cheese',
+		'ricotta cheese', 'sour cream', 'whipped cream', 'yogurt'
+	],
+	'grain': [
+		'barley', 'bread', 'breadcrumbs', 'bulgur', 'couscous', 'cornmeal', 'flour', 'lasagna noodles',
+		'macaroni', 'millet', 'noodles', 'oats', 'pasta', 'penne', 'quinoa', 'rice', 'spaghetti', 'tortillas',
+		'wheat'
+	],
+	'sauce': [
+		'aioli', 'barbecue sauce', 'bechamel', 'chutney', 'enchilada sauce', 'fish sauce', 'gravy', 'hoisin',
+		'hollandaise', 'ketchup', 'marinara', 'mayonnaise', 'mustard', 'pesto', 'salsa', 'soy sauce', 'sriracha',
+		'tahini', 'teriyaki', 'worcestershire'
+	],
+	'seafood': [
+		'anchovies', 'clams', 'cod', 'crab', 'halibut', 'lobster', 'mussels', 'oysters', 'salmon', 'sardines',
+		'scallops', 'shrimp', 'tilapia', 'trout', 'tuna'
+	],
+	'herbs_spice': [
+		'allspice', 'basil', 'bay leaf', 'black pepper', 'cardamom', 'cayenne', 'chili powder', 'chives',
+		'cilantro', 'cinnamon', 'cloves', 'coriander', 'cumin', 'dill', 'ginger', 'mint', 'nutmeg', 'oregano',
+		'paprika', 'parsley', 'pepper', 'rosemary', 'saffron', 'sage', 'salt', 'tarragon', 'thyme', 'turmeric',
+		'vanilla'
+	],
+	'fruit': [
+		'apple', 'apricot', 'avocado', 'banana', 'blackberries', 'blueberries', 'cherries', 'coconut', 'cranberries',
+		'dates', 'figs', 'grapefruit', 'grapes', 'lemon', 'lime', 'mango', 'orange', 'papaya', 'peach', 'pear',
+		'pineapple', 'plum', 'raisins', 'raspberries', 'strawberries', 'watermelon'
+	]
+}
+
+
+class LexiconError(Exception):
+	"""
+	Raised when a lexicon snapshot is missing, truncated, or written in an unsupported format
+	"""
+	pass
+
+
+class Lexicon(object):
+	"""
+	Read-only view over a lexicon snapshot. The raw snapshot bytes are kept in `buf` (a read-only mmap when
+	loaded from disk) and each category is only decoded into a list of strings the first time it is asked for.
+	type_rank() reads the type index in place.
+	"""
+	def __init__(self, buf, source=None):
+		self.buf = buf
+		self.source = source
+
+		if len(buf) < HEADER.size:
+			raise LexiconError('lexicon snapshot is truncated')
+		magic, format_version, count, digest = HEADER.unpack_from(buf, 0)
+		if magic != MAGIC:
+			raise LexiconError('not a lexicon snapshot')
+		if format_version not in READABLE_VERSIONS:
+			raise LexiconError('unsupported lexicon format version {}'.format(format_version))
+
+		self.version = digest.decode('ascii')
+		self.table = {}
+		for i in range(count):
+			name, offset, length = ENTRY.unpack_from(buf, HEADER.size + i * ENTRY.size)
+			name = name.rstrip(b'\0').decode('ascii')
+			if offset + length > len(buf):
+				raise LexiconError('lexicon snapshot is truncated')
+			self.table[name] = (offset, length)
+		self._decoded = {}
+		self._type_index = None
+
+		self.index = None		# (offset of the offsets, number of words) of the type index block
+		if INDEX_ENTRY in self.table:
+			offset, length = self.table.pop(INDEX_ENTRY)
+			self.index = (offset + COUNT.size, COUNT.unpack_from(buf, offset)[0])
+
+
+	@classmethod
+	def from_lists(cls, lists, source=None):
+		"""
+		builds an in memory Lexicon from a dictionary of category --> list of food names
+		"""
+		return cls(encode_snapshot(lists), source=source)
+
+
+	def get(self, category):
+		"""
+		returns the list of food names for the category, decoding it from the snapshot on first use
+		"""
+		if category not in self._decoded:
+			if category not in self.table:
+				self._decoded[category] = []
+			else:
+				offset, length = self.table[category]
+				block = self.buf[offset:offset + length].decode('utf-8')
+				self._decoded[category] = block.split(u'\n') if block else []
+		return self._decoded[category]
+
+
+	def type_rank(self, word):
+		"""
+		returns the precedence rank of the first category with a food name that has the (lowercased) word, or
+		None -- the same as type_index().get(word), found by a binary search of the index in the snapshot, so
+		no process holds the index as Python objects
+		"""
+		if self.index is None:
+			return self.type_index().get(word)
+
+		key = word if isinstance(word, bytes) else word.encode('utf-8')
+		offsets, count = self.index
+		records = offsets + COUNT.size * (count + 1)
+		low, high = 0, count
+		while low < high:
+			middle = (low + high) // 2
+			start, end = OFFSETS.unpack_from(self.buf, offsets + COUNT.size * middle)
+			candidate = self.buf[records + start:records + end - 1]
+			if candidate < key:
+				low = middle + 1
+			elif candidate > key:
+				high = middle
+			else:
+				return ord(self.buf[records + end - 1:records + end])
+		return None
+
+
+	def type_index(self):
+		"""
+		inverted index from every (lowercased) word of every food name to the precedence rank of the first
+		category it appears in. An ingredient name's type is then the lowest rank among its words, which
+		gives the same answer as checking each category list in order. Built once and cached -- only for
+		snapshots without a stored index, see type_rank.
+		"""
+		if self._type_index is None:
+			index = {}
+			for rank, category in enumerate(CATEGORIES):
+				for example in self.get(category):
+					for token in example.lower().split(' '):
+						if token not in index:
+							index[token] = rank
+			self._type_index = index
+		return self._type_index
+
+
+	def lists(self):
+		"""
+		returns every category as a dictionary of category --> list of food names
+		"""
+		return dict((category, self.get(category)) for category in CATEGORIES)
+
+
+	def close(self):
+		"""
+		releases the memory map backing the snapshot (if any)
+		"""
+		if isinstance(self.buf, mmap.mmap):
+			self.buf.close()
+
+
+def encode_snapshot(lists):
+	"""
+	serializes a dictionary of category --> list of food names into the snapshot format
+	"""
+	blocks = []
+	ranks = {}
+	for rank, category in enumerate(CATEGORIES):
+		entries = [entry.replace(u'\n', u' ') for entry in lists.get(category, [])]
+		blocks.append(u'\n'.join(entries).encode('utf-8'))
+		for entry in entries:
+			for token in entry.lower().split(u' '):
+				ranks.setdefault(token.encode('utf-8'), rank)
+	blocks.append(encode_type_index(ranks))
+	names = CATEGORIES + (INDEX_ENTRY,)
+
+	payload = b''.join(blocks)
+
+	table = io.BytesIO()
+	offset = HEADER.size + ENTRY.size * len(names)
+	for name, block in zip(names, blocks):
+		table.write(ENTRY.pack(name.encode('ascii'), offset, len(block)))
+		offset += len(block)
+	table = table.getvalue()
+
+	# the version covers the table too, so moving a food between categories changes it
+	digest = hashlib.sha1(table + payload).hexdigest().encode('ascii')
+
+	out = io.BytesIO()
+	out.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(names), digest))
+	out.write(table)
+	out.write(payload)
+	return out.getvalue()
+
+
+def encode_type_index(ranks):
+	"""
+	serializes a dictionary of utf-8 word --> type rank into the type index block (see the snapshot layout)
+	"""
+	words = sorted(ranks)
+	offsets = [0]
+	for word in words:
+		offsets.append(offsets[-1] + len(word) + 1)
+	records = b''.join(word + struct.pack('<B', ranks[word]) for word in words)
+	return COUNT.pack(len(words)) + b''.join(COUNT.pack(offset) for offset in offsets) + records
+
+
+def write_snapshot(lists, path=DEFAULT_SNAPSHOT):
+	"""
+	writes the lexicon snapshot to path. The file is written next to the target and renamed into place so
+	processes that already mapped the old snapshot are never handed a half written file.
+	"""
+	directory = os.path.dirname(path)
+	if directory and not os.path.isdir(directory):
+		os.makedirs(directory)
+
+	tmp_path = path + '.tmp'
+	with open(tmp_path, 'wb') as f:
+		f.write(encode_snapshot(lists))
+	os.rename(tmp_path, path)
+	return path
+
+
+def load_lexicon(path=DEFAULT_SNAPSHOT, fallback=True):
+	"""
+	memory maps the lexicon snapshot at path. If there is no snapshot and fallback is True, the
+	FALLBACK_LEXICON shipped with the package is returned instead.
+	"""
+	if not os.path.exists(path):
+		if fallback:
+			return Lexicon.from_lists(FALLBACK_LEXICON, source='fallback')
+		raise LexiconError('no lexicon snapshot at {}'.format(path))
+
+	with open(path, 'rb') as f:
+		buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+	return Lexicon(buf, source=path)
+
+
+def clean_list_items(lis):
+	"""
+	filters out the noise that comes along with scraping <li> tags from the source pages
+	"""
+	lis_clean = []
+	for li in lis:
+		if len(li) == 1: continue
+		if re.search(r'\d', li): continue
+		if re.search('\n', li): continue
+		lis_clean.append(li.lower())
+	return lis_clean
+
+
+def scrape_lexicon():
+	"""
+	fills the lists of known foods from websites -- this is the slow, online step that the snapshot replaces
+	"""
+	from bs4 import BeautifulSoup
+	from fetch import fetch_many
+
+	base = 'http://naturalhealthtechniques.com/'
+	urls = [
+		'https://simple.wikipedia.org/wiki/List_of_vegetables',
+		'https://en.wikipedia.org/wiki/List_of_culinary_herbs_and_spices',
+		'https://en.wikipedia.org/wiki/List_of_sauces',
+		base + 'list-of-meats-and-poultry/',
+		base + 'list-of-fish-and-seafood/',
+		base + 'list-of-cheese-dairy-products/',
+		base + 'list-of-grains-cereals-pastas-flours/',
+		base + 'list-of-fruits/'
+	]
+	pages = fetch_many(urls)
+
+	def list_items(page, div_class=None):
+		soup = BeautifulSoup(page, "lxml")
+		if div_class:
+			soup = soup.find('div', {'class': div_class})
+		return [li.text.strip() for li in soup.find_all('li')]
+
+	lists = {}
+
+	# build vegetable list -- stop at the footer links
+	lis = list_items(pages[0])
+	if 'Lists of vegetables' in lis:
+		lis = lis[:lis.index('Lists of vegetables')]
+	lists['vegetable'] = clean_list_items(lis)
+
+	# build herbs and spices list and the sauces list -- stop at the category links
+	for category, page, skip in [('herbs_spice', pages[1], 3), ('sauce', pages[2], 0)]:
+		lis = list_items(page)[skip:]
+		if 'Category' in lis:
+			lis = lis[:lis.index('Category')]
+		lists[category] = clean_list_items(lis)
+
+	lists['meat'] = clean_list_items(list_items(pages[3], 'entry-content'))
+	lists['seafood'] = clean_list_items(list_items(pages[4], 'entry-content'))
+	lists['meat'].extend(lists['seafood'])
+	lists['dairy'] = clean_list_items(list_items(pages[5], 'entry-content'))
+	lists['grain'] = clean_list_items(list_items(pages[6], 'entry-content'))
+	lists['fruit'] = clean_list_items(list_items(pages[7], 'entry-content'))
+
+	return lists
+
+
+def main():
+	parser = argparse.ArgumentParser(description='build or inspect the food lexicon snapshot')
+	parser.add_argument('command', choices=['build', 'info'], help='build: scrape the source pages and write a snapshot, info: describe the current snapshot')
+	parser.add_argument('--path', default=DEFAULT_SNAPSHOT, help='snapshot location (default: %(default)s)')
+	parser.add_argument('--fallback', action='store_true', help='build the snapshot from the shipped fallback lexicon instead of scraping')
+	args = parser.parse_args()
+
+	if args.command == 'build':
+		lists = FALLBACK_LEXICON if args.fallback else scrape_lexicon()
+		write_snapshot(lists, args.path)
+
+	lexicon = load_lexicon(args.path)
+	print ('lexicon {} ({})'.format(lexicon.version, lexicon.source))
+	for category in CATEGORIES:
+		print ('  {:<12} {} entries'.format(category, len(lexicon.get(category))))
+	lexicon.close()
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -24,18 +24,19 @@ import time
 import random
 import re
 import json
-import sys
 import argparse
+import os
 from urlparse import urlparse
 from collections import defaultdict, OrderedDict
 from operator import itemgetter
 import textwrap
 import copy
-import requests
-from bs4 import BeautifulSoup
-from nltk import word_tokenize, pos_tag
-import web
-from web import form
+import threading
+from HTMLParser import HTMLParser
+import lexicon
+import fetch
+import tracing
+from matching import AhoCorasick
 
 DEBUG = False
 
@@ -51,6 +52,21 @@ descriptor_regex = '(color|mini|container|skin|bone|halves|fine|parts|leftover|s
 preperation_regex = '(room|temperature|divided|sliced|dice|mince|chopped|quartered|cored|shredded|seperated|pieces)'
 names_regex = '(garlic|poppy|baking|sour|cream|broth|chicken|olive|mushroom|green|vegetable|bell)'
 
+# compiled once for the Ingredient scanner, which checks every word of every ingredient line against them
+measure_pattern = re.compile(measure_regex, re.I)
+descriptor_pattern = re.compile(descriptor_regex, re.I)
+preperation_pattern = re.compile(preperation_regex, re.I)
+names_pattern = re.compile(names_regex, re.I)
+wholes_pattern = re.compile(r'([0-9])\s')
+fractions_pattern = re.compile(r'([0-9]\/[0-9])')
+
+# compiled once for the Instruction attributes, which check every word of every instruction against them
+tool_indicator_pattern = re.compile(tool_indicator_regex, re.I)
+method_indicator_pattern = re.compile(method_indicator_regex, re.I)
+time_indicator_pattern = re.compile(time_indicator_regex, re.I)
+preheat_pattern = re.compile('preheat', re.I)
+hour_pattern = re.compile('(hour)', re.I)
+
 
 
 # start of word banks
@@ -111,15 +127,25 @@ unhealthy_substitutes = [
 	]
 
 
-# build list dynamically from wikipedia using the build_dynamic_lists() function -- used to tag the domain of an ingredient
-sauce_list = []
-vegetable_list = []
-herbs_spice_list = []
-dairy_list = []
-meat_list = []
-grain_list = []
-fruit_list = []
-seafood_list = []
+# loaded from the lexicon snapshot (see lexicon.py) by the build_dynamic_lists() function -- used to tag the domain of an
+# ingredient and to pick random foods of a category (current_lexicon.get('meat'), ...)
+current_lexicon = None
+
+
+# one shared copy of every word, name and type code of the parsed recipes (see intern_token)
+interned = {}
+
+
+def intern_token(token):
+	"""
+	returns the shared copy of the string token. A corpus of recipes uses a small vocabulary, so the words,
+	names and type codes of its Ingredients and Instructions are stored once instead of once per occurrence.
+	"""
+	shared = interned.get(token)
+	if shared is None:
+		if len(interned) > 100000: interned.clear()		# bound the table on pathological input
+		shared = interned[token] = token
+	return shared
 
 
 class Ingredient(object):
@@ -143,17 +169,23 @@ class Ingredient(object):
 		* .	    punctuation marks	. , ; !
 		* X	    other	ersatz, esprit, dunno, gr8, univeristy
 	"""
-	def __init__(self, description):
-		description_tagged = pos_tag(word_tokenize(description))
+	# no per instance __dict__, as a corpus holds many thousands of ingredients. The fields are listed in the order
+	# __init__ sets them, which recipe_record writes them in.
+	__slots__ = ('name', 'measurement', 'descriptor', 'preperation', 'quantity', 'type')
+
+	@tracing.traced('Ingredient')
+	def __init__(self, description, description_tagged=None):
+		# description_tagged can be passed in when the description was already tagged as part of a batch
+		# (see parse_ingredients) -- otherwise tag it here
+		if description_tagged is None:
+			description_tagged = pos_tag(word_tokenize(description))
 
 		# if DEBUG:
 		# 	print ('tags: {}'.format(description_tagged))
 
-		self.name = self.find_name(description_tagged)
+		# fills name, measurement, descriptor and preperation in one pass over the tagged words
+		self.scan(description_tagged, description)
 		self.quantity = self.find_quantity(description)				# do not use tagged description -- custom parsing for quantities
-		self.measurement = self.find_measurement(description_tagged, description)
-		self.descriptor = self.find_descriptor(description_tagged)
-		self.preperation = self.find_preperation(description_tagged)
 		self.type = self.find_type()
 
 		if DEBUG:
@@ -184,22 +216,76 @@ class Ingredient(object):
 		Defines what makes two Ingredient instances equal
 		"""
 		if isinstance(self, other.__class__):
-			return self.__dict__ == other.__dict__
+			return all(getattr(self, field, None) == getattr(other, field, None) for field in Ingredient.__slots__)
 		return False
 
 
-	def find_name(self, description_tagged):
+	def copy(self):
 		"""
-		looks for name of the ingredient from the desciption. Finds the nouns that are not measurements
+		returns a copy of the Ingredient that can be modified without affecting this one
 		"""
-		name = [d[0] for d in description_tagged if ((d[1] == 'NN' or d[1] == 'NNS' or d[1] == 'NNP') 
-													and not re.search(measure_regex, d[0], flags=re.I)
-													and not re.search(descriptor_regex, d[0], flags=re.I)
-													and not re.search(preperation_regex, d[0], flags=re.I))
-											or re.search(names_regex, d[0], re.I)]
-		if len(name) == 0:
-			return description_tagged[-1][0]
-		return ' '.join(name)
+		ingredient = self.__class__.__new__(self.__class__)
+		ingredient.name = self.name
+		ingredient.measurement = self.measurement
+		ingredient.descriptor = list(self.descriptor)
+		ingredient.preperation = list(self.preperation)
+		ingredient.quantity = self.quantity
+		ingredient.type = self.type
+		return ingredient
+
+
+	def to_dict(self):
+		"""
+		returns the parsed fields of the Ingredient as a dictionary
+		"""
+		return {
+			'name': self.name,
+			'quantity': self.quantity,
+			'measurement': self.measurement,
+			'descriptor': list(self.descriptor),
+			'preperation': list(self.preperation),
+			'type': self.type
+		}
+
+
+	@classmethod
+	def from_dict(cls, fields):
+		"""
+		rebuilds an Ingredient from the fields returned by to_dict without parsing anything
+		"""
+		ingredient = cls.__new__(cls)
+		ingredient.name = intern_token(fields['name'])
+		ingredient.measurement = intern_token(fields['measurement'])
+		ingredient.descriptor = [intern_token(word) for word in fields['descriptor']]
+		ingredient.preperation = [intern_token(word) for word in fields['preperation']]
+		ingredient.quantity = fields['quantity']
+		ingredient.type = intern_token(fields['type'])
+		return ingredient
+
+
+	def scan(self, description_tagged, description):
+		"""
+		finds the name, measurement, descriptors and preperations of the ingredient in a single pass. Each word is
+		classified against all of the vocabularies at once (see classify_word) and then added to every field it
+		belongs to. tests/test_scanner.py checks it against the find_ methods it replaced.
+		"""
+		name, measurement, descriptors, preperations = [], [], [], []
+		for word, tag in description_tagged:
+			measure, descriptor, preperation, named = classify_word(word)
+
+			if (tag in ('NN', 'NNS', 'NNP') and not measure and not descriptor and not preperation) or named:
+				name.append(word)
+			if measure:
+				measurement.append(word)
+			if (tag in ('JJ', 'RB') and not measure and not named) or descriptor:
+				descriptors.append(word)
+			if (tag in ('VB', 'VBD') or preperation) and not named:
+				preperations.append('to taste' if word == 'taste' else word)
+
+		self.name = intern_token(' '.join(name) if len(name) else description_tagged[-1][0])
+		self.measurement = intern_token(self.measurement_from_words(measurement, description))
+		self.descriptor = descriptors
+		self.preperation = preperations
 
 
 	def find_quantity(self, description):
@@ -208,8 +294,8 @@ class Ingredient(object):
 		if none are apparent, it returns zero. Else it converts fractions to floats and
 		aggregates measurement (i.e. 1 3/4 --> 1.75)
 		"""
-		wholes = re.match(r'([0-9])\s', description)
-		fractions = re.search(r'([0-9]\/[0-9])', description)
+		wholes = wholes_pattern.match(description)
+		fractions = fractions_pattern.search(description)
 
 		if fractions: 
 			fractions = fractions.groups(0)[0]
@@ -224,12 +310,11 @@ class Ingredient(object):
 		return total
 
 
-	def find_measurement(self, description_tagged, description):
+	def measurement_from_words(self, measurement, description):
 		"""
-		looks for measurements such as cups, teaspoons, etc. 
-		Uses measure_regex which is a compilation of possible measurements.
+		builds the measurement from the measurement words of the description -- packages and cans are
+		measured by the size given in parentheses (i.e. 1 (14.5 ounce) can)
 		"""
-		measurement = [d[0] for d in description_tagged if re.search(measure_regex, d[0], flags=re.I)]
 		m = ' '.join(measurement)
 		if re.search('package', m, flags=re.I):
 			extra = description[description.find("(")+1:description.find(")")]
@@ -244,35 +329,7 @@ class Ingredient(object):
 		return m
 
 
-	def find_descriptor(self, description_tagged):
-		"""
-		looks for descriptions such as fresh, extra-virgin by finding describing words such as
-		adjectives
-		"""
-		descriptors = [d[0] for d in description_tagged if ( 
-															(d[1] == 'JJ' or d[1] == 'RB') 
-															and not re.search(measure_regex, d[0], flags=re.I)
-															and not re.search(names_regex, d[0], flags=re.I)
-														)
-														or re.search(descriptor_regex, d[0], flags=re.I)]
-		return descriptors
-
-
-	def find_preperation(self, description_tagged):
-		"""
-		find all preperations (finely, chopped) by finding action words such as verbs 
-		"""
-		preperations = [d[0] for d in description_tagged if (
-															d[1] == 'VB' or d[1] == 'VBD' 
-															or re.search(preperation_regex, d[0], flags=re.I)
-															)
-															and not re.search(names_regex, d[0], flags=re.I)]
-		for i, p in enumerate(preperations):
-			if p == 'taste':
-				preperations[i] = 'to taste'
-		return preperations
-
-
+	@tracing.traced()
 	def find_type(self):
 		"""
 		attempts to categorize ingredient for Recipe methods to work more smoothly and correctly
@@ -292,18 +349,204 @@ class Ingredient(object):
 		# special cases:
 		if self.name.lower().find('sauce') >= 0: return 'S'
 
-		# normal execution:
-		types = ''
-		if any(set(self.name.lower().split(' ')).intersection(set(example.lower().split(' '))) for example in meat_list) and len(types) == 0: types ='M' 
-		if any(set(self.name.lower().split(' ')).intersection(set(example.lower().split(' '))) for example in vegetable_list) and len(types) == 0: types = 'V'
-		if any(set(self.name.lower().split(' ')).intersection(set(example.lower().split(' '))) for example in dairy_list) and len(types) == 0: types = 'D' 
-		if any(set(self.name.lower().split(' ')).intersection(set(example.lower().split(' '))) for example in grain_list) and len(types) == 0: types = 'G'
-		if any(set(self.name.lower().split(' ')).intersection(set(example.lower().split(' '))) for example in sauce_list) and len(types) == 0: types = 'S'
-		if any(set(self.name.lower().split(' ')).intersection(set(example.lower().split(' '))) for example in seafood_list) and len(types) == 0: types = 'P'
-		if any(set(self.name.lower().split(' ')).intersection(set(example.lower().split(' '))) for example in herbs_spice_list) and len(types) == 0: types = 'H'
-		if any(set(self.name.lower().split(' ')).intersection(set(example.lower().split(' '))) for example in fruit_list) and len(types) == 0: types = 'F' 
-		if len(types) == 0: types = '?'
-		return types
+		# normal execution: the first category (by precedence) that shares a word with the name wins
+		ranks = [rank for rank in map(current_lexicon.type_rank, self.name.lower().split(' ')) if rank is not None]
+		if len(ranks) == 0: return '?'
+		return lexicon.TYPE_CODES[min(ranks)]
+
+
+# word --> (measure, descriptor, preperation, name) flags, shared by every Ingredient scan
+word_classes = {}
+
+
+def classify_word(word):
+	"""
+	checks the word against the measure, descriptor, preperation and names vocabularies. Ingredient lines
+	reuse a small vocabulary, so the answers are memoized in word_classes.
+	"""
+	classes = word_classes.get(word)
+	if classes is None:
+		if len(word_classes) > 100000: word_classes.clear()		# bound the memo on pathological input
+		classes = (bool(measure_pattern.search(word)), bool(descriptor_pattern.search(word)),
+				   bool(preperation_pattern.search(word)), bool(names_pattern.search(word)))
+		word_classes[word] = classes
+	return classes
+
+
+class IngredientCache(object):
+	"""
+	Process wide LRU cache of parsed Ingredient objects keyed by the normalized description (whitespace
+	collapsed). Common lines like '1 teaspoon salt' and the substitution tables show up in almost every
+	recipe and transformation, so they only need to be tagged and parsed once.
+
+	The cache keeps its own private copy of every Ingredient and hands out copies, so callers are free to
+	modify the quantity, descriptor, etc. of what they get back. It is shared by the web server's threads, so
+	it takes a lock.
+	"""
+	def __init__(self, maxsize=4096):
+		self.maxsize = maxsize
+		self.entries = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.lock = threading.Lock()
+
+
+	def __len__(self):
+		return len(self.entries)
+
+
+	@staticmethod
+	def normalize(description):
+		"""
+		the cache key for a description
+		"""
+		return ' '.join(description.split())
+
+
+	def get(self, key):
+		"""
+		returns a copy of the cached Ingredient for the normalized description key, or None
+		"""
+		with self.lock:
+			ingredient = self.entries.pop(key, None)
+			if ingredient is None:
+				self.misses += 1
+				return None
+			self.entries[key] = ingredient		# re-insert to mark as most recently used
+			self.hits += 1
+		# the private copy is never modified, so it can be copied outside the lock
+		return self.copy(ingredient)
+
+
+	def put(self, key, ingredient):
+		"""
+		stores a private copy of ingredient under the normalized description key, evicting the least
+		recently used entries if the cache is full
+		"""
+		if self.maxsize <= 0: return
+		ingredient = self.copy(ingredient)
+		with self.lock:
+			self.entries.pop(key, None)
+			self.entries[key] = ingredient
+			self.trim()
+
+
+	def copy(self, ingredient):
+		return ingredient.copy()
+
+
+	def trim(self):
+		"""
+		evicts the least recently used entries until the cache fits in maxsize -- called with the lock held
+		"""
+		while len(self.entries) > max(self.maxsize, 0):
+			self.entries.popitem(last=False)
+			self.evictions += 1
+
+
+	def resize(self, maxsize):
+		"""
+		changes the size limit of the cache, evicting entries if it shrinks
+		"""
+		with self.lock:
+			self.maxsize = maxsize
+			self.trim()
+
+
+	def clear(self):
+		"""
+		drops every entry (e.g. when the lexicon changes and cached types are stale). Counters are kept.
+		"""
+		with self.lock:
+			self.entries.clear()
+
+
+	def stats(self):
+		"""
+		returns the hit, miss and eviction counters along with the current size of the cache
+		"""
+		with self.lock:
+			return {
+				'size': len(self.entries),
+				'maxsize': self.maxsize,
+				'hits': self.hits,
+				'misses': self.misses,
+				'evictions': self.evictions
+			}
+
+
+ingredient_cache = IngredientCache()
+
+
+# NLTK's pos_tag builds (and unpickles) a new PerceptronTagger on every call -- we load it once and share it.
+# nltk itself takes a long time to import, so it is only imported once a line is tokenized or tagged
+tagger = None
+tokenizer = None
+
+
+def load_tagger():
+	"""
+	returns the shared part of speech tagger, loading it on first use
+	"""
+	global tagger
+	if tagger is None:
+		from nltk.tag.perceptron import PerceptronTagger
+		tagger = PerceptronTagger()
+	return tagger
+
+
+def word_tokenize(text):
+	"""
+	splits text into words, like nltk.word_tokenize -- the words are interned (see intern_token)
+	"""
+	global tokenizer
+	if tokenizer is None:
+		from nltk import word_tokenize as tokenizer
+	return [intern_token(word) for word in tokenizer(text)]
+
+
+@tracing.traced()
+def pos_tag(tokens):
+	"""
+	tags a list of tokens with their parts of speech, like nltk.pos_tag
+	"""
+	return load_tagger().tag(tokens)
+
+
+@tracing.traced('pos_tag')
+def pos_tag_sents(sentences):
+	"""
+	tags every list of tokens in sentences, like nltk.pos_tag_sents
+	"""
+	shared = load_tagger()
+	return [shared.tag(tokens) for tokens in sentences]
+
+
+def parse_ingredient(description):
+	"""
+	returns an Ingredient for the description, served from the ingredient_cache when it was parsed before
+	"""
+	return parse_ingredients([description])[0]
+
+
+def parse_ingredients(descriptions):
+	"""
+	builds an Ingredient object for every description. Descriptions found in the ingredient_cache are copied
+	from it; the rest are tagged in a single pos_tag_sents call.
+	"""
+	keys = [ingredient_cache.normalize(description) for description in descriptions]
+	ingredients = [ingredient_cache.get(key) for key in keys]
+
+	missing = sorted(set(key for key, ingredient in zip(keys, ingredients) if ingredient is None))
+	if missing:
+		tagged = pos_tag_sents([word_tokenize(key) for key in missing])
+		parsed = dict((key, Ingredient(key, description_tagged)) for key, description_tagged in zip(missing, tagged))
+		for key in missing:
+			ingredient_cache.put(key, parsed[key])
+		ingredients = [ingredient if ingredient is not None else parsed[key].copy() for key, ingredient in zip(keys, ingredients)]
+
+	return ingredients
 
 
 class Instruction(object):
@@ -311,13 +554,59 @@ class Instruction(object):
 	Represents an instruction to produce the Recipe. Each instruction has a set of tools used for cooking and set of 
 	methods also used for cooking. There is a time field to denote the amount of time the instruction takes to complete.
 	"""
+	# no per instance __dict__ -- see Ingredient
+	__slots__ = ('instruction', 'words', 'ingredients', 'derived')
+
 	def __init__(self, instruction):
 		self.instruction = instruction
-		self.instruction_words = word_tokenize(self.instruction)
-		self.cooking_tools = self.find_tools(self.instruction_words)
-		self.cooking_methods = self.find_methods(self.instruction_words)
-		self.time = self.find_time(self.instruction_words)
+		self.words = tuple(word_tokenize(self.instruction))		# see instruction_words
 		self.ingredients = None
+		self.derived = None					# (words, tools, methods, time) -- see derive()
+
+
+	@property
+	def instruction_words(self):
+		"""
+		the words of the instruction, as a list that can be edited in place. Until they are first asked for, the
+		words are kept as a tuple, which derive() also keys its cache with, so an instruction that is never edited
+		holds one sequence of words instead of two. Code that only reads the words reads self.words (a tuple or a
+		list) instead, so they stay a tuple.
+		"""
+		if type(self.words) is tuple:
+			self.words = list(self.words)
+		return self.words
+
+
+	@instruction_words.setter
+	def instruction_words(self, words):
+		self.words = words
+
+
+	@property
+	def cooking_tools(self):
+		return self.derive()[1]
+
+
+	@property
+	def cooking_methods(self):
+		return self.derive()[2]
+
+
+	@property
+	def time(self):
+		return self.derive()[3]
+
+
+	def derive(self):
+		"""
+		finds the cooking tools, cooking methods and time of the instruction from its words the first time any of
+		them is read, and caches them along with the words they were found in. The cache is thrown away as soon as
+		instruction_words no longer matches those words (or update_instruction runs).
+		"""
+		words = self.words if type(self.words) is tuple else tuple(self.words)
+		if self.derived is None or self.derived[0] != words:
+			self.derived = (words, self.find_tools(words), self.find_methods(words), self.find_time(words))
+		return self.derived
 
 
 	def find_tools(self, instruction_words):
@@ -327,7 +616,7 @@ class Instruction(object):
 		"""
 		cooking_tools = []
 		for word in instruction_words:
-			if re.search(tool_indicator_regex, word, flags=re.I):
+			if tool_indicator_pattern.search(word):
 				cooking_tools.append(word)
 		wordset = set(cooking_tools)
 		return [item for item in wordset if item.istitle() or item.title() not in wordset]
@@ -340,9 +629,9 @@ class Instruction(object):
 		"""
 		cooking_methods = []
 		for word in instruction_words:
-			if re.search(method_indicator_regex, word, flags=re.I):
+			if method_indicator_pattern.search(word):
 				cooking_methods.append(word)
-			if re.search('preheat', word, re.I):
+			if preheat_pattern.search(word):
 				cooking_methods.append('bake')
 
 		wordset = set(cooking_methods)
@@ -359,9 +648,9 @@ class Instruction(object):
 			# if we are talking about degrees, then extracting numbers are not associated with time
 			if word == 'degrees': return 0
 			
-			if re.search(time_indicator_regex, word, flags=re.I):
+			if time_indicator_pattern.search(word):
 				try:
-					if re.search('(hour)', word, flags=re.I):
+					if hour_pattern.search(word):
 						time += int(instruction[i-1]) * 60
 					else:
 						time += int(instruction[i-1])
@@ -374,31 +663,119 @@ class Instruction(object):
 		"""
 		Uses the instances word list to update the objects instruction attribute
 		"""
-		self.instruction = ' '.join(self.instruction_words)
+		self.instruction = ' '.join(self.words)
+		self.derived = None
+
+
+	def copy(self):
+		"""
+		returns a copy of the Instruction that can be modified without affecting this one
+		"""
+		instruction = self.__class__.__new__(self.__class__)
+		instruction.instruction = self.instruction
+		instruction.words = self.words if type(self.words) is tuple else list(self.words)		# tuples can be shared
+		instruction.ingredients = list(self.ingredients) if self.ingredients is not None else None
+		instruction.derived = None
+		return instruction
+
+
+class RecipeSnapshot(object):
+	"""
+	Immutable record of a Recipe's state, used to keep the original recipe around for compare_to_original and
+	to_JSON(original=True). Instead of deep copying the recipe, the snapshot shares the recipe's Ingredient and
+	Instruction objects (its lists are stored as tuples). The Recipe copies an ingredient or instruction before
+	it changes it in place (see Recipe.writable_ingredient and Recipe.writable_instruction), so the objects
+	the snapshot holds never change.
+	"""
+	def __init__(self, recipe):
+		for key, value in recipe.__dict__.items():
+			if key in ('original_recipe', 'generator'): continue
+			object.__setattr__(self, key, tuple(value) if isinstance(value, list) else value)
+		self.index()
+
+
+	def index(self):
+		"""
+		records the identity of every shared Ingredient and Instruction object
+		"""
+		shared = dict((id(obj), obj) for obj in self.ingredients + self.instructions)
+		object.__setattr__(self, 'shared', shared)
+
+
+	def __setattr__(self, key, value):
+		raise AttributeError('the original recipe is read-only')
+
+
+	def __delattr__(self, key):
+		raise AttributeError('the original recipe is read-only')
+
+
+	def __deepcopy__(self, memo):
+		snapshot = RecipeSnapshot.__new__(RecipeSnapshot)
+		memo[id(self)] = snapshot
+		for key, value in self.__dict__.items():
+			if key == 'shared': continue
+			object.__setattr__(snapshot, key, copy.deepcopy(value, memo))
+		snapshot.index()
+		return snapshot
+
+
+	@property
+	def original_recipe(self):
+		return self
+
+
+	def is_shared(self, obj):
+		"""
+		True if obj is one of the Ingredient or Instruction objects held by the snapshot
+		"""
+		return self.shared.get(id(obj)) is obj
+
+
+	def to_JSON(self, original=False):
+		"""
+		convert representation to easily parseable JSON format
+		"""
+		return json.dumps(recipe_record(self), indent=4)
 
 
 class Recipe(object):
 	"""
 	Used to represent a recipe. Data for each recipe can be found 
-	on AllRecipes.com. 
+	on AllRecipes.com. The transformations draw their random choices from the recipe's own rng, so a recipe
+	built (or transformed) with the same seed is always transformed the same way.
 	"""
-	def __init__(self, **kwargs):
+	# set while Recipe.transform runs a pipeline -- ingredient links are not updated until the whole pipeline
+	# is done
+	deferred = False
+
+	@tracing.traced('Recipe')
+	def __init__(self, seed=None, **kwargs):
 		for key, value in kwargs.items():
 			setattr(self, key, value)
+		self.seed = seed				# seed None --> the rng is seeded from the system, like the random module
+		self.generator = None			# created by the rng property when a transformation first needs it
 
-		self.text_instructions = self.instructions;		# store the original instructions, 
-														# idea for right now is to modify the original instructions for transformations
-		self.ingredients = [Ingredient(ing) for ing in self.ingredients]		# store ingredients in Ingredient objects
+		self.ingredients = parse_ingredients(self.ingredients)				# store ingredients in Ingredient objects
 		self.instructions = [Instruction(inst) for inst in self.instructions]	# store instructions in Instruction objects
 		self.cooking_tools, self.cooking_methods  = self.parse_instructions()	# get aggregate tools and methods apparent in all instructions
 		self.update_instructions()			# as part of the steps requirement, add the associated ingredients to each instruction step
 
 
 		self.instructions = [i for i in self.instructions if len(i.instruction)]
-		# save original copy to compare with the transformations
-		self.original_recipe = copy.deepcopy(self)
+		# save original state to compare with the transformations -- shares the ingredients and instructions
+		# until a transformation changes them
+		self.original_recipe = RecipeSnapshot(self)
 	
 
+	@property
+	def text_instructions(self):
+		"""
+		the text of the original instructions -- read from the original recipe instead of keeping a copy of it
+		"""
+		return [instruction.instruction for instruction in self.original_recipe.instructions]
+
+
 	def parse_instructions(self):
 		"""
 		Gathers aggregate data from all instructions to provide overall cooking tools and methods instead of 
@@ -415,45 +792,107 @@ class Recipe(object):
 	def update_instructions(self):
 		"""
 		To convert instructions into steps, we need to store the associated ingredients as part an attribute for 
-		each instruction. This method does that update
+		each instruction. This method does that update. All ingredient names are found in one scan of each
+		instruction by an Aho-Corasick automaton. Inside a transform pipeline this is postponed until the pipeline
+		is done.
 		"""
+		if self.deferred: return
+
+		names = set(ingredient.name for ingredient in self.ingredients)
+		automaton = AhoCorasick(names)
 		for i, instruction in enumerate(self.instructions):
-			ingredients = [ingredient.name for ingredient in self.ingredients if instruction.instruction.find(ingredient.name) >= 0]
-			self.instructions[i].ingredients = list(set(ingredients))
+			mentions = automaton.findall(instruction.instruction)
+			ingredients = set(name for start, end, name in mentions)
+			if '' in names: ingredients.add('')		# an empty name is found in every instruction
 
+			if instruction.ingredients is None or set(instruction.ingredients) != ingredients:
+				instruction = self.writable_instruction(i)
+				instruction.ingredients = list(ingredients)
 
-	def to_JSON(self, original=False):
+
+	@tracing.traced()
+	def transform(self, transformations, seed=None):
 		"""
-		convert representation to easily parseable JSON format
+		applies an ordered list of transformations to the recipe. Each transformation is the name of one of the
+		TRANSFORMATIONS, optionally with its parameter -- i.e. 'to_vegan', ('to_method', 'bake') or 'to_style(Thai)'.
+		The instructions are edited in place by every step, and their ingredient links are found once at the end
+		instead of after every step. If a seed is given, the recipe's rng is reseeded with it first.
 		"""
-		data = OrderedDict()
-		if original: self = self.original_recipe
-		data['name'] = self.name
-		data['url'] = self.url
-		data['cooking tools'] = self.cooking_tools
-		data['cooking method'] = self.cooking_methods
-		ing_list = []
-		for ingredient in self.ingredients:
-			ing_attrs = {}
-			for attr, value in ingredient.__dict__.iteritems():
-				ing_attrs[attr] = value
-			ing_list.append(ing_attrs)
+		steps = [parse_transformation(transformation) for transformation in transformations]
+		if seed is not None: self.seed, self.generator = seed, None
+
+		self.deferred = True
+		try:
+			for name, parameter in steps:
+				with tracing.span(name, parameter=parameter):
+					if parameter is None:
+						getattr(self, name)()
+					else:
+						getattr(self, name)(parameter)
+		finally:
+			self.deferred = False
+			self.update_instructions()
+		return self
+
+
+	def fork(self, seed=None):
+		"""
+		returns a new Recipe in the state of the original recipe, without parsing it again. Like the recipe it
+		was forked from, it shares the original's Ingredient and Instruction objects until a transformation
+		changes them, so one parsed recipe can be transformed many different ways. The fork has its own rng,
+		seeded with seed, or else with the seed the recipe was built with.
+		"""
+		recipe = Recipe.__new__(Recipe)
+		for key, value in self.original_recipe.__dict__.items():
+			if key == 'shared': continue
+			recipe.__dict__[key] = list(value) if isinstance(value, tuple) else value
+		if seed is not None: recipe.seed = seed
+		recipe.generator = None
+		recipe.original_recipe = self.original_recipe
+		return recipe
+
+
+	@property
+	def rng(self):
+		"""
+		the random.Random the transformations draw from, seeded with self.seed
+		"""
+		if self.generator is None:
+			self.generator = random.Random(self.seed)
+		return self.generator
 
-		data['ingredients'] = ing_list
 
-		inst_list = []
-		for instruction in self.instructions:
-			inst_attrs = {}
-			include = True
-			for attr, value in instruction.__dict__.iteritems():
-				if attr == 'instruction_words': continue
-				if attr == 'instruction' and len(value) == 0: include = False
-				inst_attrs[attr] = value
-			if include: inst_list.append(inst_attrs)
+	def writable_ingredient(self, i):
+		"""
+		returns self.ingredients[i] for modification in place. If the ingredient is still shared with the
+		original recipe, it is replaced by a copy first so the original is left untouched.
+		"""
+		ingredient = self.ingredients[i]
+		if 'original_recipe' in self.__dict__ and self.original_recipe.is_shared(ingredient):
+			ingredient = ingredient.copy()
+			self.ingredients[i] = ingredient
+		return ingredient
 
-		data['steps'] = inst_list
-		parsed = json.dumps(data, indent=4)
-		return parsed
+
+	def writable_instruction(self, i):
+		"""
+		returns self.instructions[i] for modification in place. If the instruction is still shared with the
+		original recipe, it is replaced by a copy first so the original is left untouched.
+		"""
+		instruction = self.instructions[i]
+		if 'original_recipe' in self.__dict__ and self.original_recipe.is_shared(instruction):
+			instruction = instruction.copy()
+			self.instructions[i] = instruction
+		return instruction
+
+
+	@tracing.traced()
+	def to_JSON(self, original=False):
+		"""
+		convert representation to easily parseable JSON format
+		"""
+		if original: self = self.original_recipe
+		return json.dumps(recipe_record(self), indent=4)
 
 
 	def print_pretty(self):
@@ -485,7 +924,7 @@ class Recipe(object):
 			s += full_ing
 
 		s += '\nInstructions:'
-		for i, t_inst in enumerate(self.text_instructions[:-1]):
+		for i, t_inst in enumerate(self.text_instructions):
 			s += textwrap.fill('{}. {}'.format(i+1, t_inst), 80)
 		return s
 
@@ -523,12 +962,14 @@ class Recipe(object):
 		"""
 		Transforms the recipe to a more healthy version by removing and/or replacing unhealthy ingredients
 		"""
-		for i, ingredient in enumerate(self.ingredients):
+		swaps = []
+		for ingredient in self.ingredients:
 			if any(name in ingredient.name.split(' ') for name in healthy_substitutes.keys()):
 				key = next(name for name in ingredient.name.split(' ') if name in healthy_substitutes.keys())
-				healthy_sub = Ingredient(healthy_substitutes[key])
+				healthy_sub = parse_ingredient(healthy_substitutes[key])
 				healthy_sub.quantity = ingredient.quantity
-				self.swap_ingredients(self.ingredients[i], healthy_sub)
+				swaps.append((ingredient, healthy_sub))
+		self.swap_many(swaps)
 		
 		self.name = self.name + ' (healthy)'
 
@@ -538,15 +979,17 @@ class Recipe(object):
 		Transforms the recipe to a less healthy (more delicous) version by adding unhealthy ingredients and/or replacing 
 		healthy ingredients with unhealthy ingredients from the global unhealthy_substitutes list
 		"""
-		for i, ingredient in enumerate(self.ingredients):
+		swaps = []
+		for ingredient in self.ingredients:
 			if ingredient.type == 'V':
 				candidates = filter(lambda sub: sub[1] == 'V', unhealthy_substitutes)
-				new_ingredient = Ingredient(random.choice(candidates)[0])
-				self.swap_ingredients(ingredient, new_ingredient)
+				new_ingredient = parse_ingredient(self.rng.choice(candidates)[0])
+				swaps.append((ingredient, new_ingredient))
 			if ingredient.type == 'M':
 				candidates = filter(lambda sub: sub[1] == 'M', unhealthy_substitutes)
-				new_ingredient = Ingredient(random.choice(candidates)[0])
-				self.swap_ingredients(ingredient, new_ingredient)
+				new_ingredient = parse_ingredient(self.rng.choice(candidates)[0])
+				swaps.append((ingredient, new_ingredient))
+		self.swap_many(swaps)
 
 
 		self.name = self.name + ' (unhealthy)'
@@ -560,12 +1003,14 @@ class Recipe(object):
 		self.to_vegetarian()
 
 		# add a random dairy from the dairy_substitutes dictionary
-		for i, ingredient in enumerate(self.ingredients):
+		swaps = []
+		for ingredient in self.ingredients:
 			if ingredient.type == 'D':
-				idx = random.randint(0, len(dairy_substitutes.keys()) - 1)
-				dairy_sub = Ingredient(dairy_substitutes[dairy_substitutes.keys()[idx]])
+				# sorted, so the choice for a seed doesn't depend on the dict's order
+				dairy_sub = parse_ingredient(dairy_substitutes[self.rng.choice(sorted(dairy_substitutes))])
 				dairy_sub.quantity = ingredient.quantity
-				self.swap_ingredients(self.ingredients[i], dairy_sub)
+				swaps.append((ingredient, dairy_sub))
+		self.swap_many(swaps)
 		
 		# update the name of the recipe
 		self.name = self.name.replace(' (vegetarian)', '') + ' (vegan)'
@@ -579,10 +1024,10 @@ class Recipe(object):
 		self.from_vegetarian()
 
 		# find random dairy
-		dairy = random.choice(dairy_list)
+		dairy = self.rng.choice(current_lexicon.get('dairy'))
 
 		# add it to the ingredients list
-		self.ingredients.append(Ingredient('3 cups of {}'.format(dairy)))
+		self.ingredients.append(parse_ingredient('3 cups of {}'.format(dairy)))
 
 		# create and add new instructions for making and inserting the dairy
 		
@@ -596,24 +1041,26 @@ class Recipe(object):
 		which substitute from the meat_substitutes list to use. 
 		"""
 
-		for i, ingredient in enumerate(self.ingredients):
+		swaps = []
+		for ingredient in self.ingredients:
 			if ingredient.type == 'M':
-				meat_sub = Ingredient(random.choice(meat_substitutes))
+				meat_sub = parse_ingredient(self.rng.choice(meat_substitutes))
 				meat_sub.quantity = ingredient.quantity
-				self.swap_ingredients(self.ingredients[i], meat_sub)
+				swaps.append((ingredient, meat_sub))
+		self.swap_many(swaps)
 		
 		self.name = self.name + ' (vegetarian)'
 
 
 	def from_vegetarian(self):
 		"""
-		Adds a random meat from the gloabl meat_list to the recipe, updates instructions and times
+		Adds a random meat from the lexicon to the recipe, updates instructions and times
 		accordingly
 		"""
 
-		# find a random meat from the meat_list to add
-		meat = random.choice(meat_list).encode('utf-8')
-		self.ingredients.append(Ingredient('3 cups of boiled {}'.format(meat)))
+		# find a random meat from the lexicon to add
+		meat = self.rng.choice(current_lexicon.get('meat')).encode('utf-8')
+		self.ingredients.append(parse_ingredient('3 cups of boiled {}'.format(meat)))
 
 
 		# update/add/build the necessary instructions
@@ -635,20 +1082,20 @@ class Recipe(object):
 	def to_pescatarian(self):
 		"""
 		Replaces meat with seafood ingredients. Uses a random integer generator to randomly choose
-		which substitute from the seafood_list to use. If no meat, then augment the recipe with a random 
+		which seafood from the lexicon to use. If no meat, then augment the recipe with a random 
 		seafood
 		"""
-		swapped = False
-		for i, ingredient in enumerate(self.ingredients):
+		swaps = []
+		for ingredient in self.ingredients:
 			if ingredient.type == 'M':
-				seafood_sub = Ingredient('3 cups of {}'.format(random.choice(seafood_list)))
+				seafood_sub = parse_ingredient('3 cups of {}'.format(self.rng.choice(current_lexicon.get('seafood'))))
 				seafood_sub.quantity = ingredient.quantity
-				self.swap_ingredients(self.ingredients[i], seafood_sub)
-				swapped = True
+				swaps.append((ingredient, seafood_sub))
+		self.swap_many(swaps)
 
-		if not swapped:
+		if not swaps:
 			# augment the recipe instead of swapping because no meats in the recipe
-			seafood_ing = Ingredient('3 cups of {}'.format(random.choice(seafood_list)))
+			seafood_ing = parse_ingredient('3 cups of {}'.format(self.rng.choice(current_lexicon.get('seafood'))))
 			self.ingredients.append(seafood_ing)
 
 			grill_seafood = 'Place the {} in a non-stick pan and fill the pan with oil.'.format(seafood_ing.name) \
@@ -671,120 +1118,54 @@ class Recipe(object):
 	def from_pescatarian(self):
 		"""
 		Replaces seafood with meat and vegetable ingredients. Uses a random integer generator to randomly choose
-		which substitute from the meat_list to use. If no seafood, then augment the recipe with a random 
+		which meat from the lexicon to use. If no seafood, then augment the recipe with a random 
 		meat/dairy/grain
 		"""
-		for i, ingredient in enumerate(self.ingredients):
+		swaps = []
+		for ingredient in self.ingredients:
 			if ingredient.type == 'P':
-				meat_sub = Ingredient(random.choice(meat_substitutes))
+				meat_sub = parse_ingredient(self.rng.choice(meat_substitutes))
 				meat_sub.quantity = ingredient.quantity
-				self.swap_ingredients(self.ingredients[i], meat_sub)
+				swaps.append((ingredient, meat_sub))
+		self.swap_many(swaps)
 		
 		self.name = self.name + ' (non-pescatarian)'
 
 
-	def to_style(self, style, threshold=1.0):
+	def to_style(self, style, threshold=1.0, rebuild=False):
 		"""
-		search all recipes for recipes pertaining to the 'style' parameter and builds frequency dictionary.
-		Then adds/removes/augemnets ingredients to make it more like the 'style' of cuisine. 
+		uses the stored profile of recipes pertaining to the 'style' parameter (see build_style_profile) to
+		add/remove/augment ingredients to make it more like the 'style' of cuisine. The profile is built and stored
+		the first time a style is used; pass rebuild=True to build it again from the current search results.
 		"""
-
-		url = 'https://www.allrecipes.com/search/results/?wt={}&sort=re'.format(style)
-
-		# retrieve data from url
-		result = requests.get(url, timeout=10)
-		c = result.content
-
-		# store in BeautifulSoup object to parse HTML DOM
-		soup = BeautifulSoup(c, "lxml")
-
-		# find all urls that point to recipe pages 
-		style_recipes = [urlparse(url['href']) for url in soup.find_all('a', href=True)]	# find all urls in HTML DOM
-		style_recipes = [r.geturl() for r in style_recipes if r.path[1:8] == 'recipe/']		# filter out noise urls 
-		style_recipes = list(set(style_recipes))											# don't double count urls 
-
-		# parse the urls and create new Recipe objects
-		style_recipes = [Recipe(**parse_url(recipe)) for recipe in style_recipes]	# instantiate all recipe objects for each found recipe
-		# print ('found {} recipes cooked {} style'.format(len(style_recipes), style))
-
-		# unpack all ingredients in total set of new recipes of type 'style'
-		ingredients_ = [recipe.ingredients for recipe in style_recipes]
-		ingredients = []
-		for ingredient in ingredients_:
-			ingredients.extend(ingredient)
-		
-		# hold reference to just the ingredient names for frequency distrobutions
-		ingredient_names = [ingredient.name for ingredient in ingredients]
+		profile = get_style_profile(style, rebuild=rebuild)
 
 		# hold reference to ingredients from original recipe
 		current_ingredient_names = [ingredient.name for ingredient in self.ingredients]
-		# print ('current ingredients from original recipe are {}'.format(current_ingredient_names))
-
-		# extract only the names and not the freqs -- will be sorted in decreasing order
-		key_new_ingredients = [freq[0] for freq in self.freq_dist(ingredient_names)]
-		# remove the ingredients that are already in there
-		key_new_ingredients = [ingredient for ingredient in key_new_ingredients if not(ingredient in current_ingredient_names)][:10]
-		# print ('key ingredients from {} recipes found are {}'.format(style, key_new_ingredients))
 
+		# the profile is ranked by frequency -- keep the 10 most common ingredients that are not already in there
+		key_new_ingredients = [entry for entry in profile['ingredients'] if not(entry['name'] in current_ingredient_names)][:10]
 
-		# get the whole ingredient objects -- this is to change actions accorgingly
+		# get the whole ingredient objects (in the order they were first seen in the style's recipes) -- this is to change actions accorgingly
 		# e.g. if we switch from pinches of salt to lemon, we need to change pinches to squeezes
-		ingredient_changes = [ingredient for ingredient in ingredients if (ingredient.name in key_new_ingredients) and not(ingredient.name in current_ingredient_names)]
-		
-		# clear up some memory
-		del ingredients_
-		del ingredients
-		del ingredient_names
-		del style_recipes
-		del soup
-
-
-		tmp = []
-		new = []
-		for ingredient in ingredient_changes:
-			if ingredient.name in tmp: continue
-			tmp.append(ingredient.name)
-			new.append(ingredient)
-
-		ingredient_changes = copy.deepcopy(new)
-		
-		# no longer needed --> temporary use
-		del new
-		del tmp
-
+		ingredient_changes = [Ingredient.from_dict(entry) for entry in sorted(key_new_ingredients, key=itemgetter('first'))]
 
 		# Find out most common ingredients from all recipes of type 'style' -- then decide which to switch and/or add to current recipe
-		try: most_common_sauce = next(ingredient for ingredient in ingredient_changes if ingredient.type == 'S')
-		except StopIteration: most_comon_sauce = None 
-		try: most_common_meat = next(ingredient for ingredient in ingredient_changes if ingredient.type == 'M')
-		except StopIteration: most_common_meat = None
-		try: most_common_vegetable = next(ingredient for ingredient in ingredient_changes if ingredient.type == 'V')
-		except StopIteration: most_common_vegetable = None
-		try: most_common_grain = next(ingredient for ingredient in ingredient_changes if ingredient.type == 'G')
-		except StopIteration: most_common_grain = None
-		try: most_common_dairy = next(ingredient for ingredient in ingredient_changes if ingredient.type == 'D')
-		except StopIteration: most_common_dairy = None
-		try: most_common_herb = next(ingredient for ingredient in ingredient_changes if ingredient.type == 'H')
-		except StopIteration: most_common_herb = None
-		try: most_common_fruit = next(ingredient for ingredient in ingredient_changes if ingredient.type == 'F')
-		except StopIteration: most_common_fruit = None
-		
+		most_common = {}
+		for ingredient in ingredient_changes:
+			if not ingredient.type in most_common:
+				most_common[ingredient.type] = ingredient
 
 		# switch the ingredients
-		most_commons = filter(lambda mc: mc != None, 
-					[most_common_meat, most_common_vegetable, most_common_sauce, most_common_grain, 
-					 most_common_herb, most_common_dairy, most_common_fruit])
-
-		try: most_commons = most_commons[:int(7*threshold)]
-		except: pass # this means we didnt find enough to choose -- just keep whole list b/c under threshold anyways
-
-		# print ('most commons {}'.format([m.name for m in most_commons]))
-
+		most_commons = [most_common[t] for t in ['M', 'V', 'S', 'G', 'H', 'D', 'F'] if t in most_common]
+		most_commons = most_commons[:int(7*threshold)]
 
+		swaps = []
 		for new_ingredient in most_commons:
 			try: current_ingredient = next(ingredient for ingredient in self.ingredients if ingredient.type == new_ingredient.type)
 			except StopIteration: continue
-			self.swap_ingredients(current_ingredient, new_ingredient)
+			swaps.append((current_ingredient, new_ingredient))
+		self.swap_many(swaps)
 
 		# update name
 		self.name = self.name + ' (' + style + ')'
@@ -828,13 +1209,13 @@ class Recipe(object):
 			# add flour if there is no flour in the recipe already 
 			flour = [ingredient for ingredient in self.ingredients if 'flour' in ingredient.name.lower().split(' ')]
 			if not len(flour):
-				self.ingredients.append(Ingredient('1 1/2 cups of flour'))
+				self.ingredients.append(parse_ingredient('1 1/2 cups of flour'))
 			
 
 			# add oil if there is no oil in the recipe already
 			oil = [ingredient for ingredient in self.ingredients if 'oil' in ingredient.name.lower().split(' ')]
 			if not len(flour):
-				self.ingredients.append(Ingredient('2 quarts of vegetable oil'))
+				self.ingredients.append(parse_ingredient('2 quarts of vegetable oil'))
 
 
 			# find if there are vegetables
@@ -846,7 +1227,7 @@ class Recipe(object):
 			if not len(meats):
 				if not len(vegetables):
 					# add meat if there is no meat or vegetables in the recipe
-					meat = Ingredient('10 ounces of {}'.format(random.choice(meat_list)))
+					meat = parse_ingredient('10 ounces of {}'.format(self.rng.choice(current_lexicon.get('meat'))))
 					self.ingredients.append(meat)
 					M = True
 				else: 
@@ -861,15 +1242,7 @@ class Recipe(object):
 				self.instructions = self.instructions[1:]
 
 			# remove / update all instructions that correlated to previous cooking methods
-			other_method_regex = '(' + '|'.join(w[0] for w in replacements['to_fry']) + ')'
-			for i, instruction in enumerate(self.instructions):
-				inst = ' ' + instruction.instruction.lower()
-				if re.search(other_method_regex, inst, flags=re.I):
-					other_words = replacements['to_fry'] 
-					for word in other_words:
-						if inst.find(word[0]):
-							inst = inst.replace(word[0], word[1])
-							self.instructions[i] = Instruction(inst.strip())	# update instruction object in memory --> make permanent 
+			self.replace_method_words(replacements['to_fry'])
 
 
 
@@ -910,31 +1283,23 @@ class Recipe(object):
 
 			if len(vegetables) < 5:
 				for _ in range(5 - len(vegetables)):
-					try: self.ingredients.append(Ingredient('{} cups of {}'.format(random.randint(1,4), random.choice(vegetable_list))))
+					try: self.ingredients.append(parse_ingredient('{} cups of {}'.format(self.rng.randint(1,4), self.rng.choice(current_lexicon.get('vegetable')))))
 					except: pass
 			# update after the additions
 			vegetables = [ingredient for ingredient in self.ingredients if ingredient.type == 'V']
 
 			# add sesame oil and soy sauce to stirfry the vegetables
-			self.ingredients.append(Ingredient('1 tablespoon of sesame oil'))
-			self.ingredients.append(Ingredient('2 tablespoons of soy sauce'))
+			self.ingredients.append(parse_ingredient('1 tablespoon of sesame oil'))
+			self.ingredients.append(parse_ingredient('2 tablespoons of soy sauce'))
 
 			# add rice
-			self.ingredients.append(Ingredient('1 1/2 cups of uncooked rice'))
+			self.ingredients.append(parse_ingredient('1 1/2 cups of uncooked rice'))
 
 			if re.search('Preheat oven to', self.instructions[0].instruction):
 				self.instructions = self.instructions[1:]
 
 			# remove / update all instructions that correlated to previous cooking methods
-			other_method_regex = '(' + '|'.join(w[0] for w in replacements['to_stir-fry']) + ')'
-			for i, instruction in enumerate(self.instructions):
-				inst = ' ' + instruction.instruction.lower()
-				if re.search(other_method_regex, inst, flags=re.I):
-					other_words = replacements['to_stir-fry'] 
-					for word in other_words:
-						if inst.find(word[0]):
-							inst = inst.replace(word[0], word[1])
-							self.instructions[i] = Instruction(inst.strip()) 	# update instruction object in memory --> make permanent 
+			self.replace_method_words(replacements['to_stir-fry'])
 
 			
 			instruction_rice = 'Heat 4 quarts of water to a boil and then place the rice in and let it cook for 8 minutes'
@@ -970,27 +1335,22 @@ class Recipe(object):
 
 			bake_instruction_idx = 1
 
-			for instruction in self.instructions:
-				words = instruction.instruction_words
+			for n, instruction in enumerate(self.instructions):
+				words = instruction.words
+				edited = False
 				for i, w in enumerate(words):
 
 					# do all stir-fry recipes use skillets?
 					if re.search('skillet', w, flags=re.I):
-						instruction.instruction_words[i] = 'pan'
+						self.writable_instruction(n).instruction_words[i] = 'pan'
 						bake_instruction_idx = i
+						edited = True
+				if edited: self.instructions[n].update_instruction()
 
 
 
 			# remove / update all instructions that correlated to previous cooking methods
-			other_method_regex = '(' + '|'.join(w[0] for w in replacements['to_bake']) + ')'
-			for i, instruction in enumerate(self.instructions):
-				inst = ' ' + instruction.instruction.lower()
-				if re.search(other_method_regex, inst, flags=re.I):
-					other_words = replacements['to_bake'] 
-					for word in other_words:
-						if inst.find(word[0]):
-							inst = inst.replace(word[0], word[1])
-							self.instructions[i] = Instruction(inst.strip()) 	# update instruction object in memory --> make permanent 
+			self.replace_method_words(replacements['to_bake'])
 
 
 
@@ -1005,6 +1365,47 @@ class Recipe(object):
 		self.name = self.name + ' (' + method + ')'
 
 
+	def replace_method_words(self, replacements):
+		"""
+		rewrites every instruction that mentions a word of the previous cooking method, using the list of
+		(old, new) replacements from to_method. The replacements are made in order on the words of the
+		instruction -- a one word old is replaced wherever it is part of a word, a longer one where its words
+		appear in a row -- and each changed instruction is updated once, after all of its replacements are made.
+		"""
+		other_method_pattern = re.compile('|'.join(re.escape(old) for old, new in replacements), flags=re.I)
+		for i, instruction in enumerate(self.instructions):
+			if not other_method_pattern.search(instruction.instruction): continue
+
+			words = list(instruction.words)
+			for old, new in replacements:
+				words = self.replace_words(words, old, new)
+			if words != list(instruction.words):
+				instruction = self.writable_instruction(i)
+				instruction.instruction_words = words
+				instruction.update_instruction()
+
+
+	def replace_words(self, words, old, new):
+		"""
+		returns the list of words with old replaced by new (see replace_method_words). The words that are
+		replaced are lower cased, and those that become empty are dropped.
+		"""
+		old_words = old.split(' ')
+		replaced = []
+		j = 0
+		while j < len(words):
+			if len(old_words) == 1 and old in words[j].lower():
+				replaced.extend(intern_token(word) for word in words[j].lower().replace(old, new).split(' ') if word)
+				j += 1
+			elif len(old_words) > 1 and [word.lower() for word in words[j:j+len(old_words)]] == old_words:
+				replaced.extend(intern_token(word) for word in new.split(' ') if word)
+				j += len(old_words)
+			else:
+				replaced.append(words[j])
+				j += 1
+		return replaced
+
+
 	def to_easy(self):
 		"""
 		makes recipes easier by replacing freshly made ingredients with store-bought, 
@@ -1012,20 +1413,22 @@ class Recipe(object):
 		"""		
 		for i, ingredient in enumerate(self.ingredients):
 			if 'freshly' in ingredient.descriptor:
+				ingredient = self.writable_ingredient(i)
 				ingredient.descriptor.remove('freshly')
 				ingredient.descriptor.append('store-bought')
 			if 'finely' in ingredient.descriptor:
+				ingredient = self.writable_ingredient(i)
 				ingredient.descriptor.remove('finely')
-			self.ingredients[i] = ingredient
 
 		cheeses = [ing for ing in self.ingredients if re.search('cheese', ing.name)]
 		if len(cheeses) > 1:
+			swaps = []
 			for i in range(1, len(cheeses)):
-				first_cheese = copy.deepcopy(cheeses[0])
+				first_cheese = cheeses[0].copy()
 				first_cheese.measurement = cheeses[i].measurement
 				first_cheese.quantity = cheeses[i].quantity
-				print cheeses[0].quantity
-				self.swap_ingredients(cheeses[i], first_cheese)
+				swaps.append((cheeses[i], first_cheese))
+			self.swap_many(swaps)
 
 
 	def freq_dist(self, data):
@@ -1043,23 +1446,262 @@ class Recipe(object):
 		replaces the current_ingredient with the new_ingredient. 
 		Updates the associated instructions, times, and ingredients. 
 		"""
+		self.swap_many([(current_ingredient, new_ingredient)])
+
+
+	def token_index(self):
+		"""
+		positional index of the instruction text: maps every word to the (instruction index, word position) of
+		each of its occurrences. A multi word name is found by looking up its first word and checking the words
+		that follow.
+		"""
+		index = defaultdict(list)
+		for i, instruction in enumerate(self.instructions):
+			for j, word in enumerate(instruction.words):
+				index[word].append((i, j))
+		return index
+
+
+	def swap_many(self, swaps):
+		"""
+		applies many (current_ingredient, new_ingredient) replacements at once: every ingredient named like a
+		current_ingredient is replaced in self.ingredients, and every mention of its name in the instructions is
+		replaced by the new name in one pass over the instructions. Replacements are made against the recipe as it
+		was before the call (they do not chain); if the same name is swapped twice, the first swap wins.
+		"""
+		replacements = OrderedDict()
+		for current_ingredient, new_ingredient in swaps:
+			if not current_ingredient.name in replacements:
+				replacements[current_ingredient.name] = new_ingredient
+		if not replacements: return
+
 		# (1) switch the ingredients in self.ingredients list
 		for i, ingredient in enumerate(self.ingredients):
-			if ingredient.name == current_ingredient.name:
-				self.ingredients[i] = new_ingredient
+			if ingredient.name in replacements:
+				self.ingredients[i] = replacements[ingredient.name]
+
+		# (2) find every mention of the replaced names in the instructions
+		index = self.token_index()
+		matches = defaultdict(list)			# instruction index --> (position, length, new words)
+		for name, new_ingredient in replacements.items():
+			words = tuple(name.split(' '))
+			for i, j in index.get(words[0], []):
+				if tuple(self.instructions[i].words[j:j+len(words)]) == words:
+					matches[i].append((j, len(words), new_ingredient.name.split(' ')))
+
+		# (3) update the instructions that mention them -- longest match wins where mentions overlap, and the
+		# words are replaced back to front so earlier positions stay valid
+		for i, found in matches.items():
+			found.sort(key=lambda match: (match[0], -match[1]))
+			chosen = []
+			for match in found:
+				if not chosen or match[0] >= chosen[-1][0] + chosen[-1][1]:
+					chosen.append(match)
+
+			instruction = self.writable_instruction(i)
+			for j, length, new_words in reversed(chosen):
+				instruction.instruction_words[j:j+length] = new_words
+			instruction.update_instruction()
 
-		# (2) update the instructions that mention it
-		name_length = len(current_ingredient.name.split(' '))
-		for i, instruction in enumerate(self.instructions):
-			for j in range(len(instruction.instruction_words) - name_length):
-				if current_ingredient.name == ' '.join(instruction.instruction_words[j:j+name_length]):
-					self.instructions[i].instruction_words[j] = new_ingredient.name
+		self.update_instructions()
+
+
+# transformations Recipe.transform can apply --> whether they take a parameter
+TRANSFORMATIONS = OrderedDict([
+	('to_vegan', False),
+	('from_vegan', False),
+	('to_vegetarian', False),
+	('from_vegetarian', False),
+	('to_pescatarian', False),
+	('from_pescatarian', False),
+	('to_healthy', False),
+	('from_healthy', False),
+	('to_style', True),
+	('to_method', True),
+	('to_easy', False)
+])
+
+
+def parse_transformation(transformation):
+	"""
+	normalizes a transformation to a (name, parameter) tuple. Accepts a name ('to_vegan'), a name with its
+	parameter in parentheses ('to_style(Thai)') or a (name, parameter) tuple. Raises ValueError for unknown
+	transformations or a missing parameter.
+	"""
+	if isinstance(transformation, (tuple, list)):
+		name, parameter = transformation[0], (transformation[1] if len(transformation) > 1 else None)
+	else:
+		match = re.match(r'^\s*(\w+)\s*(?:\((.*)\))?\s*$', transformation)
+		if not match:
+			raise ValueError('could not understand the transformation {}'.format(transformation))
+		name, parameter = match.group(1), match.group(2)
+
+	if not name in TRANSFORMATIONS:
+		raise ValueError('{} is not a supported transformation'.format(name))
+	if TRANSFORMATIONS[name] and not parameter:
+		raise ValueError('{} requires a parameter'.format(name))
+	if not TRANSFORMATIONS[name]:
+		parameter = None
+	return name, parameter
+
+
+class TransformCache(IngredientCache):
+	"""
+	Process wide LRU cache of transform_batch results -- the records of a transformed recipe and of its original
+	-- keyed by the canonical url, the transformations with their parameters, the seed and the lexicon version.
+	Only seeded jobs are cached, since only they always give the same result. Like the IngredientCache it keeps
+	private copies, hands out copies and takes a lock.
+	"""
+	def __init__(self, maxsize=1024):
+		IngredientCache.__init__(self, maxsize)
+
+
+	@staticmethod
+	def key(url, steps, seed):
+		"""
+		the cache key for a job -- a string, since parameters read from JSON need not be hashable
+		"""
+		version = current_lexicon.version if current_lexicon is not None else None
+		return json.dumps([fetch.canonical_url(url), steps, seed, version])
+
+
+	def copy(self, result):
+		return copy.deepcopy(result)
+
+
+transform_cache = TransformCache()
+
+
+def job_transformations(job):
+	"""
+	normalizes the transformations of a transform_batch job to (name, parameter) tuples. The job's
+	'transformations' are in any form parse_transformation accepts, and its optional 'parameters' map the name
+	of a transformation to its parameter, i.e. {"transformations": ["to_vegan", "to_style"], "parameters":
+	{"to_style": "Thai"}}.
+	"""
+	if not isinstance(job, dict): raise ValueError('a job must be an object')
+	for field in ('url', 'transformations'):
+		if not job.get(field): raise ValueError('a job needs its {}'.format(field))
+	transformations = job['transformations']
+	if isinstance(transformations, basestring):
+		transformations = [transformations]
+	parameters = job.get('parameters') or {}
+
+	steps = []
+	for transformation in transformations:
+		if isinstance(transformation, basestring) and transformation.strip() in parameters:
+			transformation = (transformation.strip(), parameters[transformation.strip()])
+		steps.append(parse_transformation(transformation))
+	return steps
+
+
+def job_seed(job):
+	"""
+	the seed of a transform_batch job -- an integer, or None to transform it differently every time
+	"""
+	seed = job.get('seed')
+	if seed is not None and (isinstance(seed, bool) or not isinstance(seed, (int, long))):
+		raise ValueError('a job\'s seed must be an integer')
+	return seed
+
+
+@tracing.traced()
+def transform_batch(jobs):
+	"""
+	runs a batch of transformation jobs -- dictionaries with a 'url', its 'transformations' and optionally
+	their 'parameters' (see job_transformations), a 'seed' and 'original' to also return the untransformed
+	recipe. Jobs for the same recipe (by canonical url) share one fetch and parse; every job transforms its own
+	Recipe.fork of it. Seeded jobs are served from the transform_cache when they were run before. Returns one
+	result per job, in order, each with either the transformed 'recipe' or the 'error' that job ran into.
+	"""
+	warm_up()
+	results = [None] * len(jobs)
+	groups = OrderedDict()		# canonical url --> [(job index, steps)]
+	keys = {}					# job index --> transform_cache key, for seeded jobs
+	for i, job in enumerate(jobs):
+		try:
+			steps = job_transformations(job)
+			if job_seed(job) is not None:
+				keys[i] = transform_cache.key(job['url'], steps, job['seed'])
+				cached = transform_cache.get(keys[i])
+				if cached is not None:
+					results[i] = batch_result(job, steps, *cached)
+					continue
+			groups.setdefault(fetch.canonical_url(job['url']), []).append((i, steps))
+		except Exception as e:
+			results[i] = {'url': job.get('url') if isinstance(job, dict) else None, 'error': str(e)}
+
+	pages = fetch.fetch_many(groups.keys(), return_errors=True)
+	for (url, group), page in zip(groups.items(), pages):
+		try:
+			if isinstance(page, Exception): raise page
+			recipe = Recipe(**extract_recipe(page, jobs[group[0][0]]['url']))
+		except Exception as e:
+			for i, steps in group:
+				results[i] = {'url': jobs[i]['url'], 'error': 'could not parse the recipe: {}'.format(e)}
+			continue
+
+		original = recipe_record(recipe.original_recipe)
+		for i, steps in group:
+			try:
+				transformed = recipe_record(recipe.fork(jobs[i].get('seed')).transform(steps))
+			except Exception as e:
+				results[i] = batch_result(jobs[i], steps, error=str(e) or type(e).__name__)
+				continue
+			if i in keys: transform_cache.put(keys[i], (transformed, original))
+			results[i] = batch_result(jobs[i], steps, transformed, original)
+	return results
+
+
+def batch_result(job, steps, transformed=None, original=None, error=None):
+	"""
+	the result of a transform_batch job -- its transformed recipe record or its error, and the original
+	recipe record if the job asked for it
+	"""
+	result = OrderedDict([('url', job['url']), ('transformations', [list(step) for step in steps])])
+	if error is None:
+		result['recipe'] = transformed
+	else:
+		result['error'] = error
+	if job.get('original'):
+		result['original'] = original
+	return result
+
+
+@tracing.traced()
+def recipe_record(recipe):
+	"""
+	builds the dictionary that Recipe.to_JSON serializes
+	"""
+	data = OrderedDict()
+	data['name'] = recipe.name
+	data['url'] = recipe.url
+	data['cooking tools'] = recipe.cooking_tools
+	data['cooking method'] = recipe.cooking_methods
+	ing_list = []
+	for ingredient in recipe.ingredients:
+		ing_attrs = {}
+		for attr in Ingredient.__slots__:
+			ing_attrs[attr] = getattr(ingredient, attr)
+		ing_list.append(ing_attrs)
+
+	data['ingredients'] = ing_list
+
+	inst_list = []
+	for instruction in recipe.instructions:
+		if len(instruction.instruction) == 0: continue
+		# tools, methods and time are derived on first access, so they are read explicitly
+		inst_attrs = {}
+		inst_attrs['instruction'] = instruction.instruction
+		inst_attrs['cooking_tools'] = instruction.cooking_tools
+		inst_attrs['cooking_methods'] = instruction.cooking_methods
+		inst_attrs['time'] = instruction.time
+		inst_attrs['ingredients'] = instruction.ingredients
+		inst_list.append(inst_attrs)
+
+	data['steps'] = inst_list
+	return data
 
-					# get rid of any extra words
-					for k in range(1, name_length):
-						self.instructions[i].instruction_words[j+k] == ''
-					self.instructions[i].update_instruction()
-									
 
 def remove_non_numerics(string): return re.sub('[^0-9]', '', string)
 
@@ -1090,47 +1732,118 @@ def parse_url(url):
 	}
 	"""
 	# retrieve data from url
-	result = requests.get(url, timeout=10)
-	c = result.content
+	with tracing.span('parse_url', url=url):
+		return extract_recipe(fetch.fetch(url), url)
+
+
+def itemprop_text(soup, tag, itemprop):
+	"""
+	returns the text of the tag with the given itemprop, raising a ValueError that names the itemprop if the
+	page does not have it
+	"""
+	element = soup.find(tag, {'itemprop': itemprop})
+	if element is None:
+		raise ValueError('recipe page has no {} itemprop'.format(itemprop))
+	return element.text.strip()
+
+
+# the parts of a time as AllRecipes.com writes it (i.e. 1 h 15 m)
+time_text_pattern = re.compile(r'(\d+)\s*(d|h|m)', re.I)
+TIME_UNIT_MINUTES = {'d': 24 * 60, 'h': 60, 'm': 1}
+
+
+def dom_minutes(soup, itemprop):
+	"""
+	returns the time with the given itemprop in minutes, the same way as the JSON-LD path does -- from the ISO 8601
+	duration in its datetime attribute (see json_ld_minutes), or else from its text. Missing times are 0.
+	"""
+	element = soup.find('time', {'itemprop': itemprop})
+	if element is None: return 0
+	if element.get('datetime'): return json_ld_minutes(element['datetime'])
+	text = element.text.strip()
+	parts = time_text_pattern.findall(text)
+	if not parts: return remove_non_numerics(text) or 0
+	return str(sum(int(number) * TIME_UNIT_MINUTES[unit.lower()] for number, unit in parts))
 
-	# store in BeautifulSoup object to parse HTML DOM
-	soup = BeautifulSoup(c, "lxml")
+
+@tracing.traced()
+def extract_recipe(c, url):
+	"""
+	builds the parse_url dictionary from the HTML of an AllRecipes.com recipe page that was already fetched.
+	Building the DOM of a whole page is by far the most expensive part, so the cheapest way that finds the
+	recipe is used:
+
+		1. the schema.org Recipe embedded as JSON-LD, which needs no HTML parsing at all
+		2. a DOM of only the itemprop tags and the ingredient and instruction spans (see recipe_tag)
+		3. the DOM of the whole page
+	"""
+	recipe_attrs = extract_json_ld(c)
+	if recipe_attrs is None:
+		from bs4 import BeautifulSoup, SoupStrainer
+		try:
+			with tracing.span('build_dom', strained=True):
+				soup = BeautifulSoup(c, "lxml", parse_only=SoupStrainer(recipe_tag))
+			recipe_attrs = extract_dom(soup)
+		except ValueError:
+			with tracing.span('build_dom', strained=False):
+				soup = BeautifulSoup(c, "lxml")
+			recipe_attrs = extract_dom(soup)
+	recipe_attrs['url'] = url
+
+	if DEBUG:
+		print ('recipe is called {name}'.format(**recipe_attrs))
+		print ('prep time is {preptime} minutes, cook time is {cooktime} minutes and total time is {totaltime} minutes'.format(**recipe_attrs))
+		print ('it has {} ingredients'.format(len(recipe_attrs['ingredients'])))
+		print ('it has {} instructions'.format(len(recipe_attrs['instructions'])))
+		print ('it has {calories} calories, {carbs} g of carbs, {fat} g of fat, {protien} g of protien, {cholesterol} mg of cholesterol, {sodium} mg of sodium'.format(**recipe_attrs))
+
+	return recipe_attrs
+
+
+# the class of the spans holding the ingredient and instruction lines
+RECIPE_SPAN_CLASSES = ('recipe-ingred_txt added', 'recipe-directions__list--item')
+
+
+def recipe_tag(name, attrs):
+	"""
+	SoupStrainer test for the tags extract_dom reads -- anything with an itemprop and the ingredient and
+	instruction spans. The attributes are still raw strings when the strainer sees them.
+	"""
+	return 'itemprop' in attrs or (name == 'span' and attrs.get('class') in RECIPE_SPAN_CLASSES)
 
 
+@tracing.traced()
+def extract_dom(soup):
+	"""
+	reads the recipe from the itemprop microdata and the ingredient and instruction spans of a parsed page,
+	raising a ValueError if a required itemprop is missing
+	"""
 	# find name 
-	name = soup.find('h1', {'itemprop': 'name'}).text
+	name = itemprop_text(soup, 'h1', 'name')
 	
 	# find relavent time information
 	# some recipes are missing some of the times 
-	try: preptime  = remove_non_numerics(soup.find('time', {'itemprop': 'prepTime'}).text)
+	try: preptime  = dom_minutes(soup, 'prepTime')
 	except: preptime = 0
-	try: cooktime  = remove_non_numerics(soup.find('time', {'itemprop': 'cookTime'}).text)
+	try: cooktime  = dom_minutes(soup, 'cookTime')
 	except: cooktime = 0
-	try: totaltime = remove_non_numerics(soup.find('time', {'itemprop': 'totalTime'}).text)
+	try: totaltime = dom_minutes(soup, 'totalTime')
 	except: totaltime = 0
 	
 	# find ingredients
-	ingredients = [i.text for i in soup.find_all('span', {'class': 'recipe-ingred_txt added'})]
+	ingredients = [i.text.strip() for i in soup.find_all('span', {'class': 'recipe-ingred_txt added'})]
 
 	# find instructions
-	instructions = [i.text for i in soup.find_all('span', {'class': 'recipe-directions__list--item'})] 
+	instructions = [i.text.strip() for i in soup.find_all('span', {'class': 'recipe-directions__list--item'})] 
 
 
 	# nutrition facts
-	calories = remove_non_numerics(soup.find('span', {'itemprop': 'calories'}).text)				
-	carbs = soup.find('span', {'itemprop': 'carbohydrateContent'}).text			    # measured in grams
-	fat = soup.find('span', {'itemprop': 'fatContent'}).text						# measured in grams
-	protien  = soup.find('span', {'itemprop': 'proteinContent'}).text			    # measured in grams
-	cholesterol  = soup.find('span', {'itemprop': 'cholesterolContent'}).text	    # measured in miligrams
-	sodium  = soup.find('span', {'itemprop': 'sodiumContent'}).text			        # measured in grams
-
-		
-	if DEBUG:
-		print ('recipe is called {}'.format(name))
-		print ('prep time is {} minutes, cook time is {} minutes and total time is {} minutes'.format(preptime, cooktime, totaltime))
-		print ('it has {} ingredients'.format(len(ingredients)))
-		print ('it has {} instructions'.format(len(instructions)))
-		print ('it has {} calories, {} g of carbs, {} g of fat, {} g of protien, {} mg of cholesterol, {} mg of sodium'.format(calories, carbs, fat, protien, cholesterol, sodium))
+	calories = remove_non_numerics(itemprop_text(soup, 'span', 'calories'))				
+	carbs = itemprop_text(soup, 'span', 'carbohydrateContent')			    # measured in grams
+	fat = itemprop_text(soup, 'span', 'fatContent')						# measured in grams
+	protien  = itemprop_text(soup, 'span', 'proteinContent')			    # measured in grams
+	cholesterol  = itemprop_text(soup, 'span', 'cholesterolContent')	    # measured in miligrams
+	sodium  = itemprop_text(soup, 'span', 'sodiumContent')			        # measured in grams
 
 
 	return {
@@ -1145,183 +1858,280 @@ def parse_url(url):
 			'fat': fat,
 			'protien': protien,
 			'cholesterol': cholesterol,
-			'sodium': sodium,
-			'url': url
+			'sodium': sodium
+			}
+
+
+# <script type="application/ld+json"> blocks -- found without parsing the rest of the page
+json_ld_pattern = re.compile(r'<script[^>]+type=["\']application/ld\+json["\'][^>]*>(.*?)</script>', re.I | re.S)
+duration_pattern = re.compile(r'^P(?:(\d+)D)?T?(?:(\d+)H)?(?:(\d+)M)?', re.I)
+html_parser = HTMLParser()
+
+
+@tracing.traced()
+def extract_json_ld(c):
+	"""
+	builds the parse_url dictionary (without the url) from the schema.org Recipe embedded in the page as
+	JSON-LD. Returns None if the page has none, or if it is missing any field that extract_dom requires, so
+	the caller can fall back to the page's microdata.
+	"""
+	for block in json_ld_pattern.findall(c):
+		try:
+			recipe = find_json_ld_recipe(json.loads(block))
+		except ValueError:
+			continue
+		if recipe is None: continue
+
+		nutrition = recipe.get('nutrition') or {}
+		fields = [recipe.get('name'), recipe.get('recipeIngredient'), recipe.get('recipeInstructions')]
+		fields += [nutrition.get(field) for field in ('calories', 'carbohydrateContent', 'fatContent', 'proteinContent', 'cholesterolContent', 'sodiumContent')]
+		if not all(fields): return None
+
+		return {
+			'name': json_ld_text(recipe['name']),
+			'preptime': json_ld_minutes(recipe.get('prepTime')),
+			'cooktime': json_ld_minutes(recipe.get('cookTime')),
+			'totaltime': json_ld_minutes(recipe.get('totalTime')),
+			'ingredients': [json_ld_text(line) for line in recipe['recipeIngredient']],
+			'instructions': json_ld_steps(recipe['recipeInstructions']),
+			'calories': remove_non_numerics(json_ld_text(nutrition['calories'])),
+			'carbs': json_ld_text(nutrition['carbohydrateContent']),
+			'fat': json_ld_text(nutrition['fatContent']),
+			'protien': json_ld_text(nutrition['proteinContent']),
+			'cholesterol': json_ld_text(nutrition['cholesterolContent']),
+			'sodium': json_ld_text(nutrition['sodiumContent'])
 			}
+	return None
+
+
+def find_json_ld_recipe(data):
+	"""
+	returns the first node with @type Recipe in a JSON-LD document (which can be a list of nodes or have
+	them in an @graph), or None
+	"""
+	if isinstance(data, list):
+		nodes = data
+	elif isinstance(data, dict):
+		node_type = data.get('@type')
+		if node_type == 'Recipe' or (isinstance(node_type, list) and 'Recipe' in node_type):
+			return data
+		nodes = data.get('@graph') or []
+	else:
+		return None
+
+	for node in nodes:
+		recipe = find_json_ld_recipe(node)
+		if recipe is not None: return recipe
+	return None
+
+
+def json_ld_text(value):
+	"""
+	JSON-LD strings can still hold HTML entities, which the DOM would have decoded
+	"""
+	return html_parser.unescape(unicode(value)).strip()
+
+
+def json_ld_minutes(duration):
+	"""
+	converts an ISO 8601 duration (i.e. PT1H15M) to minutes, as the numeric string the DOM path gives. Missing
+	times are 0, like in extract_dom.
+	"""
+	duration = (duration or '').strip()
+	match = duration_pattern.match(duration)
+	if not duration or not match or not any(match.groups()): return 0
+	days, hours, minutes = [int(group or 0) for group in match.groups()]
+	return str(days * 24 * 60 + hours * 60 + minutes)
+
+
+def json_ld_steps(instructions):
+	"""
+	flattens recipeInstructions -- a string, a list of strings or HowToSteps, or HowToSections of those --
+	into the instruction lines
+	"""
+	if isinstance(instructions, basestring):
+		return [json_ld_text(instructions)]
+	if isinstance(instructions, dict):
+		if 'itemListElement' in instructions:
+			return json_ld_steps(instructions['itemListElement'])
+		return [json_ld_text(instructions.get('text', ''))]
+
+	steps = []
+	for instruction in instructions:
+		steps.extend(json_ld_steps(instruction))
+	return steps
+
+
+def extract_ingredients(c):
+	"""
+	returns just the ingredient lines from the HTML of an AllRecipes.com recipe page, stripped like extract_dom
+	strips them. Only the ingredient spans are parsed into the DOM, which is much cheaper than building the whole
+	page like extract_recipe does.
+	"""
+	from bs4 import BeautifulSoup, SoupStrainer
+	ingredient_spans = SoupStrainer('span', {'class': 'recipe-ingred_txt added'})
+	soup = BeautifulSoup(c, "lxml", parse_only=ingredient_spans)
+	return [i.text.strip() for i in soup.find_all('span', {'class': 'recipe-ingred_txt added'})]
+
+
+def parse_recipe_ingredients(urls):
+	"""
+	lightweight alternative to building a Recipe for every url when only the ingredients are needed (style
+	profiles, bulk analytics over ingredients). Fetches the pages concurrently, extracts only the ingredient lines
+	and parses them all in one parse_ingredients batch -- the instructions are never parsed and no original
+	recipe snapshot is made. Returns a list of Ingredient objects per url.
+	"""
+	ingredient_lines = [extract_ingredients(page) for page in fetch.fetch_many(urls)]
+	ingredients = parse_ingredients([line for lines in ingredient_lines for line in lines])
+
+	recipes_ingredients = []
+	for lines in ingredient_lines:
+		recipes_ingredients.append(ingredients[:len(lines)])
+		ingredients = ingredients[len(lines):]
+	return recipes_ingredients
+
+
+@tracing.traced()
+def build_dynamic_lists(path=lexicon.DEFAULT_SNAPSHOT, refresh=False):
+	"""
+	loads the lexicon snapshot of known foods -- used to tag ingredients. Nothing is decoded here: a category
+	is decoded where it is first used (current_lexicon.get) and ingredient types are looked up in the mapped
+	snapshot, so pre-forked workers share the lexicon instead of each holding it as Python objects.
+	The snapshot is built once by `python lexicon.py build`; passing refresh=True scrapes the source websites
+	again and rewrites the snapshot before loading it.
+	"""
+	global current_lexicon
+
+	if refresh:
+		lexicon.write_snapshot(lexicon.scrape_lexicon(), path)
+
+	previous = current_lexicon
+	current_lexicon = lexicon.load_lexicon(path)
+
+	# cached ingredients were typed with the previous lexicon
+	ingredient_cache.clear()
+
+	# nothing refers to the previous snapshot any more, so its memory map can go
+	if previous is not None and previous is not current_lexicon:
+		previous.close()
+
 
+# style profiles are stored as <style>.json in this directory by build_style_profile
+STYLE_PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'styles')
 
-def build_dynamic_lists():
-	"""
-	fills the lists of known foods from websites -- used to tag ingredients 
-	"""
-	global vegetable_list
-	global sauce_list
-	global herbs_spice_list
-	global dairy_list
-	global meat_list
-	global grain_list
-	global fruit_list
-	global seafood_list
-
-	# build vegetable list
-	url = 'https://simple.wikipedia.org/wiki/List_of_vegetables'
-	result = requests.get(url, timeout=10)
-	c = result.content
-
-	# store in BeautifulSoup object to parse HTML DOM
-	soup = BeautifulSoup(c, "lxml")
-
-	lis = [li.text.strip() for li in soup.find_all('li')]
-	lis_clean = []
-	for li in lis:
-		if li == 'Lists of vegetables': break
-		if len(li) == 1: continue
-		if re.search('\d', li): continue
-		if re.search('\n', li): continue
-		lis_clean.append(li.lower())
-	vegetable_list = lis_clean
-
-
-	# build herbs and spices list
-	url = 'https://en.wikipedia.org/wiki/List_of_culinary_herbs_and_spices'
-	result = requests.get(url, timeout=10)
-	c = result.content
-
-	# store in BeautifulSoup object to parse HTML DOM
-	soup = BeautifulSoup(c, "lxml")
-
-	lis = [li.text.strip() for li in soup.find_all('li')][3:]
-	lis_clean = []
-	for li in lis:
-		if len(li) == 1: continue
-		if re.search('\d', li): continue
-		if re.search('\n', li): continue
-		if li == 'Category': break
-		lis_clean.append(li.lower())
-	herbs_spice_list = lis_clean
-
-
-	# build sauces list
-	url = 'https://en.wikipedia.org/wiki/List_of_sauces'
-	result = requests.get(url, timeout=10)
-	c = result.content
-
-	# store in BeautifulSoup object to parse HTML DOM
-	soup = BeautifulSoup(c, "lxml")
-
-	lis = [li.text.strip() for li in soup.find_all('li')]
-	lis_clean = []
-	for li in lis:
-		if len(li) == 1: continue
-		if re.search('\d', li): continue
-		if re.search('\n', li): continue
-		if li == 'Category': break
-		lis_clean.append(li.lower())
-	sauce_list = lis_clean
-
-
-	# build meat list
-	url = 'http://naturalhealthtechniques.com/list-of-meats-and-poultry/'
-	result = requests.get(url, timeout=10)
-	c = result.content
-
-	# store in BeautifulSoup object to parse HTML DOM
-	soup = BeautifulSoup(c, "lxml")
-
-	div = soup.find('div', {'class': 'entry-content'})
-	lis = [li.text.strip() for li in div.find_all('li')]
-	lis_clean = []
-	for li in lis:
-		if len(li) == 1: continue
-		if re.search('\d', li): continue
-		if re.search('\n', li): continue
-		lis_clean.append(li.lower())
-	meat_list = lis_clean
-
-	# build seafood_list and also extend to the meat_list
-	url = 'http://naturalhealthtechniques.com/list-of-fish-and-seafood/'
-	result = requests.get(url, timeout=10)
-	c = result.content
-
-	# store in BeautifulSoup object to parse HTML DOM
-	soup = BeautifulSoup(c, "lxml")
-
-	div = soup.find('div', {'class': 'entry-content'})
-	lis = [li.text.strip() for li in div.find_all('li')]
-	lis_clean = []
-	for li in lis:
-		if len(li) == 1: continue
-		if re.search('\d', li): continue
-		if re.search('\n', li): continue
-		lis_clean.append(li.lower())
-	meat_list.extend(lis_clean)
-	seafood_list = lis_clean
-
-	# build dairy list
-	url = 'http://naturalhealthtechniques.com/list-of-cheese-dairy-products/'
-	result = requests.get(url, timeout=10)
-	c = result.content
-
-	# store in BeautifulSoup object to parse HTML DOM
-	soup = BeautifulSoup(c, "lxml")
-
-	div = soup.find('div', {'class': 'entry-content'})
-	lis = [li.text.strip() for li in div.find_all('li')]
-	lis_clean = []
-	for li in lis:
-		if len(li) == 1: continue
-		if re.search('\d', li): continue
-		if re.search('\n', li): continue
-		lis_clean.append(li.lower())
-	dairy_list = lis_clean
-
-
-	# build grains list 
-	url = 'http://naturalhealthtechniques.com/list-of-grains-cereals-pastas-flours/'
-	result = requests.get(url, timeout=10)
-	c = result.content
-
-	# store in BeautifulSoup object to parse HTML DOM
-	soup = BeautifulSoup(c, "lxml")
-
-	div = soup.find('div', {'class': 'entry-content'})
-	lis = [li.text.strip() for li in div.find_all('li')]
-	lis_clean = []
-	for li in lis:
-		if len(li) == 1: continue
-		if re.search('\d', li): continue
-		if re.search('\n', li): continue
-		lis_clean.append(li.lower())
-	grain_list = lis_clean
-
-
-	# build grains list 
-	url = 'http://naturalhealthtechniques.com/list-of-fruits/'
-	result = requests.get(url, timeout=10)
-	c = result.content
-
-	# store in BeautifulSoup object to parse HTML DOM
-	soup = BeautifulSoup(c, "lxml")
-
-	div = soup.find('div', {'class': 'entry-content'})
-	lis = [li.text.strip() for li in div.find_all('li')]
-	lis_clean = []
-	for li in lis:
-		if len(li) == 1: continue
-		if re.search('\d', li): continue
-		if re.search('\n', li): continue
-		lis_clean.append(li.lower())
-	fruit_list = lis_clean
+# profiles already read from disk in this process
+style_profiles = {}
+
+
+def style_profile_path(style):
+	return os.path.join(STYLE_PROFILE_DIR, re.sub('[^a-z0-9]+', '_', style.lower()) + '.json')
+
+
+def find_style_recipes(style):
+	"""
+	search all recipes for recipes pertaining to the 'style' parameter and return their urls
+	"""
+	url = 'https://www.allrecipes.com/search/results/?wt={}&sort=re'.format(style)
+
+	# retrieve data from url and store in BeautifulSoup object to parse HTML DOM
+	from bs4 import BeautifulSoup
+	soup = BeautifulSoup(fetch.fetch(url), "lxml")
+
+	# find all urls that point to recipe pages 
+	style_recipes = [urlparse(a['href']) for a in soup.find_all('a', href=True)]		# find all urls in HTML DOM
+	style_recipes = [r.geturl() for r in style_recipes if r.path[1:8] == 'recipe/']		# filter out noise urls 
+	return sorted(set(style_recipes))													# don't double count urls 
+
+
+def build_style_profile(style):
+	"""
+	builds the profile Recipe.to_style uses for the 'style' of cuisine and stores it in STYLE_PROFILE_DIR.
+	This is the slow, offline step: it fetches and parses every recipe the search for 'style' returns and
+	counts how often each ingredient is used. The profile is set up as
+
+	{
+		style: string
+		recipes: int (number of recipes the profile was built from)
+		lexicon: string (version of the lexicon the ingredient types come from)
+		built: float (unix time)
+		ingredients: list of ingredients ranked by count, each with its Ingredient fields, 'count' and 'first'
+					 (index of the ingredient's first appearance in the style's recipes)
+		types: dict of type code --> list of [name, count] ranked by count
+	}
+	"""
+	urls = find_style_recipes(style)
+
+	# only the ingredients of the style's recipes are used -- skip parsing their instructions
+	profile = style_profile(style, parse_recipe_ingredients(urls))
+
+	if not os.path.isdir(STYLE_PROFILE_DIR):
+		os.makedirs(STYLE_PROFILE_DIR)
+	with open(style_profile_path(style), 'w') as f:
+		json.dump(profile, f, indent=1)
+
+	style_profiles[style.lower()] = profile
+	return profile
+
+
+def style_profile(style, style_recipes):
+	"""
+	builds the profile (see build_style_profile) of the 'style' of cuisine from the Ingredient lists of the
+	style's recipes, without storing it
+	"""
+	# unpack all ingredients in total set of new recipes of type 'style'
+	entries = OrderedDict()
+	for ingredients in style_recipes:
+		for ingredient in ingredients:
+			if not ingredient.name in entries:
+				entry = ingredient.to_dict()
+				entry['count'] = 0
+				entry['first'] = len(entries)
+				entries[ingredient.name] = entry
+			entries[ingredient.name]['count'] += 1
+
+	# rank by frequency, ties keep the order the ingredients were first seen in
+	ranked = sorted(entries.values(), key=itemgetter('count'), reverse=True)
+	types = defaultdict(list)
+	for entry in ranked:
+		types[entry['type']].append([entry['name'], entry['count']])
+
+	profile = {
+		'style': style,
+		'recipes': len(style_recipes),
+		'lexicon': current_lexicon.version if current_lexicon else None,
+		'built': time.time(),
+		'ingredients': ranked,
+		'types': dict(types)
+	}
+	return profile
+
+
+def get_style_profile(style, rebuild=False):
+	"""
+	returns the stored profile for the 'style' of cuisine, building it first if there is none yet or if
+	rebuild is True
+	"""
+	if rebuild:
+		return build_style_profile(style)
+
+	if not style.lower() in style_profiles:
+		try:
+			with open(style_profile_path(style)) as f:
+				style_profiles[style.lower()] = json.load(f)
+		except IOError:
+			return build_style_profile(style)
+	return style_profiles[style.lower()]
 
 
 def timeit(method):
     def timed(*args, **kw):
         ts = time.time()
-        result = method(*args, **kw)
+        with tracing.span(method.__name__):
+            result = method(*args, **kw)
         te = time.time()
         if 'log_time' in kw:
             name = kw.get('log_name', method.__name__.upper())
-            kw['log_time'][name] = int((te - ts))
+            kw['log_time'][name] = te - ts        # seconds as a float -- int() rounded anything under a second to 0
         else:
             print '%r  %2.2f s' % \
                   (method.__name__, (te - ts))
@@ -1386,9 +2196,11 @@ def main():
 	# recipe.to_healthy()
 	# recipe.from_healthy()
 	# recipe.to_style('Thai')
-	recipe.to_style('Mexican')
 	# recipe.to_method('bake')
 	# recipe.to_easy();
+
+	# apply the transformations as one pipeline, i.e. ['to_vegan', 'to_healthy', ('to_method', 'bake')]
+	recipe.transform([('to_style', 'Mexican')])
 	print(recipe.to_JSON())
 	print(recipe.compare_to_original())
 	# recipe.to_method('fry')
@@ -1397,98 +2209,69 @@ def main():
 
 
 #============================================================================
-# Start webPy environment
+# Warm up -- the state long running processes share (the web app is in gui.py)
 #============================================================================
 
 
-def main_gui(url, method, parameter):
-
-	# parse websites to build global lists -- used for Ingredient type tagging
-	build_dynamic_lists()
-
-
-	URL = url
-	recipe_attrs = parse_url(URL)
-
-	recipe = Recipe(**recipe_attrs)
-	s = ""
-	s += recipe.to_JSON()
-
-	if method == 'to_vegan':
-		recipe.to_vegan()
- 	elif method == 'from_vegan':
- 		recipe.from_vegan()
- 	elif method == 'to_vegetarian':
- 		recipe.to_vegetarian()
- 	elif method == 'from_vegetarian':
- 		recipe.from_vegetarian()
- 	elif method == 'to_pescatarian':
- 		recipe.to_pescatarian()
- 	elif method == 'from_pescatarian':
- 		recipe.from_pescatarian()
- 	elif method == 'to_healthy':
- 		recipe.to_healthy()
- 	elif method == 'from_healthy':
- 		recipe.from_healthy()
- 	elif method == 'to_style(Thai)':
- 		recipe.to_style('Thai')
- 	elif method == 'to_style(parameter)':
- 		if not parameter:
-			return "This method requires a parameter"
- 		recipe.to_style(parameter)
-	elif method == 'to_method(parameter)':
-		if not parameter:
-			return "This method requires a parameter"
-		recipe.to_method(parameter)
-
-
-	
-	s += recipe.to_JSON() 
-	s += recipe.compare_to_original()
-
-	return s
-
-render = web.template.render('templates/')
-
-urls = ('/', 'index')
-class RecipeApp(web.application):
-    def run(self, port=8080, *middleware):
-        func = self.wsgifunc(*middleware)
-        return web.httpserver.runsimple(func, ('0.0.0.0', port))
+# set once warm_up has loaded the state every request shares
+ready = threading.Event()
+warm_up_lock = threading.Lock()
+warm_up_seconds = None
 
-myform = form.Form( 
-    form.Textbox("url", 
-        form.notnull), 
-    form.Dropdown('transformation', ['to_vegan', 'from_vegan', 'to_vegetarian', 'from_vegetarian', 'to_pescatarian', 'from_pescatarian', 'to_healthy', 'from_healthy', 'to_style(parameter)', 'to_method(parameter)']),
-	form.Textbox("parameter (optional)"))
 
+def warm_up(path=lexicon.DEFAULT_SNAPSHOT, reload=False):
+	"""
+	loads everything the requests of the web app share, once, before they are served -- the lexicon (used for
+	Ingredient type tagging), the tagger and tokenizer models and the stored style profiles. Calls made while
+	another thread warms up wait for it, and calls after it are free, unless reload is set -- then the lexicon
+	and style profiles are loaded again, i.e. when the pre-forking server restarts after they were rebuilt.
+	"""
+	global warm_up_seconds
+	with warm_up_lock:
+		if ready.is_set() and not reload: return
+		start = time.time()
 
+		if reload: style_profiles.clear()
+		build_dynamic_lists(path)
+		pos_tag_sents([word_tokenize('Preheat the oven to 350 degrees F. Stir in 1 cup of chopped onion.')])
+		if os.path.isdir(STYLE_PROFILE_DIR):
+			for filename in os.listdir(STYLE_PROFILE_DIR):
+				if filename.endswith('.json'):
+					get_style_profile(filename[:-len('.json')])
 
-class index: 
-    def GET(self): 
-        form = myform()
-        # make sure you create a copy of the form by calling it (line above)
-        # Otherwise changes will appear globally
-        return render.formtest(form)
-
-    def POST(self): 
-        form = myform() 
-        if not form.validates(): 
-            return render.formtest(form)
-        else:
-            return main_gui(form.d.url, form['transformation'].value, form['parameter (optional)'].value)
-
+		warm_up_seconds = time.time() - start
+		ready.set()
 
 
 if __name__ == "__main__":
 	parser = argparse.ArgumentParser()
 	parser.add_argument("--gui", help="run application on locally hosted webpage", action="store_true")
+	parser.add_argument("--workers", type=int, metavar="N", help="with --gui, serve from N pre-forked worker processes (0 for one per CPU core) instead of one process")
+	parser.add_argument("--build-style-profile", metavar="STYLE", action="append", help="(re)build and store the to_style profile for a style of cuisine, e.g. Mexican")
+	parser.add_argument("--cache-dir", default=fetch.DEFAULT_CACHE_DIR, help="directory of the fetched page cache")
+	parser.add_argument("--no-cache", help="always download pages instead of using the page cache", action="store_true")
+	parser.add_argument("--replay", help="serve pages only from the page cache, never from the network", action="store_true")
+	parser.add_argument("--trace", help="time every stage in nested spans -- the GUI serves them at /traces and /metrics", action="store_true")
+	parser.add_argument("--trace-file", metavar="PATH", help="write the traces of the run to PATH as JSON (implies --trace)")
 
 	args = parser.parse_args()
-	if args.gui:
-		sys.argv[1] = ''
-		web.internalerror = web.debugerror
-		app = RecipeApp(urls, globals())
-		app.run()
+	if args.workers is not None and not args.gui:
+		parser.error('--workers only applies to --gui')
+	if args.workers is not None and args.workers < 0:
+		parser.error('--workers must be 0 or more')
+	fetch.use_cache(args.cache_dir, replay=args.replay, enabled=not args.no_cache)
+	tracing.enable(args.trace or bool(args.trace_file))
+	if args.build_style_profile:
+		build_dynamic_lists()
+		for style in args.build_style_profile:
+			profile = build_style_profile(style)
+			print ('built {} profile from {} recipes --> {}'.format(style, profile['recipes'], style_profile_path(style)))
+	elif args.gui:
+		import gui
+		gui.serve(workers=args.workers)
 	else:
 		main()
+
+	if args.trace_file:
+		with open(args.trace_file, 'w') as f:
+			json.dump(tracing.recent_traces(), f, indent=1)
@@ -0,0 +1,69 @@
+"""
+Multi-pattern string matching used to link ingredients to the instructions that mention them
+
+AhoCorasick builds an automaton from a set of patterns (i.e. every ingredient name in a recipe) once, and then
+finds every occurrence of every pattern in a text with a single left to right scan -- instead of searching the
+text once per pattern.
+"""
+from collections import deque
+
+
+class AhoCorasick(object):
+	"""
+	Aho-Corasick automaton over a set of non-empty patterns. Matching is case sensitive, like str.find.
+
+		* goto --> one dict per state of character --> next state (state 0 is the root)
+		* fail --> per state, the state for the longest proper suffix that is also in the trie
+		* output --> per state, the patterns that end there (including those reached through fail links)
+	"""
+	def __init__(self, patterns):
+		self.patterns = []
+		self.goto = [{}]
+		self.fail = [0]
+		self.output = [[]]
+
+		for pattern in patterns:
+			if not pattern or pattern in self.patterns: continue
+			self.patterns.append(pattern)
+			state = 0
+			for char in pattern:
+				if char not in self.goto[state]:
+					self.goto.append({})
+					self.fail.append(0)
+					self.output.append([])
+					self.goto[state][char] = len(self.goto) - 1
+				state = self.goto[state][char]
+			self.output[state].append(pattern)
+
+		# breadth first so every state's fail link is known before its children need it
+		queue = deque(self.goto[0].values())
+		while queue:
+			state = queue.popleft()
+			for char, child in self.goto[state].items():
+				queue.append(child)
+				fallback = self.fail[state]
+				while fallback and char not in self.goto[fallback]:
+					fallback = self.fail[fallback]
+				self.fail[child] = self.goto[fallback].get(char, 0)
+				self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+
+	def finditer(self, text):
+		"""
+		yields (start, end, pattern) for every occurrence of every pattern in text, ordered by end offset
+		"""
+		goto, fail, output = self.goto, self.fail, self.output
+		state = 0
+		for i, char in enumerate(text):
+			while state and char not in goto[state]:
+				state = fail[state]
+			state = goto[state].get(char, 0)
+			for pattern in output[state]:
+				yield (i + 1 - len(pattern), i + 1, pattern)
+
+
+	def findall(self, text):
+		"""
+		returns every (start, end, pattern) match in text as a list
+		"""
+		return list(self.finditer(text))
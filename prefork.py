@@ -0,0 +1,263 @@
+"""
+Pre-forking WSGI server for the GUI
+
+RecipeApp.run serves every request from one process, so parsing and tagging -- which are CPU bound -- never use
+more than one core. PreforkServer warms up once in a parent process (the lexicon, the tagger model and the style
+profiles; the patterns are compiled when main is imported) and then forks workers that share the listening socket
+and, copy-on-write, everything the parent loaded, so every worker is ready to serve as soon as it is forked:
+
+	>> python main.py --gui --workers 4
+
+Each worker serves one request at a time; whichever idle worker accepts a connection first serves it. Signals to
+the parent:
+
+	* HUP --> graceful restart: the parent warms up again (i.e. after the lexicon snapshot or a style profile was
+	  rebuilt) and forks a new set of workers, and the old ones finish the request they are serving and exit. The
+	  listening socket stays open throughout, so no connection is refused.
+	* TERM, INT --> shut down: the workers finish the request they are serving and exit, then the parent does
+
+Workers that die are replaced. The workers share their traces through a temporary directory (see tracing.share),
+so /traces and /metrics report all of them whichever one answers. Needs os.fork, so it does not run on Windows.
+"""
+import errno
+import gc
+import multiprocessing
+import os
+import random
+import select
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+import traceback
+
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+
+import fetch
+import tracing
+
+
+class WorkerServer(WSGIServer):
+	"""
+	The WSGI server of one worker. It accepts connections on the listening socket it inherited from the parent
+	instead of binding its own, and stops between requests once stopping is set (by SIGTERM).
+	"""
+	def __init__(self, listener, server_name, app, handler=WSGIRequestHandler):
+		WSGIServer.__init__(self, listener.getsockname(), handler, bind_and_activate=False)
+		self.socket.close()
+		self.socket = listener
+		self.server_name = server_name
+		self.server_port = listener.getsockname()[1]
+		self.setup_environ()
+		self.set_app(app)
+		self.parent = os.getppid()
+		self.stopping = False
+
+
+	def serve(self):
+		"""
+		serves requests until the worker is told to stop or its parent is gone
+		"""
+		while not self.stopping and os.getppid() == self.parent:
+			try:
+				readable = select.select([self.socket], [], [], 1)[0]
+			except (select.error, OSError) as e:
+				if e.args[0] != errno.EINTR: raise
+				continue
+			# the listening socket is non-blocking, so a worker that loses the race for a connection to another
+			# one gets EAGAIN from accept, which _handle_request_noblock ignores
+			if readable and not self.stopping:
+				self._handle_request_noblock()
+			tracing.save(force=not readable)		# while idle, the other workers get the last spans right away
+		tracing.save(force=True)
+
+
+	def stop(self, signum, frame):
+		self.stopping = True
+
+
+class PreforkServer(object):
+	"""
+	Forks workers that serve app (a WSGI function) on address from a warm parent process.
+
+		* workers --> number of worker processes (by default, one per CPU core)
+		* warm_up --> called in the parent before the workers are forked, with reload=True on a graceful restart
+		* handler --> the WSGIRequestHandler class of the workers
+		* timeout --> seconds the workers get to finish their request when they are told to stop, before they
+		  are killed
+	"""
+	def __init__(self, app, address=('0.0.0.0', 8080), workers=None, warm_up=None, handler=WSGIRequestHandler, timeout=30):
+		self.app = app
+		self.address = address
+		self.workers = workers or multiprocessing.cpu_count()
+		self.warm_up = warm_up
+		self.handler = handler
+		self.timeout = timeout
+
+		self.listener = None
+		self.server_name = None
+		self.trace_dir = None		# where the workers share their spans
+		self.generation = 0			# bumped by every graceful restart
+		self.pids = {}				# pid of every live worker --> the generation it was forked in
+		self.signals = []			# signals received by the parent and not handled yet
+
+
+	def bind(self):
+		"""
+		opens the listening socket the workers share -- address is updated with the port if it was 0
+		"""
+		if self.listener is not None: return
+		self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self.listener.bind(self.address)
+		self.listener.listen(128)
+		self.listener.setblocking(False)
+		self.address = self.listener.getsockname()
+		self.server_name = socket.getfqdn(self.address[0])
+
+
+	def log(self, message):
+		sys.stderr.write('[prefork {}] {}\n'.format(os.getpid(), message))
+
+
+	def serve_forever(self):
+		"""
+		warms up, forks the workers and looks after them until the parent is sent TERM or INT
+		"""
+		self.bind()
+		if self.warm_up: self.warm_up(reload=False)
+		self.trace_dir = tempfile.mkdtemp(prefix='prefork-traces-')
+		for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+			signal.signal(signum, self.queue_signal)
+		self.log('serving on http://{}:{}/ with {} workers'.format(self.address[0], self.address[1], self.workers))
+
+		try:
+			while True:
+				self.reap()
+				while self.signals:
+					signum = self.signals.pop(0)
+					if signum == signal.SIGHUP:
+						self.restart()
+					elif signum in (signal.SIGTERM, signal.SIGINT):
+						return
+				self.spawn_missing()
+				# returns early when a signal arrives on python 2; on python 3 the next check is at most this late
+				time.sleep(0.5)
+		finally:
+			self.stop()
+
+
+	def queue_signal(self, signum, frame):
+		self.signals.append(signum)
+
+
+	def spawn_missing(self):
+		"""
+		forks workers until the current generation has its full number of them
+		"""
+		current = sum(1 for generation in self.pids.values() if generation == self.generation)
+		for n in range(self.workers - current):
+			self.spawn()
+
+
+	def spawn(self):
+		# collected once here instead of in every worker, where it would touch (and so copy) the shared pages
+		gc.collect()
+		pid = os.fork()
+		if pid:
+			self.pids[pid] = self.generation
+			return pid
+
+		code = 0
+		try:
+			self.run_worker()
+		except BaseException:
+			traceback.print_exc()
+			code = 1
+		finally:
+			os._exit(code)
+
+
+	def run_worker(self):
+		"""
+		the body of a forked worker
+		"""
+		server = WorkerServer(self.listener, self.server_name, self.app, self.handler)
+		# the parent handles these (INT and HUP reach the workers too when they come from the terminal)
+		for signum in (signal.SIGHUP, signal.SIGINT):
+			signal.signal(signum, signal.SIG_IGN)
+		signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+		signal.signal(signal.SIGTERM, server.stop)
+		signal.siginterrupt(signal.SIGTERM, False)		# let the request being served finish undisturbed
+
+		# otherwise every worker would draw the same random numbers as its siblings, and use the parent's
+		# keep-alive connections alongside it
+		random.seed()
+		fetch.fetcher.after_fork()
+		tracing.share(self.trace_dir)
+		server.serve()
+
+
+	def reap(self):
+		"""
+		forgets the workers that exited, and says so for those that were not told to
+		"""
+		while self.pids:
+			try:
+				pid, status = os.waitpid(-1, os.WNOHANG)
+			except OSError as e:
+				if e.errno == errno.EINTR: continue
+				if e.errno != errno.ECHILD: raise
+				pid = 0
+			if not pid: return
+			generation = self.pids.pop(pid, None)
+			if generation == self.generation and status:
+				self.log('worker {} exited with status {}, replacing it'.format(pid, status))
+
+
+	def restart(self):
+		"""
+		graceful restart -- warms up again, forks a new generation of workers and tells the old ones to stop
+		"""
+		if self.warm_up:
+			try:
+				self.warm_up(reload=True)
+			except Exception:
+				traceback.print_exc()
+				self.log('warming up again failed, keeping the current workers')
+				return
+		old = list(self.pids)
+		self.generation += 1
+		self.spawn_missing()
+		self.terminate(old)
+		self.log('restarted: {} new workers, {} old ones finishing their requests'.format(self.workers, len(old)))
+
+
+	def terminate(self, pids, sig=signal.SIGTERM):
+		for pid in pids:
+			try:
+				os.kill(pid, sig)
+			except OSError as e:
+				if e.errno != errno.ESRCH: raise
+
+
+	def stop(self):
+		"""
+		tells every worker to stop, waits up to timeout seconds for them to finish their requests and kills those
+		still running
+		"""
+		self.terminate(list(self.pids))
+		deadline = time.time() + self.timeout
+		while self.pids and time.time() < deadline:
+			self.reap()
+			time.sleep(0.05)
+		if self.pids:
+			self.log('killing {} workers that did not stop in {} s'.format(len(self.pids), self.timeout))
+			self.terminate(list(self.pids), signal.SIGKILL)
+			for pid in list(self.pids):
+				os.waitpid(pid, 0)
+			self.pids.clear()
+		self.listener.close()
+		shutil.rmtree(self.trace_dir, ignore_errors=True)
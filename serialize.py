@@ -0,0 +1,167 @@
+"""
+Streaming JSON serializer for recipes
+
+Recipe.to_JSON builds a dictionary of the whole recipe and returns it as one pretty printed string. RecipeWriter
+writes the same records straight to a file-like object instead, one recipe at a time, so a batch of any size can
+be written with only one recipe in memory:
+
+	with open('recipes.jsonl', 'w') as out:
+		write_jsonl(recipes, out)			# recipes can be any iterable, i.e. a generator
+
+Records are compact, one per line (JSON lines), unless pretty is set -- then every record is laid out like
+to_JSON. Only the fields of the to_JSON schema are read, in a fixed order, so internal fields like
+instruction_words are never touched.
+"""
+import json
+from json.encoder import encode_basestring_ascii
+
+
+# (key, attribute, item) of every serialized field, in output order. item names the RecipeWriter method that
+# writes each element of a list of Ingredients or Instructions; the other fields are plain JSON values
+RECIPE_FIELDS = (
+	('name', 'name', None),
+	('url', 'url', None),
+	('cooking tools', 'cooking_tools', None),
+	('cooking method', 'cooking_methods', None),
+	('ingredients', 'ingredients', 'ingredient'),
+	('steps', 'instructions', 'instruction')
+)
+INGREDIENT_FIELDS = tuple((field, field, None) for field in ('name', 'quantity', 'measurement', 'descriptor', 'preperation', 'type'))
+INSTRUCTION_FIELDS = tuple((field, field, None) for field in ('instruction', 'cooking_tools', 'cooking_methods', 'time', 'ingredients'))
+
+
+class RecipeWriter(object):
+	"""
+	Writes recipes (or their original_recipe snapshots) as JSON records to out.
+
+		* pretty --> lay records out with an indent of 4 like to_JSON, instead of one compact record per line
+		* records, written --> number of records and characters written so far
+	"""
+	def __init__(self, out, pretty=False):
+		self.out = out
+		self.pretty = pretty
+		self.item_separator, self.key_separator = (', ', ': ') if pretty else (',', ':')
+		self.encoder = json.JSONEncoder(separators=(self.item_separator, self.key_separator))
+		self.layouts = {}
+		self.records = 0
+		self.written = 0
+
+
+	def write(self, recipe, original=False):
+		"""
+		writes one recipe as a record followed by a newline
+		"""
+		text = self.encode(recipe, original) + '\n'
+		self.out.write(text)
+		self.records += 1
+		self.written += len(text)
+
+
+	def write_all(self, recipes, original=False):
+		"""
+		writes every recipe of the iterable, consuming it one recipe at a time
+		"""
+		for recipe in recipes:
+			self.write(recipe, original)
+		return self
+
+
+	def encode(self, recipe, original=False):
+		"""
+		returns the record of the recipe as a string, without the trailing newline
+		"""
+		if original: recipe = recipe.original_recipe
+		chunks = []
+		self.record(recipe, chunks, 0)
+		return ''.join(chunks)
+
+
+	def newline(self, chunks, level):
+		if self.pretty:
+			chunks.append(self.indent(level))
+
+
+	def indent(self, level):
+		return '\n' + '    ' * level if self.pretty else ''
+
+
+	def layout(self, fields, level):
+		"""
+		returns the text written before each of the fields of an object at the given level (the separator,
+		indent and encoded key) and the text that closes the object. These are the same for every record, so
+		they are built once.
+		"""
+		if (fields, level) not in self.layouts:
+			prefixes = []
+			for n, (key, attr, item) in enumerate(fields):
+				prefixes.append((self.item_separator if n else '{') + self.indent(level + 1) + json.dumps(key) + self.key_separator)
+			self.layouts[(fields, level)] = (prefixes, self.indent(level) + '}')
+		return self.layouts[(fields, level)]
+
+
+	def value(self, value, chunks, level):
+		# the common values are encoded directly -- JSONEncoder.encode sets up a new encoder on every call
+		if isinstance(value, basestring):
+			chunks.append(encode_basestring_ascii(value))
+		elif isinstance(value, (list, tuple)):
+			self.array(value, self.value, chunks, level)
+		elif isinstance(value, float) and value - value == 0:		# finite, formatted like the json module
+			chunks.append(repr(value))
+		elif isinstance(value, (int, long)) and not isinstance(value, bool):
+			chunks.append(str(value))
+		else:
+			chunks.append(self.encoder.encode(value))
+
+
+	def array(self, items, emit, chunks, level):
+		if not items:
+			chunks.append('[]')
+			return
+		chunks.append('[')
+		for n, item in enumerate(items):
+			if n: chunks.append(self.item_separator)
+			self.newline(chunks, level + 1)
+			emit(item, chunks, level + 1)
+		self.newline(chunks, level)
+		chunks.append(']')
+
+
+	def fields(self, obj, fields, chunks, level):
+		prefixes, close = self.layout(fields, level)
+		for prefix, (key, attr, item) in zip(prefixes, fields):
+			chunks.append(prefix)
+			value = getattr(obj, attr)
+			if item is None:
+				self.value(value, chunks, level + 1)
+			else:
+				if item == 'instruction':		# empty instructions are left out, like in to_JSON
+					value = [instruction for instruction in value if len(instruction.instruction)]
+				self.array(value, getattr(self, item), chunks, level + 1)
+		chunks.append(close)
+
+
+	def record(self, recipe, chunks, level):
+		self.fields(recipe, RECIPE_FIELDS, chunks, level)
+
+
+	def ingredient(self, ingredient, chunks, level):
+		self.fields(ingredient, INGREDIENT_FIELDS, chunks, level)
+
+
+	def instruction(self, instruction, chunks, level):
+		self.fields(instruction, INSTRUCTION_FIELDS, chunks, level)
+
+
+def write_jsonl(recipes, out, pretty=False, original=False):
+	"""
+	writes every recipe of the iterable to the file-like object out, one record per line (or laid out like
+	to_JSON if pretty), and returns the RecipeWriter used
+	"""
+	return RecipeWriter(out, pretty).write_all(recipes, original)
+
+
+def dumps(recipe, pretty=False, original=False):
+	"""
+	returns the record of one recipe as a string
+	"""
+	return RecipeWriter(None, pretty).encode(recipe, original)
@@ -0,0 +1,268 @@
+"""
+Checks for the performance work that must hold on every change, not only when someone runs benchmark.py:
+fetching concurrently and from the cache, the caches shared by threads and the startup of a process staying
+light. Run from the repository root with
+
+	>> python -m unittest discover
+
+The stub server here stands in for AllRecipes.com, both for these tests and for benchmark.py.
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+try:
+	from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+	from SocketServer import ThreadingMixIn
+except ImportError:
+	from http.server import BaseHTTPRequestHandler, HTTPServer
+	from socketserver import ThreadingMixIn
+
+import fetch
+import main
+
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# dependencies that are slow to import -- importing main (or ingest, serialize) must not import any of them
+HEAVY_MODULES = ('nltk', 'bs4', 'requests', 'web')
+
+# seconds `import main` may add to the startup of a process
+IMPORT_BUDGET = 0.1
+
+
+def startup_seconds(code, repeat=3):
+	"""
+	returns the fastest wall clock time of running code in a fresh interpreter, started in the package directory
+	"""
+	times = []
+	for _ in range(repeat):
+		start = time.time()
+		subprocess.check_call([sys.executable, '-c', code], cwd=PACKAGE_DIR)
+		times.append(time.time() - start)
+	return min(times)
+
+
+class LocalServer(object):
+	"""
+	mixin for the local test and benchmark servers -- used as a context manager, they serve on a background thread
+	"""
+	daemon_threads = True
+
+	def url(self, path='/'):
+		return 'http://127.0.0.1:{}{}'.format(self.server_address[1], path)
+
+
+	def __enter__(self):
+		thread = threading.Thread(target=self.serve_forever)
+		thread.daemon = True
+		thread.start()
+		return self
+
+
+	def __exit__(self, *exc):
+		self.shutdown()
+		self.server_close()
+
+
+class StubServer(LocalServer, ThreadingMixIn, HTTPServer):
+	"""
+	Local HTTP server standing in for AllRecipes.com. Every GET waits `latency` seconds (to mimic a remote
+	host) and then answers with `body` -- or, given an `etag`, with 304 Not Modified to a request that already
+	has it. Use as a context manager; `url(path)` gives the address of a page.
+
+	It counts the requests it answered, the most it was serving at once and the paths it was asked for.
+	"""
+	def __init__(self, body=b'<html></html>', latency=0.05, etag=None):
+		self.body = body
+		self.latency = latency
+		self.etag = etag
+		self.requests = 0
+		self.in_flight = self.most_in_flight = 0
+		self.paths = []
+		self.counter_lock = threading.Lock()
+		HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'		# keep-alive, so connection pooling has an effect
+	disable_nagle_algorithm = True
+
+	def do_GET(self):
+		server = self.server
+		with server.counter_lock:
+			server.requests += 1
+			server.in_flight += 1
+			server.most_in_flight = max(server.most_in_flight, server.in_flight)
+			server.paths.append(self.path)
+		try:
+			time.sleep(server.latency)
+			if server.etag and self.headers.get('If-None-Match') == server.etag:
+				self.send_response(304)
+				self.send_header('Content-Length', '0')
+				self.end_headers()
+				return
+			self.send_response(200)
+			self.send_header('Content-Type', 'text/html')
+			self.send_header('Content-Length', str(len(server.body)))
+			if server.etag: self.send_header('ETag', server.etag)
+			self.end_headers()
+			self.wfile.write(server.body)
+		finally:
+			with server.counter_lock:
+				server.in_flight -= 1
+
+
+	def log_message(self, *args):
+		pass
+
+
+class FetchTest(unittest.TestCase):
+	"""
+	get_many against a stub server with a fixed latency per page
+	"""
+	pages = 16
+	latency = 0.05
+
+	def setUp(self):
+		self.server = StubServer(latency=self.latency).__enter__()
+		self.urls = [self.server.url('/recipe/{}/'.format(i)) for i in range(self.pages)]
+		self.fetcher = fetch.Fetcher(max_workers=8, per_host=4)
+
+
+	def tearDown(self):
+		self.fetcher.close()
+		self.server.__exit__()
+
+
+	def test_concurrent(self):
+		# one page at a time would take pages * latency; per_host at a time takes a quarter of that
+		start = time.time()
+		self.fetcher.get_many(self.urls)
+		elapsed = time.time() - start
+		self.assertLess(elapsed, self.pages * self.latency * 0.6)
+		self.assertGreater(self.server.most_in_flight, 1)
+
+
+	def test_per_host_limit(self):
+		self.fetcher.get_many(self.urls)
+		self.assertEqual(self.server.requests, self.pages)
+		self.assertLessEqual(self.server.most_in_flight, self.fetcher.per_host)
+
+
+	def test_order(self):
+		self.assertEqual(len(self.fetcher.get_many(self.urls)), self.pages)
+		self.assertEqual(sorted(self.server.paths), sorted('/recipe/{}/'.format(i) for i in range(self.pages)))
+
+		# the stub answers every page alike, so a body naming its url shows each result is in the place of its url
+		self.fetcher.download = lambda url, headers=None: FakeResponse(url.encode('utf-8'))
+		self.assertEqual(self.fetcher.get_many(self.urls), [url.encode('utf-8') for url in self.urls])
+
+
+	def test_errors(self):
+		urls = self.urls[:3] + ['http://127.0.0.1:1/refused/']
+		results = self.fetcher.get_many(urls, return_errors=True)
+		self.assertEqual(results[:3], [self.server.body] * 3)
+		self.assertIsInstance(results[3], Exception)
+		self.assertRaises(Exception, self.fetcher.get_many, urls)
+
+
+class CacheTest(unittest.TestCase):
+	"""
+	ResponseCache in front of a stub server -- a page is downloaded once, then served from disk
+	"""
+	def setUp(self):
+		self.path = tempfile.mkdtemp(prefix='recipe-cache-')
+		self.server = StubServer(body=b'<html>recipe</html>', latency=0, etag='"v1"').__enter__()
+		self.url = self.server.url('/recipe/1/')
+
+
+	def tearDown(self):
+		self.server.__exit__()
+		shutil.rmtree(self.path, ignore_errors=True)
+
+
+	def fetcher(self, **cache_options):
+		return fetch.Fetcher(cache=fetch.ResponseCache(self.path, **cache_options))
+
+
+	def test_hit(self):
+		fetcher = self.fetcher()
+		self.assertEqual(fetcher.get(self.url), self.server.body)
+		# tracking parameters do not make it another page
+		self.assertEqual(fetcher.get(self.url + '?internalSource=hub&utm_source=x'), self.server.body)
+		self.assertEqual(self.server.requests, 1)
+		self.assertEqual(fetcher.cache.stats()['hits'], 1)
+		self.assertEqual(fetcher.cache.stats()['misses'], 1)
+
+
+	def test_revalidate(self):
+		self.fetcher().get(self.url)
+		fetcher = self.fetcher(ttl=0)
+		self.assertEqual(fetcher.get(self.url), self.server.body)
+		self.assertEqual(self.server.requests, 2)
+		self.assertEqual(fetcher.cache.stats()['revalidated'], 1)
+
+
+	def test_replay(self):
+		self.fetcher().get(self.url)
+		fetcher = self.fetcher(replay=True)
+		self.assertEqual(fetcher.get(self.url), self.server.body)
+		self.assertRaises(fetch.CacheMiss, fetcher.get, self.server.url('/recipe/2/'))
+		self.assertEqual(self.server.requests, 1)
+
+
+class IngredientCacheTest(unittest.TestCase):
+	"""
+	the ingredient and transform caches are shared by the web server's threads
+	"""
+	def test_threads(self):
+		cache = main.IngredientCache(maxsize=50)
+		cache.copy = lambda value: value
+		calls = 2000
+
+		def work(n):
+			for i in range(calls):
+				key = (n * i) % 80
+				if cache.get(key) is None:
+					cache.put(key, key)
+
+		threads = [threading.Thread(target=work, args=(n,)) for n in range(1, 9)]
+		for thread in threads: thread.start()
+		for thread in threads: thread.join()
+
+		stats = cache.stats()
+		self.assertEqual(stats['hits'] + stats['misses'], calls * len(threads))
+		self.assertEqual(stats['size'], 50)
+
+
+class StartupTest(unittest.TestCase):
+	"""
+	batch jobs start many short lived processes, so importing our modules must stay cheap
+	"""
+	def test_no_heavy_modules(self):
+		probe = 'import sys, main, ingest, serialize; print(",".join(m for m in {!r} if m in sys.modules))'.format(HEAVY_MODULES)
+		imported = subprocess.check_output([sys.executable, '-c', probe], cwd=PACKAGE_DIR).decode().strip()
+		self.assertEqual(imported, '', 'importing main, ingest and serialize imports {}'.format(imported))
+
+
+	def test_import_budget(self):
+		added = startup_seconds('import main', 5) - startup_seconds('pass', 5)
+		self.assertLessEqual(added, IMPORT_BUDGET, 'import main takes {:.0f} ms, over the {:.0f} ms budget'.format(added * 1000, IMPORT_BUDGET * 1000))
+
+
+class FakeResponse(object):
+	status_code = 200
+	headers = {}
+
+	def __init__(self, content):
+		self.content = content
+
+
+if __name__ == '__main__':
+	unittest.main()
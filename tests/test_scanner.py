@@ -0,0 +1,196 @@
+"""
+Checks that the single pass Ingredient.scan extracts the same name, measurement, descriptors and preperations
+as the four find_ methods it replaced. The find_ methods are kept here as the reference, together with a golden
+corpus of ingredient lines and their part of speech tags, so the check runs without the NLTK data. Run from the
+repository root with
+
+	>> python -m unittest discover
+"""
+import re
+import unittest
+
+import main
+from main import measure_regex, descriptor_regex, preperation_regex, names_regex
+
+
+# ingredient lines as they appear on AllRecipes.com and the tags the NLTK tagger gives their words, written
+# word/TAG -- the harder lines (packages, cans, multi word names, 'to taste') are at the end
+GOLDEN_INGREDIENTS = [
+	('1 teaspoon salt', '1/CD teaspoon/NN salt/NN'),
+	('1/2 teaspoon ground black pepper', '1/2/CD teaspoon/NN ground/NN black/JJ pepper/NN'),
+	('2 tablespoons olive oil', '2/CD tablespoons/NNS olive/JJ oil/NN'),
+	('1 onion, chopped', '1/CD onion/NN ,/, chopped/VBD'),
+	('3 cloves garlic, minced', '3/CD cloves/NNS garlic/NN ,/, minced/VBD'),
+	('1 pound skinless, boneless chicken breast halves - cut into cubes',
+	 '1/CD pound/NN skinless/NN ,/, boneless/JJ chicken/NN breast/NN halves/NNS -/: cut/VBN into/IN cubes/NNS'),
+	('1 (14.5 ounce) can diced tomatoes', '1/CD (/( 14.5/CD ounce/NN )/) can/MD diced/VB tomatoes/NNS'),
+	('1 cup chicken broth', '1/CD cup/NN chicken/NN broth/NN'),
+	('2 cups uncooked white rice', '2/CD cups/NNS uncooked/JJ white/JJ rice/NN'),
+	('1 tablespoon chili powder', '1/CD tablespoon/NN chili/NN powder/NN'),
+	('1 teaspoon ground cumin', '1/CD teaspoon/NN ground/NN cumin/NN'),
+	('1/4 cup chopped fresh cilantro', '1/4/CD cup/NN chopped/VBD fresh/JJ cilantro/NN'),
+	('1 lime, juiced', '1/CD lime/NN ,/, juiced/VBD'),
+	('1 (8 ounce) package shredded Mexican cheese blend',
+	 '1/CD (/( 8/CD ounce/NN )/) package/NN shredded/VBD Mexican/JJ cheese/NN blend/NN'),
+	('8 (6 inch) corn tortillas', '8/CD (/( 6/CD inch/NN )/) corn/NN tortillas/NNS'),
+	('1 green bell pepper, diced', '1/CD green/JJ bell/NN pepper/NN ,/, diced/VBD'),
+	('1 cup sour cream', '1/CD cup/NN sour/JJ cream/NN'),
+	('2 tablespoons butter', '2/CD tablespoons/NNS butter/NN'),
+	('1 cup heavy cream', '1/CD cup/NN heavy/JJ cream/NN'),
+	('1/2 cup grated Parmesan cheese', '1/2/CD cup/NN grated/VBD Parmesan/NNP cheese/NN'),
+	('1 pound spaghetti', '1/CD pound/NN spaghetti/NN'),
+	('1 (16 ounce) package sliced fresh mushrooms',
+	 '1/CD (/( 16/CD ounce/NN )/) package/NN sliced/VBD fresh/JJ mushrooms/NNS'),
+	('2 tablespoons soy sauce', '2/CD tablespoons/NNS soy/JJ sauce/NN'),
+	('1 tablespoon fish sauce', '1/CD tablespoon/NN fish/JJ sauce/NN'),
+	('1 tablespoon brown sugar', '1/CD tablespoon/NN brown/JJ sugar/NN'),
+	('1 (14 ounce) can coconut milk', '1/CD (/( 14/CD ounce/NN )/) can/MD coconut/VB milk/NN'),
+	('2 tablespoons red curry paste', '2/CD tablespoons/NNS red/JJ curry/NN paste/NN'),
+	('1 pound large shrimp, peeled and deveined',
+	 '1/CD pound/NN large/JJ shrimp/NN ,/, peeled/VBD and/CC deveined/VBD'),
+	('1 cup fresh basil leaves', '1/CD cup/NN fresh/JJ basil/NN leaves/NNS'),
+	('1 tablespoon minced fresh ginger root', '1/CD tablespoon/NN minced/VBD fresh/JJ ginger/NN root/NN'),
+	('3 eggs, beaten', '3/CD eggs/NNS ,/, beaten/VBN'),
+	('1 1/2 cups all-purpose flour', '1/CD 1/2/CD cups/NNS all-purpose/JJ flour/NN'),
+	('1 cup milk', '1/CD cup/NN milk/NN'),
+	('1 pound ground beef', '1/CD pound/NN ground/NN beef/NN'),
+	('1 (15 ounce) can black beans, rinsed and drained',
+	 '1/CD (/( 15/CD ounce/NN )/) can/MD black/VB beans/NNS ,/, rinsed/VBN and/CC drained/VBN'),
+	('1 cup salsa', '1/CD cup/NN salsa/NN'),
+	('2 carrots, peeled and sliced', '2/CD carrots/NNS ,/, peeled/VBD and/CC sliced/VBD'),
+	('1 head broccoli, cut into florets', '1/CD head/NN broccoli/NN ,/, cut/VBD into/IN florets/NNS'),
+	('1/4 teaspoon cayenne pepper', '1/4/CD teaspoon/NN cayenne/NN pepper/NN'),
+	('salt and pepper to taste', 'salt/NN and/CC pepper/NN to/TO taste/VB'),
+	('2 (10.75 ounce) cans condensed cream of mushroom soup',
+	 '2/CD (/( 10.75/CD ounce/NN )/) cans/NNS condensed/VBD cream/NN of/IN mushroom/NN soup/NN'),
+	('1 (1 ounce) package taco seasoning mix', '1/CD (/( 1/CD ounce/NN )/) package/NN taco/NN seasoning/NN mix/NN'),
+	('4 skinless, boneless chicken breast halves', '4/CD skinless/NN ,/, boneless/JJ chicken/NN breast/NN halves/NNS'),
+	('1 cup shredded Cheddar cheese, divided', '1/CD cup/NN shredded/VBD Cheddar/NNP cheese/NN ,/, divided/VBD'),
+	('2 eggs, at room temperature', '2/CD eggs/NNS ,/, at/IN room/NN temperature/NN'),
+	('1 teaspoon poppy seeds', '1/CD teaspoon/NN poppy/JJ seeds/NNS'),
+	('1/2 cup finely chopped green bell pepper', '1/2/CD cup/NN finely/RB chopped/VBD green/JJ bell/NN pepper/NN'),
+	('3 tablespoons extra-virgin olive oil', '3/CD tablespoons/NNS extra-virgin/JJ olive/JJ oil/NN'),
+	('1 pinch ground nutmeg', '1/CD pinch/NN ground/NN nutmeg/NN'),
+	('2 cups mini marshmallows', '2/CD cups/NNS mini/JJ marshmallows/NNS'),
+	('1 pound bone-in pork chops, cut into pieces',
+	 '1/CD pound/NN bone-in/JJ pork/NN chops/NNS ,/, cut/VBN into/IN pieces/NNS'),
+	('ground black pepper to taste', 'ground/NN black/JJ pepper/NN to/TO taste/VB'),
+	('1 head garlic, cloves separated and peeled',
+	 '1/CD head/NN garlic/NN ,/, cloves/NNS separated/VBD and/CC peeled/VBD'),
+	('12 ounces leftover turkey, shredded', '12/CD ounces/NNS leftover/JJ turkey/NN ,/, shredded/VBD'),
+	('1 quart vegetable broth', '1/CD quart/NN vegetable/JJ broth/NN')
+]
+
+
+def tagged(tags):
+	"""
+	turns word/TAG pairs back into the (word, tag) tuples the tagger returns
+	"""
+	return [tuple(pair.rsplit('/', 1)) for pair in tags.split(' ')]
+
+
+def find_name(description_tagged):
+	"""
+	looks for name of the ingredient from the desciption. Finds the nouns that are not measurements
+	"""
+	name = [d[0] for d in description_tagged if ((d[1] == 'NN' or d[1] == 'NNS' or d[1] == 'NNP')
+												and not re.search(measure_regex, d[0], flags=re.I)
+												and not re.search(descriptor_regex, d[0], flags=re.I)
+												and not re.search(preperation_regex, d[0], flags=re.I))
+										or re.search(names_regex, d[0], re.I)]
+	if len(name) == 0:
+		return description_tagged[-1][0]
+	return ' '.join(name)
+
+
+def find_measurement(description_tagged, description):
+	"""
+	looks for measurements such as cups, teaspoons, etc.
+	Uses measure_regex which is a compilation of possible measurements.
+	"""
+	measurement = [d[0] for d in description_tagged if re.search(measure_regex, d[0], flags=re.I)]
+	return main.Ingredient.__new__(main.Ingredient).measurement_from_words(measurement, description)
+
+
+def find_descriptor(description_tagged):
+	"""
+	looks for descriptions such as fresh, extra-virgin by finding describing words such as
+	adjectives
+	"""
+	descriptors = [d[0] for d in description_tagged if (
+														(d[1] == 'JJ' or d[1] == 'RB')
+														and not re.search(measure_regex, d[0], flags=re.I)
+														and not re.search(names_regex, d[0], flags=re.I)
+													)
+													or re.search(descriptor_regex, d[0], flags=re.I)]
+	return descriptors
+
+
+def find_preperation(description_tagged):
+	"""
+	find all preperations (finely, chopped) by finding action words such as verbs
+	"""
+	preperations = [d[0] for d in description_tagged if (
+														d[1] == 'VB' or d[1] == 'VBD'
+														or re.search(preperation_regex, d[0], flags=re.I)
+														)
+														and not re.search(names_regex, d[0], flags=re.I)]
+	for i, p in enumerate(preperations):
+		if p == 'taste':
+			preperations[i] = 'to taste'
+	return preperations
+
+
+def find_fields(description_tagged, description):
+	"""
+	the name, measurement, descriptors and preperations as the find_ methods extracted them
+	"""
+	return (find_name(description_tagged), find_measurement(description_tagged, description),
+			find_descriptor(description_tagged), find_preperation(description_tagged))
+
+
+def scan_fields(description_tagged, description):
+	"""
+	the name, measurement, descriptors and preperations as Ingredient.scan extracts them
+	"""
+	ingredient = main.Ingredient.__new__(main.Ingredient)
+	ingredient.scan(description_tagged, description)
+	return (ingredient.name, ingredient.measurement, ingredient.descriptor, ingredient.preperation)
+
+
+def tagger_available():
+	try:
+		main.pos_tag_sents([['1', 'teaspoon', 'salt']])
+		return True
+	except LookupError:
+		return False
+
+
+class ScannerTest(unittest.TestCase):
+	"""
+	Ingredient.scan against the find_ methods on the golden corpus
+	"""
+	def assertSameFields(self, lines, tags):
+		for line, description_tagged in zip(lines, tags):
+			self.assertEqual(scan_fields(description_tagged, line), find_fields(description_tagged, line), line)
+
+
+	def test_golden(self):
+		self.assertSameFields([line for line, _ in GOLDEN_INGREDIENTS], [tagged(tags) for _, tags in GOLDEN_INGREDIENTS])
+
+
+	def test_every_tag(self):
+		# the scanner must also agree where the tagger picks another part of speech for a word
+		for tag in ('NN', 'NNS', 'NNP', 'JJ', 'RB', 'VB', 'VBD', 'VBN', 'CD', 'IN'):
+			lines = [line for line, _ in GOLDEN_INGREDIENTS]
+			self.assertSameFields(lines, [[(word, tag) for word, _ in tagged(tags)] for _, tags in GOLDEN_INGREDIENTS])
+
+
+	@unittest.skipUnless(tagger_available(), 'the NLTK tagger data is not installed')
+	def test_tagger(self):
+		lines = [line for line, _ in GOLDEN_INGREDIENTS]
+		self.assertSameFields(lines, main.pos_tag_sents([main.word_tokenize(line) for line in lines]))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,329 @@
+"""
+Nested timing spans for the parse and transform pipeline
+
+Stages of the pipeline (fetching, building the DOM, tagging, classifying ingredient types, every transformation,
+serializing, ...) are wrapped in spans. A span started while another one is open on the same thread becomes its
+child, so every top level span -- i.e. one web request or one parse_url call -- records a tree of where its
+time went:
+
+	with tracing.span('parse_url', url=url):
+		...
+
+	@tracing.traced('Recipe')
+	def __init__(self, ...):
+
+Tracing is off until enable() is called. While it is off, span() hands out a shared do-nothing span and traced
+functions are called straight through, so the instrumentation costs a function call and a flag check.
+
+Finished top level spans are kept (the most recent MAX_TRACES of them) for recent_traces(), which returns them
+as JSON ready dictionaries, and the calls, seconds and errors of every span name are totalled for prometheus(),
+which returns them in the Prometheus text format.
+
+The workers of a pre-forking server (see prefork.py) each record their own spans, so they share() a directory
+where every worker saves its totals and traces, and whichever worker answers reports those of all of them.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from operator import itemgetter
+
+
+MAX_TRACES = 100
+SAVE_INTERVAL = 1.0					# most seconds a shared process's saved spans lag behind while it is busy
+
+enabled = False
+local = threading.local()			# stack of the open spans of each thread
+lock = threading.Lock()				# guards totals
+totals = OrderedDict()				# span name --> [calls, seconds, errors]
+traces = deque(maxlen=MAX_TRACES)	# finished top level spans, oldest first
+
+shared_dir = None					# directory this process saves its spans in for the others, see share()
+shared_path = None
+saved_at = 0.0
+changed = False						# whether spans finished since the last save
+
+
+class Span(object):
+	"""
+	A timed stage of the pipeline. Use as a context manager; spans opened inside it become its children.
+
+		* name --> the stage, i.e. 'parse_url' -- the label of its Prometheus counters
+		* attrs --> details of this particular call, i.e. the url -- only in the JSON traces
+		* start, seconds --> wall clock start and duration
+		* error --> the type of exception that ended the span, if any
+	"""
+	def __init__(self, name, attrs):
+		self.name = name
+		self.attrs = attrs
+		self.start = None
+		self.seconds = None
+		self.error = None
+		self.children = []
+
+
+	def __enter__(self):
+		stack = open_spans()
+		if stack: stack[-1].children.append(self)
+		stack.append(self)
+		self.start = time.time()
+		return self
+
+
+	def __exit__(self, kind, value, traceback):
+		self.seconds = time.time() - self.start
+		if kind is not None: self.error = kind.__name__
+		stack = open_spans()
+		stack.pop()
+		count(self)
+		if not stack: traces.append(self)
+		return False
+
+
+	def set(self, **attrs):
+		"""
+		adds details to the span once they are known, i.e. whether a fetch was served from the cache
+		"""
+		self.attrs.update(attrs)
+
+
+	def to_dict(self, origin=None):
+		"""
+		the span and its children as a dictionary, with times in milliseconds -- start is relative to the start
+		of the top level span
+		"""
+		if origin is None: origin = self.start
+		record = OrderedDict([
+			('name', self.name),
+			('start_ms', round((self.start - origin) * 1000, 3)),
+			('duration_ms', round(self.seconds * 1000, 3) if self.seconds is not None else None)
+		])
+		if self.attrs: record['attrs'] = self.attrs
+		if self.error: record['error'] = self.error
+		if self.children: record['children'] = [child.to_dict(origin) for child in list(self.children)]
+		return record
+
+
+class NoSpan(object):
+	"""
+	the span handed out while tracing is off -- it records nothing
+	"""
+	def __enter__(self):
+		return self
+
+
+	def __exit__(self, kind, value, traceback):
+		return False
+
+
+	def set(self, **attrs):
+		pass
+
+
+NO_SPAN = NoSpan()
+
+
+class Adopted(object):
+	"""
+	makes parent the open span of the current thread while the block runs, so spans opened on a worker thread
+	become children of the span that started the work instead of separate traces
+	"""
+	def __init__(self, parent):
+		self.parent = parent
+
+
+	def __enter__(self):
+		open_spans().append(self.parent)
+		return self.parent
+
+
+	def __exit__(self, kind, value, traceback):
+		open_spans().pop()
+		return False
+
+
+def open_spans():
+	stack = getattr(local, 'stack', None)
+	if stack is None:
+		stack = local.stack = []
+	return stack
+
+
+def count(span):
+	global changed
+	with lock:
+		changed = True
+		entry = totals.get(span.name)
+		if entry is None:
+			entry = totals[span.name] = [0, 0.0, 0]
+		entry[0] += 1
+		entry[1] += span.seconds
+		if span.error: entry[2] += 1
+
+
+def span(name, **attrs):
+	"""
+	returns a span (see Span) for the stage name with the details attrs, or a span that records nothing if
+	tracing is off
+	"""
+	if not enabled: return NO_SPAN
+	return Span(name, attrs)
+
+
+def traced(name=None):
+	"""
+	decorator that runs every call of the function in a span named name (by default the function's name)
+	"""
+	def decorate(func):
+		label = name or func.__name__
+
+		@functools.wraps(func)
+		def wrapper(*args, **kwargs):
+			if not enabled: return func(*args, **kwargs)
+			with Span(label, {}):
+				return func(*args, **kwargs)
+		return wrapper
+	return decorate
+
+
+def current():
+	"""
+	returns the innermost open span of the current thread, or None
+	"""
+	if not enabled: return None
+	stack = open_spans()
+	return stack[-1] if stack else None
+
+
+def adopt(parent):
+	"""
+	context manager that makes spans opened on this thread children of parent (from current() on another thread)
+	"""
+	if parent is None: return NO_SPAN
+	return Adopted(parent)
+
+
+def enable(on=True):
+	"""
+	turns tracing on (or off)
+	"""
+	global enabled
+	enabled = on
+
+
+def reset():
+	"""
+	forgets the kept traces and the totals
+	"""
+	with lock:
+		totals.clear()
+		traces.clear()
+
+
+def share(directory):
+	"""
+	makes this process one of several that report their spans together: it forgets the spans recorded so far
+	(i.e. those of the process it was forked from), saves its own in directory from now on (see save) and
+	prometheus() and recent_traces() report those of every process that saves there -- including the ones that
+	exited since, so the counters never go back
+	"""
+	global shared_dir, shared_path, saved_at
+	reset()
+	shared_dir = directory
+	shared_path = os.path.join(directory, '{}-{}.json'.format(os.getpid(), int(time.time() * 1000)))
+	saved_at = 0.0
+
+
+def save(force=False):
+	"""
+	writes the totals and traces of this process to its file in the shared directory, if any spans finished
+	since it was last written -- at most every SAVE_INTERVAL seconds, unless force is set. The file is replaced
+	in one rename, so the other processes never read half of it.
+	"""
+	global changed, saved_at
+	if shared_dir is None or not changed: return
+	if not force and time.time() - saved_at < SAVE_INTERVAL: return
+
+	with lock:
+		changed = False
+		rows = [[name] + entry for name, entry in totals.items()]
+	state = {
+		'pid': os.getpid(),
+		'totals': rows,
+		'traces': [[trace.start, trace.to_dict()] for trace in list(traces)]
+	}
+	tmp_path = shared_path + '.tmp'
+	with open(tmp_path, 'w') as f:
+		json.dump(state, f)
+	os.rename(tmp_path, shared_path)
+	saved_at = time.time()
+
+
+def shared_states():
+	"""
+	returns what every process sharing the directory saved, this one's brought up to date first
+	"""
+	save(force=True)
+	states = []
+	for filename in sorted(os.listdir(shared_dir)):
+		if not filename.endswith('.json'): continue
+		try:
+			with open(os.path.join(shared_dir, filename)) as f:
+				states.append(json.load(f, object_pairs_hook=OrderedDict))
+		except (IOError, OSError, ValueError):
+			continue
+	return states
+
+
+def recent_traces():
+	"""
+	returns the kept traces, oldest first, as dictionaries (see Span.to_dict). Shared traces also name the
+	worker (pid) that recorded them.
+	"""
+	if shared_dir is None:
+		return [trace.to_dict() for trace in list(traces)]
+
+	merged = []
+	for state in shared_states():
+		for start, trace in state['traces']:
+			trace['worker'] = state['pid']
+			merged.append((start, trace))
+	merged.sort(key=itemgetter(0))
+	return [trace for start, trace in merged[-MAX_TRACES:]]
+
+
+def escape_label(value):
+	return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus(prefix='recipe_transformer'):
+	"""
+	returns the totals of every span name as Prometheus text format counters -- summed over the processes
+	sharing a directory, if this one does
+	"""
+	if shared_dir is None:
+		with lock:
+			rows = [(name, entry[0], entry[1], entry[2]) for name, entry in totals.items()]
+	else:
+		summed = OrderedDict()
+		for state in shared_states():
+			for name, calls, seconds, errors in state['totals']:
+				entry = summed.setdefault(name, [0, 0.0, 0])
+				entry[0] += calls
+				entry[1] += seconds
+				entry[2] += errors
+		rows = [(name, entry[0], entry[1], entry[2]) for name, entry in summed.items()]
+
+	lines = []
+	for metric, kind, help_text, column in [
+		('span_calls_total', 'counter', 'Number of times each traced stage ran.', 1),
+		('span_seconds_total', 'counter', 'Seconds spent in each traced stage, including its children.', 2),
+		('span_errors_total', 'counter', 'Number of times each traced stage raised an exception.', 3)
+	]:
+		lines.append('# HELP {}_{} {}'.format(prefix, metric, help_text))
+		lines.append('# TYPE {}_{} {}'.format(prefix, metric, kind))
+		for row in rows:
+			lines.append('{}_{}{{span="{}"}} {}'.format(prefix, metric, escape_label(row[0]), repr(row[column]) if column == 2 else row[column]))
+	return '\n'.join(lines) + '\n'